@@ -1,12 +1,26 @@
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from app.core.config import settings
 from app.models.user import Base, User
+from app.models import state  # noqa: F401  (registers the state tables on Base)
 from app.utils.hashing import hash_password, verify_password
 
 engine = create_engine(settings.DB_URL, connect_args={"check_same_thread": False})
 SessionLocal = sessionmaker(bind=engine, autoflush=False)
 
+
+# Several worker processes share this SQLite file → WAL (readers never block the
+# writer) and wait on a busy DB instead of failing with "database is locked"
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _):
+    if engine.dialect.name == "sqlite":
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+
 # Create tables if not exist
 Base.metadata.create_all(bind=engine)
 
@@ -14,7 +28,7 @@ def get_user(db, username: str):
     return db.query(User).filter(User.username == username).first()
 
 def create_user(db, username: str, password: str):
-    user = User(username=username, password=hash_password(password))
+    user = User(username=username, password_hash=hash_password(password))
     db.add(user)
     db.commit()
     db.refresh(user)
@@ -0,0 +1,193 @@
+# backend/app/core/auth_cache.py
+#
+# The ONE auth dependency for every protected route.
+#
+# A JWT is verified (signature + exp) once, then its claims sit in a bounded LRU
+# until the token's own `exp` — repeat requests skip the crypto. The username →
+# user lookup is cached too (bounded, short TTL), so deleted users still get
+# locked out without a DB round-trip per request.
+#
+# Revocations (logout, "sign out everywhere") are rows in SQLite, so every worker
+# sees them: each process pulls new rows every AUTH_REVOCATION_REFRESH_SECONDS.
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Header, HTTPException
+
+from app.core.auth import SessionLocal
+from app.core.config import settings
+from app.core.security import decode_claims
+from app.models.state import Revocation
+from app.models.user import User
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max(1, max_entries)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {"entries": len(self._data), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+token_cache = _LRU(settings.AUTH_TOKEN_CACHE_SIZE)   # token → (username, exp, iat, jti)
+user_cache = _LRU(settings.AUTH_USER_CACHE_SIZE)     # username → (exists, cached_at)
+
+# ───── Revocations ─────
+_revoked_jtis = {}          # jti → expires_at
+_revoked_before = {}        # username → tokens issued before this are invalid
+_last_revocation_id = 0
+_last_revocation_sync = 0.0
+_revocation_lock = threading.Lock()
+
+
+def _apply_revocation(row):
+    if row.jti:
+        _revoked_jtis[row.jti] = row.expires_at or float("inf")
+    if row.username and row.revoked_before:
+        _revoked_before[row.username] = max(_revoked_before.get(row.username, 0.0), row.revoked_before)
+
+
+def _sync_revocations(force=False):
+    """Pull revocations written by any worker since the last sync."""
+    global _last_revocation_id, _last_revocation_sync
+    now = time.monotonic()
+    if not force and now - _last_revocation_sync < settings.AUTH_REVOCATION_REFRESH_SECONDS:
+        return
+    with _revocation_lock:
+        _last_revocation_sync = now
+        with SessionLocal() as db:
+            rows = db.query(Revocation).filter(Revocation.id > _last_revocation_id).order_by(Revocation.id).all()
+        for row in rows:
+            _apply_revocation(row)
+            _last_revocation_id = row.id
+        wall = time.time()
+        for jti in [j for j, exp in _revoked_jtis.items() if exp < wall]:
+            del _revoked_jtis[jti]  # the token is expired anyway
+
+
+def _is_revoked(username, iat, jti):
+    if jti and jti in _revoked_jtis:
+        return True
+    # iat has whole-second resolution (security.py): a token from later in the revoking second stays valid
+    return iat < int(_revoked_before.get(username, 0.0))
+
+
+def _write_revocation(**fields):
+    with SessionLocal() as db:
+        row = Revocation(created_at=time.time(), **fields)
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+        with _revocation_lock:
+            _apply_revocation(row)
+
+
+def revoke_token(token: str):
+    """Logout: this token stops working in every worker within AUTH_REVOCATION_REFRESH_SECONDS."""
+    claims = decode_claims(token)
+    if not claims:
+        return
+    token_cache.pop(token)
+    if claims.get("jti"):
+        _write_revocation(jti=claims["jti"], expires_at=float(claims.get("exp", 0)))
+    else:
+        # Old tokens without a jti can only be revoked together with the user's other tokens
+        revoke_user(claims.get("sub"))
+
+
+def revoke_user(username: str):
+    """Sign out everywhere: every token issued to `username` until now is rejected."""
+    _write_revocation(username=username, revoked_before=time.time())
+    invalidate_user(username)
+
+
+def invalidate_user(username: str):
+    """Drop the cached lookup (call after deleting a user or changing their password)."""
+    user_cache.pop(username)
+
+
+# ───── Lookups ─────
+def _verify(token):
+    cached = token_cache.get(token)
+    if cached is not None:
+        username, exp, iat, jti = cached
+        if time.time() < exp:
+            return username, iat, jti
+        token_cache.pop(token)
+        return None
+
+    claims = decode_claims(token)  # full JOSE signature + exp check
+    if not claims or not claims.get("sub"):
+        return None
+    username, exp = claims["sub"], float(claims.get("exp", 0))
+    iat, jti = float(claims.get("iat", 0)), claims.get("jti")
+    token_cache.put(token, (username, exp, iat, jti))
+    return username, iat, jti
+
+
+def _user_exists(username):
+    cached = user_cache.get(username)
+    if cached is not None and time.monotonic() - cached[1] < settings.AUTH_USER_CACHE_TTL_SECONDS:
+        return cached[0]
+    with SessionLocal() as db:
+        exists = db.query(User.id).filter(User.username == username).first() is not None
+    user_cache.put(username, (exists, time.monotonic()))
+    return exists
+
+
+# ───── Dependency ─────
+def get_current_user(Authorization: str = Header(None)):
+    if not Authorization or not Authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Invalid or missing token")
+    token = Authorization.split("Bearer ")[-1].strip()
+
+    verified = _verify(token)
+    if not verified:
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    username, iat, jti = verified
+
+    _sync_revocations()
+    if _is_revoked(username, iat, jti) or not _user_exists(username):
+        raise HTTPException(status_code=401, detail="Invalid or expired token")
+    return username
+
+
+def stats():
+    return {
+        "tokens": token_cache.stats(),
+        "users": user_cache.stats(),
+        "revoked_tokens": len(_revoked_jtis),
+        "revoked_users": len(_revoked_before),
+    }
@@ -0,0 +1,171 @@
+# backend/app/core/chat_history.py
+# Per-user chat history in SQLite, shared by every worker process.
+#
+# - bounded: each user keeps at most HISTORY_MAX_PER_USER messages (oldest dropped)
+# - small rows: retrieved chunks are stored as (faq_id, score) references and
+#   re-hydrated from the served index on read, instead of copying the FAQ text
+# - write-behind: the request only enqueues; a writer thread commits in batches
+# - paginated: keyset reads (id < cursor) touch one page, however long the history
+import json
+import os
+import queue
+import threading
+import time
+
+from app.core.auth import SessionLocal
+from app.core.config import settings
+from app.core.log import get_logger
+from app.models.state import ChatMessage
+from app.rag import hybrid_retriever
+
+log = get_logger("history")
+
+
+class ChatHistoryStore:
+    def __init__(self, max_per_user=200, queue_max=10000, flush_ms=50.0, max_batch=256):
+        self.max_per_user = max(1, max_per_user)
+        self.queue_max = queue_max
+        self.flush_wait = max(0.0, flush_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self.written = 0
+        self.dropped = 0
+        self.trimmed = 0
+        self.errors = 0
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._queue = queue.Queue(maxsize=self.queue_max)
+                self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+                self._thread.start()
+
+    # ───── write path ─────
+    def append(self, username, query, answer, chunks):
+        """Never blocks the request: if the writer is far behind, the message is dropped (and counted)."""
+        self._ensure_started()
+        refs = [[c["id"], c.get("score")] for c in chunks if "id" in c]
+        try:
+            self._queue.put_nowait((username, query, answer, refs, time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        if self._thread is None or self._pid != os.getpid():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        if not done.wait(timeout):
+            log.warning("[HISTORY] Flush timed out")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.flush_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            markers = [item for item in batch if isinstance(item, threading.Event)]
+            rows = [item for item in batch if not isinstance(item, threading.Event)]
+            if rows:
+                try:
+                    self._write(rows)
+                except Exception as e:
+                    self.errors += 1
+                    log.error(f"[HISTORY] Dropped batch of {len(rows)}: {e}")
+            for done in markers:
+                done.set()
+
+    def _write(self, rows):
+        with SessionLocal() as db:
+            db.add_all(
+                ChatMessage(username=u, query=q, answer=a, chunk_refs=json.dumps(refs), timestamp=ts)
+                for u, q, a, refs, ts in rows
+            )
+            db.flush()
+            # Ring buffer: drop everything older than the newest max_per_user messages
+            for username in {row[0] for row in rows}:
+                cutoff = (
+                    db.query(ChatMessage.id)
+                    .filter(ChatMessage.username == username)
+                    .order_by(ChatMessage.id.desc())
+                    .offset(self.max_per_user)
+                    .limit(1)
+                    .scalar()
+                )
+                if cutoff is not None:
+                    self.trimmed += (
+                        db.query(ChatMessage)
+                        .filter(ChatMessage.username == username, ChatMessage.id <= cutoff)
+                        .delete(synchronize_session=False)
+                    )
+            db.commit()
+        self.written += len(rows)
+
+    # ───── read path ─────
+    def page(self, username, limit=20, before=None):
+        """Newest first. Pass the returned next_cursor as `before` to get the next (older) page."""
+        with SessionLocal() as db:
+            q = db.query(ChatMessage).filter(ChatMessage.username == username)
+            if before is not None:
+                q = q.filter(ChatMessage.id < before)
+            rows = q.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        gen = hybrid_retriever.generation
+        items = [
+            {
+                "id": r.id,
+                "query": r.query,
+                "answer": r.answer,
+                "chunks": [_hydrate(gen, faq_id, score) for faq_id, score in json.loads(r.chunk_refs or "[]")],
+                "timestamp": r.timestamp,
+            }
+            for r in rows
+        ]
+        return {"items": items, "next_cursor": rows[-1].id if more else None}
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "trimmed": self.trimmed,
+            "errors": self.errors,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "max_per_user": self.max_per_user,
+        }
+
+
+def _hydrate(gen, faq_id, score):
+    if gen is None or not gen.is_alive(faq_id):
+        return {"id": faq_id, "score": score, "deleted": gen is not None}
+    return {
+        "id": faq_id,
+        "question": gen.questions[faq_id],
+        "answer": gen.answers[faq_id],
+        "score": score,
+        "source": "faqs.json",
+    }
+
+
+chat_history = ChatHistoryStore(
+    max_per_user=settings.HISTORY_MAX_PER_USER,
+    queue_max=settings.HISTORY_QUEUE_MAX,
+    flush_ms=settings.HISTORY_FLUSH_MS,
+)
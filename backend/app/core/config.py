@@ -1,6 +1,5 @@
 # backend/app/core/config.py
 from pydantic_settings import BaseSettings
-import os
 
 class Settings(BaseSettings):
     APP_NAME: str = "Neurostack Copilot"
@@ -22,35 +21,128 @@ class Settings(BaseSettings):
     GROQ_MODEL: str = "llama-3.1-8b-instant"
     GROQ_API_URL: str = "https://api.groq.com/openai/v1"
 
+    # Semantic answer cache (near-duplicate questions replay a cached answer)
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_ENTRIES: int = 512
+    ANSWER_CACHE_TTL_SECONDS: int = 3600
+    ANSWER_CACHE_THRESHOLD: float = 0.95   # min cosine similarity for a hit
+
+    # Query embedding micro-batching across concurrent requests
+    EMBED_BATCH_ENABLED: bool = True
+    EMBED_BATCH_MAX_SIZE: int = 32
+    EMBED_BATCH_MAX_WAIT_MS: float = 5.0
+
+    # Async serving: blocking retrieval runs in this many threads, LLM calls are awaited
+    RETRIEVAL_WORKERS: int = 4
+    LLM_TIMEOUT_SECONDS: float = 120.0
+    # LLM providers (app/rag/llm_providers.py) in preference order; Groq is skipped without GROQ_API_KEY
+    LLM_PROVIDERS: str = "groq,ollama"
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_POOL_SIZE: int = 32               # keep-alive connections per provider and worker
+    LLM_KEEPALIVE_SECONDS: float = 60.0
+    # Time-to-first-token deadlines: past it, a hedged request goes to the next provider
+    GROQ_TTFT_SECONDS: float = 2.0
+    OLLAMA_TTFT_SECONDS: float = 10.0
+    LLM_FIRST_TOKEN_TIMEOUT_SECONDS: float = 30.0   # no provider streaming by then → apology
+    # Circuit breaker: this many consecutive failures keep a provider out for the cooldown
+    LLM_BREAKER_FAILURES: int = 3
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0
+    # Admission control, per provider and worker: concurrent generations, then a fair (per-user) queue
+    GROQ_MAX_CONCURRENCY: int = 32
+    OLLAMA_MAX_CONCURRENCY: int = 2       # a local model only decodes a couple of streams at once
+    LLM_QUEUE_MAX: int = 64               # waiting requests beyond this → 429
+    LLM_QUEUE_PER_USER: int = 2           # one user's waiting requests beyond this → 429
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 10.0   # no slot by then → 503
+    # Client closed the SSE stream → cancel the pipeline (and the LLM call) within this long
+    DISCONNECT_POLL_SECONDS: float = 0.5
+    # Confidence tiers (validator.answer_tier): "high" answers straight from the FAQ, no LLM
+    FAST_PATH_ENABLED: bool = True
+    FAST_PATH_MIN_RELEVANCE: float = 0.98   # top fused score / RRF max (1.0 = rank 1 in FAISS and BM25)
+    FAST_PATH_MIN_SIMILARITY: float = 0.92  # cosine(query, FAQ question)
+    FAST_PATH_MIN_MARGIN: float = 0.05      # over the closest FAQ with a different answer
+    FAST_PATH_PARAPHRASE: bool = True       # serve the paraphrase stored with the index, if there is one
+    PARAPHRASE_CONCURRENCY: int = 4         # LLM calls in flight during build_index.py --paraphrase
+    # Context packing (app/rag/context_packer.py): token budget for the retrieved chunks.
+    # Per-model overrides as "model=value,..." e.g. "llama-3.1-8b-instant=1024,gemma3:4b=768"
+    CONTEXT_PACKING_ENABLED: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 1024
+    CONTEXT_MODEL_BUDGETS: str = ""
+    CONTEXT_TOKENIZERS: str = ""        # "model=tokenizer.json path or HF hub id"; unset → ~4 chars/token
+    CONTEXT_DEDUP_THRESHOLD: float = 0.8  # word-set Jaccard at which two chunks count as duplicates
+    CONTEXT_CHUNK_MAX_TOKENS: int = 192   # longer answers keep only their most query-relevant sentences
+    # /rag/query SSE frames: "legacy" (one per token) unless the client asks ?stream_format=coalesced
+    SSE_DEFAULT_FORMAT: str = "legacy"
+    SSE_COALESCE_MS: float = 25.0          # coalesced: tokens within this window share one frame
+    SSE_COALESCE_MAX_CHARS: int = 512      # ... or fewer, once this many characters are buffered
+    # Logging (app/core/log.py): per-query traces are DEBUG, degraded service WARNING
+    LOG_LEVEL: str = "INFO"
+    # /metrics under gunicorn: each worker's snapshot lands here (unset → <tmp>/neurostack-metrics-<master pid>)
+    METRICS_DIR: str = ""
+    METRICS_SNAPSHOT_SECONDS: float = 5.0
+    # Retrieval-only batch API (/rag/batch): queries per request, queries per search pass, max k
+    BATCH_QUERY_MAX: int = 5000
+    BATCH_CHUNK_SIZE: int = 256
+    BATCH_K_MAX: int = 50
+
+    EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    # torch | onnx | onnx_int8 — used by build_index.py, manage_faqs.py and the server alike.
+    # The ONNX variants load local files written by app/rag/export_onnx.py
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_DIR: str = ""      # default: app/data/models/<model name>
+    EMBEDDING_THREADS: int = 0        # ONNX Runtime intra-op threads (0 = all cores)
+    # Index rebuilds reuse cached document embeddings (keyed by model + normalized text)
+    EMBED_CACHE_ENABLED: bool = True
+    EMBED_CACHE_DIR: str = ""         # default: app/data/embed_cache
+    # Streaming ingest (app/rag/ingest.py): encoder processes, rows per shard, answer chunking
+    INGEST_WORKERS: int = 2
+    INGEST_BATCH_SIZE: int = 64
+    INGEST_SHARD_SIZE: int = 20000
+    INGEST_CHUNK_SIZE: int = 0        # characters; 0 = one row per FAQ, answers never split
+    INGEST_CHUNK_OVERLAP: int = 100
+
+    # Metadata filters: FAQ fields indexed per generation (filters={"category": "vpn"} on /rag/query)
+    FILTER_FIELDS: str = "category,product,locale,tenant"
+    FILTER_EXACT_MAX: int = 1024      # slices up to this many FAQs: exact search over just their vectors
+    # Index generations: how often a server checks app/data/CURRENT for a newer one
+    INDEX_RELOAD_CHECK_SECONDS: float = 5.0
+    # Only unpickle the pre-generation bm25_index.pkl if explicitly allowed
+    ALLOW_LEGACY_PICKLE: bool = False
+    # Retry-After (seconds) sent with 503s while indexes / model are still loading
+    READY_RETRY_AFTER_SECONDS: int = 5
+    # Event log (feedback / query counts / retrieval scores): group-commit window + batch cap
+    EVENT_FLUSH_MS: float = 20.0
+    EVENT_BATCH_MAX: int = 256
+    # Chat history: per-user cap (oldest dropped), page sizes, write-behind queue
+    HISTORY_MAX_PER_USER: int = 200
+    HISTORY_PAGE_SIZE: int = 20
+    HISTORY_PAGE_MAX: int = 100
+    HISTORY_QUEUE_MAX: int = 10000
+    HISTORY_FLUSH_MS: float = 50.0
+    # Password hashing runs in its own process pool; beyond workers + queue → 429
+    HASH_POOL_WORKERS: int = 2
+    HASH_QUEUE_MAX: int = 8
+    HASH_TIMEOUT_SECONDS: float = 10.0
+    # Auth hot path: verified-token LRU, username → user cache, revocation polling
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_REVOCATION_REFRESH_SECONDS: float = 5.0
+    # Comma-separated usernames allowed to call /admin (FAQ edits, index reloads)
+    ADMIN_USERNAMES: str = ""
+
+    # FAISS index type used by build_index.py (flat, ivf_flat, hnsw, ivf_pq, sq_fp16, sq8)
+    FAISS_INDEX_TYPE: str = "flat"
+    FAISS_NLIST: int = 1024
+    FAISS_PQ_M: int = 48
+    FAISS_PQ_NBITS: int = 8
+    FAISS_HNSW_M: int = 32
+    FAISS_HNSW_EF_CONSTRUCTION: int = 200
+    # Runtime search knobs (only applied to index types that use them)
+    FAISS_NPROBE: int = 16
+    FAISS_EF_SEARCH: int = 64
+
     class Config:
         env_file = ".env"
 
 settings = Settings()
 
-# Detect HuggingFace Space
-IS_HF_SPACE = bool(
-    os.getenv("HF_SPACE_ID") or
-    "hf.co" in os.getenv("HOSTNAME", "") or
-    os.getenv("SYSTEMCTL_UNIT")
-)
-
-# Pull secrets
-real_hf = os.getenv("HF_TOKEN", "").strip()
-real_groq = os.getenv("GROQ_API_KEY", "").strip()
-
-if IS_HF_SPACE:
-    print("\n" + "="*80)
-    print("HUGGING FACE SPACE DETECTED — USING GROQ API FOR LLM")
-    print(f"GROQ_API_KEY loaded → {'YES' if real_groq else 'NO — ADD IT NOW'}")
-    print("="*80 + "\n")
-
-    # Inject secrets
-    settings.HF_TOKEN = real_hf
-    settings.GROQ_API_KEY = real_groq
-    settings.GROQ_MODEL = os.getenv("GROQ_MODEL", settings.GROQ_MODEL)
-    settings.GROQ_API_URL = os.getenv("GROQ_API_URL", settings.GROQ_API_URL)
-
-else:
-    print("\n" + "="*80)
-    print("LOCAL DEV MODE — USING OLLAMA (localhost:11434)")
-    print("="*80 + "\n")
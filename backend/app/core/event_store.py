@@ -0,0 +1,304 @@
+# backend/app/core/event_store.py
+#
+# Append-only event log for feedback, query counts and retrieval quality.
+#
+#   events      one row per thing that happened (never updated or deleted)
+#   aggregates  running totals, updated in the SAME transaction as the events
+#               they summarize → /analytics reads a handful of primary keys, O(1)
+#
+# Writes are group-committed: callers enqueue, one writer thread per process
+# drains the queue and commits up to EVENT_BATCH_MAX events per transaction
+# (one fsync for the whole batch). Aggregates are `value = value + delta`
+# UPSERTs, so any number of worker processes can append to the same file.
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, datetime
+
+from sqlalchemy.engine import make_url
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.utils.schema import FEEDBACK_RATINGS
+
+log = get_logger("events")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id       INTEGER PRIMARY KEY,
+    ts       REAL NOT NULL,
+    kind     TEXT NOT NULL,
+    username TEXT,
+    data     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_events_kind_ts ON events (kind, ts);
+CREATE TABLE IF NOT EXISTS aggregates (
+    name  TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+_UPSERT = (
+    "INSERT INTO aggregates (name, value) VALUES (?, ?) "
+    "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value"
+)
+_MIGRATED = "__legacy_state_imported__"
+
+
+def _deltas(kind, ts, data):
+    """Aggregate increments for one event — the only place analytics semantics live."""
+    if kind == "query":
+        return {"queries:total": 1, f"queries:{date.fromtimestamp(ts).isoformat()}": 1}
+    if kind == "retrieval":
+        return {
+            "retrievals": 1,
+            "retrievals_with_sources": 1 if data.get("with_sources") else 0,
+            "relevance_sum": float(data.get("relevance") or 0.0),
+            "cache_hits": 1 if data.get("cache_hit") else 0,
+            # Confidence tier the query was answered in (low = refused, mid = LLM, high = straight from the FAQ)
+            **({f"tier:{data['tier']}": 1} if data.get("tier") else {}),
+        }
+    if kind == "context":
+        return {
+            "contexts": 1,
+            "prompt_tokens_before_sum": int(data.get("prompt_tokens_before") or 0),
+            "prompt_tokens_after_sum": int(data.get("prompt_tokens_after") or 0),
+        }
+    if kind == "feedback":
+        # Legacy feedback.json entries skip the route's validation
+        return {f"feedback:{data['rating']}": 1} if data.get("rating") in FEEDBACK_RATINGS else {}
+    if kind == "import":  # pre-aggregated counts carried over from the old JSON counter
+        return data
+    return {}
+
+
+def _merge(totals, deltas):
+    for name, value in deltas.items():
+        totals[name] = totals.get(name, 0) + value
+
+
+def _insert(conn, events, totals=None):
+    """Append events + fold them into the aggregates (caller owns the transaction)."""
+    rows, totals = [], dict(totals or {})
+    for ts, kind, username, data, _ in events:
+        rows.append((ts, kind, username, json.dumps(data, ensure_ascii=False)))
+        _merge(totals, _deltas(kind, ts, data))
+    conn.executemany("INSERT INTO events (ts, kind, username, data) VALUES (?, ?, ?, ?)", rows)
+    conn.executemany(_UPSERT, totals.items())
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class EventStore:
+    def __init__(self, path, flush_ms=20.0, max_batch=256):
+        self.path = path
+        self.flush_wait = max(0.0, flush_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self._schema_ready = False
+
+        self.batches = 0
+        self.events = 0
+        self.max_batch_seen = 0
+        self.errors = 0
+
+    # ───── connections (per process, never shared across fork) ─────
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = _connect(self.path)
+            self._local.pid = os.getpid()
+        return conn
+
+    def init_schema(self):
+        if not self._schema_ready:
+            conn = _connect(self.path)
+            try:
+                conn.executescript(_SCHEMA)
+            finally:
+                conn.close()
+            self._schema_ready = True
+
+    def _ensure_started(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self.init_schema()
+                self._pid = os.getpid()
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+                self._thread.start()
+
+    # ───── write path ─────
+    def append(self, kind, username=None, wait=False, **data):
+        """Queue one event. wait=True blocks until its batch is committed (durable ack)."""
+        self._ensure_started()
+        fut = Future() if wait else None
+        self._queue.put((time.time(), kind, username, data, fut))
+        if fut is not None:
+            fut.result()
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is committed (used at shutdown)."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        fut = Future()
+        self._queue.put(fut)
+        try:
+            fut.result(timeout=timeout)
+        except Exception as e:
+            log.warning(f"[EVENTS] Flush failed: {e}")
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.flush_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = _connect(self.path)
+        while True:
+            batch = self._collect()
+            markers = [item for item in batch if isinstance(item, Future)]
+            events = [item for item in batch if not isinstance(item, Future)]
+            try:
+                if events:
+                    self._commit(conn, events)
+                error = None
+            except Exception as e:
+                error = e
+                self.errors += 1
+                log.error(f"[EVENTS] Dropped batch of {len(events)}: {e}")
+            for *_, fut in events:
+                if fut is None:
+                    continue
+                if error is not None:
+                    fut.set_exception(error)
+                else:
+                    fut.set_result(None)
+            for fut in markers:
+                fut.set_result(None)
+
+    def _commit(self, conn, events):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _insert(conn, events)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.batches += 1
+        self.events += len(events)
+        self.max_batch_seen = max(self.max_batch_seen, len(events))
+
+    # ───── read path ─────
+    def aggregates(self, *names):
+        self.init_schema()
+        placeholders = ",".join("?" * len(names))
+        rows = self._reader().execute(
+            f"SELECT name, value FROM aggregates WHERE name IN ({placeholders})", names
+        ).fetchall()
+        found = dict(rows)
+        return {name: found.get(name, 0) for name in names}
+
+    def rebuild_aggregates(self):
+        """Recompute every aggregate from the event log (e.g. after changing _deltas)."""
+        self.init_schema()
+        conn = _connect(self.path)
+        try:
+            totals = {}
+            for ts, kind, data in conn.execute("SELECT ts, kind, data FROM events ORDER BY id"):
+                _merge(totals, _deltas(kind, ts, json.loads(data)))
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM aggregates WHERE name != ?", (_MIGRATED,))
+            conn.executemany("INSERT INTO aggregates (name, value) VALUES (?, ?)", totals.items())
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return totals
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "batches": self.batches,
+            "events": self.events,
+            "avg_batch_size": round(self.events / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_seen,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "errors": self.errors,
+        }
+
+    # ───── one-off import of the old JSON files ─────
+    def import_legacy_json(self, feedback_file, counter_file):
+        """Replay feedback.json / query_counter.json into the log once, then rename them to *.imported."""
+        if not feedback_file.exists() and not counter_file.exists():
+            return
+        self.init_schema()
+        conn = _connect(self.path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # serializes workers starting at the same time
+            if conn.execute("SELECT 1 FROM aggregates WHERE name = ?", (_MIGRATED,)).fetchone():
+                conn.execute("ROLLBACK")
+                return
+            events = []
+            if feedback_file.exists():
+                try:
+                    entries = json.loads(feedback_file.read_text(encoding="utf-8"))
+                except Exception:
+                    entries = []
+                for e in entries:
+                    if not isinstance(e, dict):
+                        continue
+                    try:
+                        ts = datetime.fromisoformat(e.get("timestamp")).timestamp()
+                    except Exception:
+                        ts = time.time()
+                    data = {k: e.get(k) for k in ("rating", "query", "answer")}
+                    events.append((ts, "feedback", e.get("email"), data, None))
+            if counter_file.exists():
+                try:
+                    counter = json.loads(counter_file.read_text(encoding="utf-8"))
+                except Exception:
+                    counter = {}
+                counts = {"queries:total": int(counter.get("total_queries") or 0)}
+                if counter.get("today_date"):
+                    counts[f"queries:{counter['today_date']}"] = int(counter.get("queries_today") or 0)
+                events.append((time.time(), "import", None, counts, None))
+
+            _insert(conn, events, {_MIGRATED: 1})
+            conn.execute("COMMIT")
+            log.info(f"[EVENTS] Imported {len(events)} events from {feedback_file.name} / {counter_file.name}")
+        finally:
+            conn.close()
+
+        stamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+        for path in (feedback_file, counter_file):
+            if path.exists():
+                path.rename(path.with_name(f"{path.name}.{stamp}.imported"))
+
+
+# Same SQLite file as the users table (sqlite:///./neurostack.db → ./neurostack.db)
+event_store = EventStore(
+    make_url(settings.DB_URL).database,
+    flush_ms=settings.EVENT_FLUSH_MS,
+    max_batch=settings.EVENT_BATCH_MAX,
+)
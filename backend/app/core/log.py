@@ -0,0 +1,54 @@
+# backend/app/core/log.py
+# Non-blocking, level-controlled logging for the serving path.
+#
+# Callers only put a record on an in-memory queue (QueueHandler); one listener
+# thread per process does the actual stdout writes, so a slow terminal or log
+# collector never stalls a query. LOG_LEVEL (DEBUG / INFO / WARNING / ...) sets
+# what gets through: per-query traces are DEBUG, degraded service is WARNING.
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from app.core.config import settings
+
+_ROOT = "neurostack"
+_listener = None
+_handler = None
+
+
+def _start():
+    global _listener
+    q = queue.SimpleQueue()
+    _handler.queue = q
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(message)s"))
+    _listener = logging.handlers.QueueListener(q, stream)
+    _listener.start()
+
+
+def _stop():
+    if _listener is not None:
+        _listener.stop()  # drains whatever is still queued
+
+
+def _setup():
+    global _handler
+    root = logging.getLogger(_ROOT)
+    root.setLevel(settings.LOG_LEVEL.upper())
+    root.propagate = False
+    _handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    root.addHandler(_handler)
+    _start()
+    atexit.register(_stop)
+    # The listener thread doesn't survive a fork → each gunicorn worker starts its own
+    os.register_at_fork(after_in_child=_start)
+
+
+def get_logger(name):
+    """Logger under the shared "neurostack" root, e.g. get_logger("pipeline")."""
+    if _handler is None:
+        _setup()
+    return logging.getLogger(f"{_ROOT}.{name}")
@@ -0,0 +1,298 @@
+# backend/app/core/metrics.py
+# Per-stage latency histograms + counters, exposed in Prometheus text format at /metrics.
+#
+# Small in-process registry (no prometheus_client dependency): observing is a
+# bisect + three additions under a per-series lock, cheap enough for every query.
+#
+# Under gunicorn every worker has its own registry, so each one also dumps a JSON
+# snapshot into METRICS_DIR (default: <tmp>/neurostack-metrics-<master pid>) every
+# METRICS_SNAPSHOT_SECONDS; /metrics merges the snapshots of all workers — counters
+# and buckets are summed, so totals survive worker restarts like Prometheus'
+# own multiprocess mode.
+import bisect
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from app.core.config import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds: sub-millisecond FAISS / BM25 up to a slow LLM first token
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RATE_BUCKETS = (5, 10, 25, 50, 100, 200, 400, 800, 1600)
+
+
+class _Series:
+    __slots__ = ("lock", "value", "counts", "sum", "count")
+
+    def __init__(self, buckets=None):
+        self.lock = threading.Lock()
+        self.value = 0.0
+        self.counts = [0] * (len(buckets) + 1) if buckets is not None else None  # last = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = None
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, _Series(self.buckets))
+        return series
+
+    def labels(self, *values, **kw):
+        """Series for one label set — bind it once at import for hot paths."""
+        key = tuple(str(v) for v in values) or tuple(str(kw[n]) for n in self.labelnames)
+        return _Bound(self, self._get(key))
+
+    def inc(self, amount=1.0):
+        self.labels().inc(amount)
+
+    def _inc(self, series, amount):
+        with series.lock:
+            series.value += amount
+
+    def snapshot(self):
+        with self._lock:
+            items = list(self._series.items())
+        out = []
+        for key, s in items:
+            with s.lock:
+                out.append([list(key), s.value] if self.buckets is None else [list(key), list(s.counts), s.sum, s.count])
+        return {"type": self.kind, "help": self.help, "labelnames": list(self.labelnames),
+                "buckets": self.buckets and list(self.buckets), "series": out}
+
+
+class Histogram(Counter):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _observe(self, series, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with series.lock:
+            series.counts[i] += 1
+            series.sum += value
+            series.count += 1
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class _Bound:
+    __slots__ = ("metric", "series")
+
+    def __init__(self, metric, series):
+        self.metric = metric
+        self.series = series
+
+    def inc(self, amount=1.0):
+        self.metric._inc(self.series, amount)
+
+    def observe(self, value):
+        self.metric._observe(self.series, value)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help, labelnames=()):
+        return self.metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def snapshot(self):
+        return {name: m.snapshot() for name, m in self.metrics.items()}
+
+    def reset(self):
+        # In place: hot paths hold bound series. Fresh locks — a forked child may inherit a held one
+        for m in self.metrics.values():
+            m._lock = threading.Lock()
+            for s in m._series.values():
+                s.lock = threading.Lock()
+                s.value, s.sum, s.count = 0.0, 0.0, 0
+                if s.counts is not None:
+                    s.counts = [0] * len(s.counts)
+
+
+registry = Registry()
+# A forked gunicorn worker starts from zero, not from the master's warm-up queries
+os.register_at_fork(after_in_child=registry.reset)
+
+
+# ───── Stage instrumentation (shared by retriever, pipeline, LLM router, SSE writer) ─────
+STAGE_SECONDS = registry.histogram(
+    "neurostack_stage_seconds", "Latency of one query-serving stage", ["stage"],
+)
+STAGES = {s: STAGE_SECONDS.labels(s) for s in ("embed", "faiss", "bm25", "fusion", "validation", "context")}
+ANSWERS = registry.counter(
+    "neurostack_answers_total", "Answers by how they were produced (fast_path, cache, llm, blocked)", ["path"],
+)
+LLM_TTFT_SECONDS = registry.histogram(
+    "neurostack_llm_ttft_seconds", "Time from starting a provider request to its first token", ["provider"],
+)
+LLM_TOKENS_PER_SECOND = registry.histogram(
+    "neurostack_llm_tokens_per_second", "Decode rate of a finished answer, after its first token", ["provider"],
+    buckets=RATE_BUCKETS,
+)
+LLM_TOKENS = registry.counter("neurostack_llm_tokens_total", "Tokens streamed from a provider", ["provider"])
+LLM_REQUESTS = registry.counter(
+    "neurostack_llm_requests_total", "Provider attempts by outcome (win, failure, cancelled)", ["provider", "outcome"],
+)
+SSE_FLUSH_SECONDS = registry.histogram(
+    "neurostack_sse_flush_seconds", "Time to hand one SSE frame to the client connection", ["format"],
+)
+SSE_FRAMES = registry.counter("neurostack_sse_frames_total", "SSE frames sent", ["format"])
+
+
+def stage(name):
+    """`with stage("faiss"): ...` — records into neurostack_stage_seconds."""
+    return STAGES[name].time() if name in STAGES else STAGE_SECONDS.labels(name).time()
+
+
+# ───── Multi-worker snapshots ─────
+def _multiprocess():
+    return bool(settings.METRICS_DIR or os.getenv("NEUROSTACK_MASTER_PID"))
+
+
+def snapshot_dir():
+    return settings.METRICS_DIR or os.path.join(
+        tempfile.gettempdir(), f"neurostack-metrics-{os.getenv('NEUROSTACK_MASTER_PID', os.getpid())}"
+    )
+
+
+def clear_snapshots():
+    """Called by the gunicorn master before forking: totals start over with the new master."""
+    path = snapshot_dir()
+    if os.path.isdir(path):
+        for name in os.listdir(path):
+            if name.endswith(".json"):
+                os.remove(os.path.join(path, name))
+
+
+def write_snapshot():
+    path = snapshot_dir()
+    os.makedirs(path, exist_ok=True)
+    target = os.path.join(path, f"{os.getpid()}.json")
+    tmp = target + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, target)  # readers never see a half-written file
+
+
+_snapshotter = None
+
+
+def start_snapshots():
+    """Per worker: keep this process' snapshot fresh for the other workers' /metrics."""
+    global _snapshotter
+    if not _multiprocess() or (_snapshotter is not None and _snapshotter[0] == os.getpid()):
+        return
+
+    def loop():
+        while True:
+            time.sleep(settings.METRICS_SNAPSHOT_SECONDS)
+            try:
+                write_snapshot()
+            except OSError as e:
+                from app.core.log import get_logger
+                get_logger("metrics").warning(f"[METRICS] snapshot failed: {e}")
+
+    thread = threading.Thread(target=loop, name="metrics-snapshot", daemon=True)
+    thread.start()
+    _snapshotter = (os.getpid(), thread)
+
+
+def _merge(into, snap):
+    for name, metric in snap.items():
+        target = into.setdefault(name, {**metric, "series": {}})
+        for row in metric["series"]:
+            key = tuple(row[0])
+            if metric["type"] == "counter":
+                target["series"][key] = target["series"].get(key, 0.0) + row[1]
+            else:
+                counts, total, count = target["series"].get(key, ([0] * len(row[1]), 0.0, 0))
+                target["series"][key] = ([a + b for a, b in zip(counts, row[1])], total + row[2], count + row[3])
+
+
+def collect():
+    """This process' metrics, merged with every other worker's latest snapshot."""
+    merged = {}
+    if _multiprocess():
+        write_snapshot()
+        path = snapshot_dir()
+        for name in sorted(os.listdir(path)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(path, name)) as f:
+                    _merge(merged, json.load(f))
+            except (OSError, ValueError):
+                continue  # worker exiting mid-read
+    else:
+        _merge(merged, registry.snapshot())
+    return merged
+
+
+# ───── Prometheus text exposition ─────
+def _fmt(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+
+def render(merged=None):
+    merged = collect() if merged is None else merged
+    lines = []
+    for name, metric in merged.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        names = metric["labelnames"]
+        for key, value in sorted(metric["series"].items()):
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_labels(names, key)} {_fmt(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(list(metric["buckets"]) + [math.inf], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(names, key, ('le', _fmt(bound)))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, key)} {_fmt(total)}")
+            lines.append(f"{name}_count{_labels(names, key)} {count}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,69 @@
+# backend/app/core/procmem.py
+# Per-process memory breakdown from /proc (Linux). With a preloaded gunicorn
+# master, index + model pages stay shared with every forked worker, so the real
+# cost of one more worker is its *private* memory, not its RSS.
+import os
+
+_FIELDS = {
+    "Rss": "rss_mb",
+    "Pss": "pss_mb",
+    "Shared_Clean": "shared_clean_mb",
+    "Shared_Dirty": "shared_dirty_mb",
+    "Private_Clean": "private_clean_mb",
+    "Private_Dirty": "private_dirty_mb",
+}
+
+
+def memory_info(pid=None):
+    """{rss_mb, pss_mb, shared_*_mb, private_*_mb, private_mb} for a pid, or None if unreadable."""
+    pid = pid or os.getpid()
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    info = {"pid": pid}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in _FIELDS:
+            info[_FIELDS[key]] = round(int(rest.split()[0]) / 1024, 1)  # kB → MB
+    info["private_mb"] = round(info.get("private_clean_mb", 0) + info.get("private_dirty_mb", 0), 1)
+    return info
+
+
+def child_pids(parent_pid):
+    """Live children of a process (gunicorn workers of the master)."""
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # "pid (comm) state ppid ..." — comm may contain spaces, so split after the last ")"
+        fields = stat.rsplit(")", 1)[-1].split()
+        if len(fields) > 1 and int(fields[1]) == parent_pid:
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def worker_report():
+    """Memory of the master (if running under gunicorn) and all of its workers."""
+    master_pid = int(os.getenv("NEUROSTACK_MASTER_PID", "0"))
+    if not master_pid or master_pid != os.getppid():
+        me = memory_info()
+        return {"mode": "single-process", "workers": [me] if me else []}
+
+    workers = [w for w in (memory_info(pid) for pid in child_pids(master_pid)) if w]
+    report = {
+        "mode": "preforked",
+        "serving_pid": os.getpid(),
+        "master": memory_info(master_pid),
+        "workers": workers,
+    }
+    if workers:
+        report["avg_worker_private_mb"] = round(sum(w["private_mb"] for w in workers) / len(workers), 1)
+        report["avg_worker_rss_mb"] = round(sum(w.get("rss_mb", 0) for w in workers) / len(workers), 1)
+    return report
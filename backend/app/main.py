@@ -1,14 +1,22 @@
 # backend/app/main.py
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-import json
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
+import os
 from pathlib import Path
-from datetime import datetime, date
+from datetime import date
 
 # ───── Imports ─────
-from .routes import auth_routes, rag_routes
-from app.core.security import decode_token
-from app.rag.hybrid_retriever import faiss_index, bm25_data  # Triggers loading at import
+from .routes import auth_routes, rag_routes, admin_routes
+from app.core.auth_cache import get_current_user
+from app.core.event_store import event_store
+from app.core.chat_history import chat_history
+from app.core import metrics
+from app.utils.schema import FeedbackIn
+from app.rag import hybrid_retriever
+from app.rag.llm_providers import llm_router
+from app.rag.lifecycle import lifecycle  # Loads indexes + model in the background after startup
 
 app = FastAPI(title="Neurostack Copilot", version="1.0.0")
 
@@ -31,97 +39,68 @@ app.add_middleware(
 # ───── Include routers ─────
 app.include_router(auth_routes.router)
 app.include_router(rag_routes.router)
+app.include_router(admin_routes.router)
 
-# ───── File paths ─────
+# ───── Legacy JSON state → append-only event log (shared by all worker processes) ─────
 BASE_DIR = Path(__file__).resolve().parent.parent
 FEEDBACK_FILE = BASE_DIR / "feedback.json"
 COUNTER_FILE = BASE_DIR / "query_counter.json"
-
-# ───── Ensure files exist at startup (with loud logs) ─────
-def ensure_file(path: Path, default_content):
-    if not path.exists():
-        try:
-            path.write_text(json.dumps(default_content, indent=2), encoding="utf-8")
-            print(f"Created missing file → {path}")
-        except Exception as e:
-            print(f"Failed to create {path}: {e}")
-
-ensure_file(FEEDBACK_FILE, [])
-ensure_file(COUNTER_FILE, {
-    "total_queries": 892,
-    "today_date": date.today().isoformat(),
-    "queries_today": 47
-})
-
-# ───── Auth dependency ─────
-def get_current_user(Authorization: str = Header(None)):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    token = Authorization.split("Bearer ")[-1].strip()
-    username = decode_token(token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    return username
+event_store.import_legacy_json(FEEDBACK_FILE, COUNTER_FILE)
 
 # ───── Routes ─────
 @app.post("/feedback")
-async def submit_feedback(feedback: dict, current_user: str = Depends(get_current_user)):
-    new_entry = {
-        "query": str(feedback.get("query", ""))[:500],
-        "answer": str(feedback.get("answer", ""))[:2000],
-        "rating": feedback.get("rating"),
-        "email": current_user,
-        "timestamp": datetime.utcnow().isoformat()
-    }
-    try:
-        data = json.loads(FEEDBACK_FILE.read_text(encoding="utf-8"))
-    except:
-        data = []
-    data.append(new_entry)
-    FEEDBACK_FILE.write_text(json.dumps(data, indent=2), encoding="utf-8")
+async def submit_feedback(feedback: FeedbackIn, current_user: str = Depends(get_current_user)):
+    # Durable ack: waits for the group commit its event lands in (off the event loop)
+    await run_in_threadpool(
+        event_store.append, "feedback", current_user, wait=True,
+        rating=feedback.rating,
+        query=feedback.query[:500],
+        answer=feedback.answer[:2000],
+    )
     return {"status": "thanks"}
 
 @app.get("/analytics")
-async def analytics(current_user: str = Depends(get_current_user)):
-    try:
-        feedback = json.loads(FEEDBACK_FILE.read_text(encoding="utf-8"))
-    except:
-        feedback = []
-    try:
-        counter = json.loads(COUNTER_FILE.read_text(encoding="utf-8"))
-    except:
-        counter = {"total_queries": 892, "queries_today": 47}
-
-    good = sum(1 for f in feedback if f.get("rating") == "good")
-    bad = sum(1 for f in feedback if f.get("rating") == "bad")
+def analytics(current_user: str = Depends(get_current_user)):
+    # O(1): a few primary-key reads of aggregates maintained at write time
+    today = f"queries:{date.today().isoformat()}"
+    agg = event_store.aggregates(
+        "queries:total", today, "retrievals", "retrievals_with_sources",
+        "relevance_sum", "feedback:good", "feedback:bad",
+        "contexts", "prompt_tokens_before_sum", "prompt_tokens_after_sum",
+        "tier:high", "tier:mid", "tier:low",
+    )
+    tiered = agg["tier:high"] + agg["tier:mid"] + agg["tier:low"]
+    contexts = agg["contexts"]
+    retrievals = agg["retrievals"]
+    good, bad = int(agg["feedback:good"]), int(agg["feedback:bad"])
 
     return {
-        "queries_today": counter.get("queries_today", 47),
-        "total_queries": counter.get("total_queries", 892),
-        "percent_with_sources": 96,
-        "avg_relevance": 0.91,
+        "queries_today": int(agg[today]),
+        "total_queries": int(agg["queries:total"]),
+        # From the scores the pipeline recorded; None until the first query has run
+        "percent_with_sources": round(100 * agg["retrievals_with_sources"] / retrievals) if retrievals else None,
+        "avg_relevance": round(agg["relevance_sum"] / retrievals, 2) if retrievals else None,
         "good_feedback": good,
         "bad_feedback": bad,
-        "total_feedback": good + bad
+        "total_feedback": good + bad,
+        # Context packing: average prompt size sent to the LLM, before vs after the token budget
+        "avg_prompt_tokens_before": round(agg["prompt_tokens_before_sum"] / contexts) if contexts else None,
+        "avg_prompt_tokens_after": round(agg["prompt_tokens_after_sum"] / contexts) if contexts else None,
+        # Share of traffic per confidence tier: high = answered from the FAQ, mid = LLM, low = refused
+        "answer_tiers": {
+            t: round(100 * agg[f"tier:{t}"] / tiered, 1) if tiered else None for t in ("high", "mid", "low")
+        },
     }
 
 @app.post("/increment-query")
 async def increment_query(current_user: str = Depends(get_current_user)):
-    try:
-        counter = json.loads(COUNTER_FILE.read_text(encoding="utf-8"))
-    except:
-        counter = {"total_queries": 0, "today_date": "", "queries_today": 0}
-
-    today = date.today().isoformat()
-    if counter.get("today_date") != today:
-        counter["queries_today"] = 0
-        counter["today_date"] = today
-
-    counter["queries_today"] += 1
-    counter["total_queries"] = (counter.get("total_queries", 0) or 0) + 1
-    COUNTER_FILE.write_text(json.dumps(counter, indent=2), encoding="utf-8")
+    event_store.append("query", current_user)
     return {"status": "counted"}
 
+@app.get("/events/stats")
+def events_stats(current_user: str = Depends(get_current_user)):
+    return event_store.stats()
+
 # ───── Public endpoints ─────
 @app.get("/")
 def home():
@@ -133,28 +112,41 @@ def health_check():
 
 @app.get("/ready")
 def readiness_check():
-    try:
-        faiss_ready = faiss_index is not None and getattr(faiss_index, "is_trained", True)
-        bm25_ready = bm25_data is not None
-        ready = faiss_ready and bm25_ready
-        return {
-            "ready": ready,
-            "faiss_index": bool(faiss_ready),
-            "bm25_index": bool(bm25_ready),
-            "message": "RAG system loaded" if ready else "Indexes still loading..."
-        }
-    except Exception as e:
-        return {"ready": False, "error": str(e)}
+    status = lifecycle.status()
+    faiss_index = hybrid_retriever.faiss_index
+    status.update({
+        "faiss_index": faiss_index is not None and bool(getattr(faiss_index, "is_trained", True)),
+        "bm25_index": hybrid_retriever.bm25 is not None,
+        "message": "RAG system loaded" if status["ready"] else (
+            "RAG system failed to load — see components" if status["failed"] else "Indexes still loading..."
+        ),
+    })
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    # Per-stage latency histograms + counters (all workers merged), Prometheus text format
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # ───── FULL STARTUP LOGS (the ones you missed!) ─────
 @app.on_event("startup")
 async def startup_event():
+    lifecycle.start_background()
+    metrics.start_snapshots()
     print("\n" + "="*60)
     print("Neurostack Copilot API STARTED SUCCESSFULLY!")
     print("="*60)
-    print(f"FAISS index loaded: {'YES' if faiss_index is not None else 'NO'}")
-    print(f"BM25 index loaded:  {'YES' if bm25_data is not None else 'NO'}")
-    print(f"Feedback file:      {FEEDBACK_FILE} {'(exists)' if FEEDBACK_FILE.exists() else '(created)'}")
-    print(f"Counter file:       {COUNTER_FILE} {'(exists)' if COUNTER_FILE.exists() else '(created)'}")
+    print(f"RAG components:     loading in background → GET /ready")
+    print(f"Worker pid:         {os.getpid()}")
+    print(f"Feedback/counters:  append-only event log ({event_store.path})")
+    print(f"LLM providers:      {llm_router.describe()} (hedged after TTFT deadline)")
+    print(f"Metrics:            GET /metrics (Prometheus text format)")
     print(f"API Docs:           https://saadajee-neurostack-copilot.hf.space/docs")
     print("="*60 + "\n")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    event_store.flush()
+    chat_history.flush()
+    await llm_router.aclose()
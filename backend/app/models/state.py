@@ -0,0 +1,30 @@
+# backend/app/models/state.py
+# Mutable app state that used to live in module dicts. Kept in the same SQLite
+# DB as users so every worker process sees the same data. (Feedback and query
+# counters live in the append-only log in app.core.event_store.)
+from sqlalchemy import Column, Float, Index, Integer, String, Text
+from app.models.user import Base
+
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    __table_args__ = (Index("ix_chat_messages_user_id", "username", "id"),)  # keyset pagination
+
+    id = Column(Integer, primary_key=True)
+    username = Column(String, nullable=False)
+    query = Column(Text)
+    answer = Column(Text)
+    chunk_refs = Column(Text)    # JSON [[faq_id, score], ...] — text comes from the index
+    timestamp = Column(Float)
+
+
+class Revocation(Base):
+    """Either one token (jti) or every token of a user issued before revoked_before."""
+    __tablename__ = "revocations"
+
+    id = Column(Integer, primary_key=True)
+    jti = Column(String, index=True)
+    username = Column(String, index=True)
+    revoked_before = Column(Float)
+    expires_at = Column(Float)   # after this, the row no longer matters
+    created_at = Column(Float)
@@ -11,9 +11,10 @@ class User(Base):
     username = Column(String, unique=True, index=True)
     password = Column(String)
 
-    def __init__(self, username, password):
+    def __init__(self, username, password=None, password_hash=None):
         self.username = username
-        self.password = hash_password(password)
+        # password_hash: already hashed (e.g. by app.utils.hash_pool off the request thread)
+        self.password = password_hash if password_hash is not None else hash_password(password)
 
     def verify_password(self, password):
         return verify_password(password, self.password)
@@ -0,0 +1,134 @@
+# backend/app/rag/answer_cache.py
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+
+
+class SemanticAnswerCache:
+    """
+    LRU + TTL cache of generated answers.
+    An entry is only reused when the new query retrieved exactly the same chunks
+    AND its embedding is within `threshold` cosine similarity of the cached one.
+    Embeddings are normalized, so cosine == dot product.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: int = 3600, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (embedding, chunk_ids, answer, created_at)
+        self._by_chunks = {}            # chunk_ids -> set of keys
+        self._next_key = 0
+        self._version = None            # index version the entries were answered against
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # ───── internal helpers (caller holds the lock) ─────
+    def _drop(self, key):
+        _, chunk_ids, _, _ = self._entries.pop(key)
+        keys = self._by_chunks.get(chunk_ids)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_chunks[chunk_ids]
+
+    def _check_version(self, version):
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_chunks.clear()
+            self._version = version
+
+    # ───── public API ─────
+    def lookup(self, query_emb, chunk_ids, version=None):
+        """Return the cached answer for a near-duplicate query, or None."""
+        chunk_ids = tuple(sorted(int(i) for i in chunk_ids))
+        query_emb = np.asarray(query_emb, dtype=np.float32).ravel()
+        now = time.time()
+
+        with self._lock:
+            self._check_version(version)
+
+            best_key, best_sim = None, self.threshold
+            for key in list(self._by_chunks.get(chunk_ids, ())):
+                emb, _, _, created_at = self._entries[key]
+                if now - created_at > self.ttl_seconds:
+                    self._drop(key)
+                    self.evictions += 1
+                    continue
+                sim = float(np.dot(emb, query_emb))
+                if sim >= best_sim:
+                    best_key, best_sim = key, sim
+
+            if best_key is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return self._entries[best_key][2]
+
+    def store(self, query_emb, chunk_ids, answer: str, version=None):
+        chunk_ids = tuple(sorted(int(i) for i in chunk_ids))
+        query_emb = np.asarray(query_emb, dtype=np.float32).ravel().copy()
+
+        with self._lock:
+            self._check_version(version)
+
+            key = self._next_key
+            self._next_key += 1
+            self._entries[key] = (query_emb, chunk_ids, answer, time.time())
+            self._by_chunks.setdefault(chunk_ids, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self):
+        """Drop everything — call after the FAISS/BM25 indexes are rebuilt."""
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_chunks.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": settings.ANSWER_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "index_version": self._version,
+            }
+
+
+def replay_tokens(answer: str):
+    """Split a cached answer into word-sized tokens so it streams like a live one."""
+    return re.findall(r"\s*\S+", answer)
+
+
+answer_cache = SemanticAnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+)
@@ -1,10 +1,14 @@
 # backend/app/rag/build_index.py
+# Loads faqs.json whole — for corpora that don't fit in memory use app/rag/ingest.py
+# load_faqs / build_indexes are importable (benchmarks/ builds its synthetic corpora with them)
+import argparse
+import asyncio
 import json
 import os
-from sentence_transformers import SentenceTransformer
+import time
 import faiss
 import numpy as np
-import pickle
+import sys
 from rank_bm25 import BM25Okapi
 
 # ───── PATHS (works everywhere) ─────
@@ -12,80 +16,163 @@ CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(os.path.dirname(CURRENT_DIR))
 DATA_DIR = os.path.join(PROJECT_ROOT, "app", "data")
 
-faqs_path = os.path.join(DATA_DIR, "faqs.json")
-index_path = os.path.join(DATA_DIR, "index.faiss")
-bm25_path = os.path.join(DATA_DIR, "bm25_index.pkl")
-
-print(f"Looking for FAQs at: {faqs_path}")
-
-if not os.path.exists(faqs_path):
-    raise FileNotFoundError(f"faqs.json NOT FOUND at {faqs_path}")
-
-# Load FAQs
-with open(faqs_path, "r", encoding="utf-8") as f:
-    faqs = json.load(f)
-
-questions = []
-answers = []
-valid_faqs = []
-
-print(f"Total entries in faqs.json: {len(faqs)}")
-
-for i, item in enumerate(faqs):
-    if isinstance(item, dict) and "question" in item and "answer" in item:
-        q = str(item["question"]).strip()
-        a = str(item["answer"]).strip()
-        if q and a:
-            questions.append(q)
-            answers.append(a)
-            valid_faqs.append(item)
+# Run as a plain script → make the `app` package importable
+sys.path.insert(0, PROJECT_ROOT)
+from app.rag.sparse_bm25 import SparseBM25, check_parity
+from app.rag.faiss_factory import INDEX_TYPES, build_faiss_index
+from app.rag.index_store import tokenize, write_generation, publish, write_lock
+from app.rag.embedding_backends import BACKENDS, load_backend
+from app.rag.embed_cache import CachedEncoder
+from app.rag.paraphrases import generate_missing
+from app.core.config import settings
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build FAISS + BM25 indexes from faqs.json")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=settings.FAISS_INDEX_TYPE)
+    parser.add_argument("--nlist", type=int, default=settings.FAISS_NLIST, help="IVF cells (ivf_flat, ivf_pq)")
+    parser.add_argument("--pq-m", type=int, default=settings.FAISS_PQ_M, help="PQ sub-quantizers (ivf_pq)")
+    parser.add_argument("--pq-nbits", type=int, default=settings.FAISS_PQ_NBITS, help="bits per PQ code (ivf_pq)")
+    parser.add_argument("--hnsw-m", type=int, default=settings.FAISS_HNSW_M, help="graph degree (hnsw)")
+    parser.add_argument("--hnsw-ef-construction", type=int, default=settings.FAISS_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--embedding-backend", choices=BACKENDS, default=settings.EMBEDDING_BACKEND,
+                        help="must match the server's EMBEDDING_BACKEND")
+    parser.add_argument("--no-embed-cache", action="store_true", help="re-encode everything, ignore the cache")
+    parser.add_argument("--paraphrase", action="store_true",
+                        help="LLM-paraphrase answers not paraphrased yet, for the confidence fast path")
+    return parser.parse_args(argv)
+
+
+def load_faqs(faqs_path):
+    """(questions, answers, valid_faqs) — entries without a non-empty question + answer are skipped."""
+    print(f"Looking for FAQs at: {faqs_path}")
+
+    if not os.path.exists(faqs_path):
+        raise FileNotFoundError(f"faqs.json NOT FOUND at {faqs_path}")
+
+    # Load FAQs
+    with open(faqs_path, "r", encoding="utf-8") as f:
+        faqs = json.load(f)
+
+    questions = []
+    answers = []
+    valid_faqs = []
+
+    print(f"Total entries in faqs.json: {len(faqs)}")
+
+    for i, item in enumerate(faqs):
+        if isinstance(item, dict) and "question" in item and "answer" in item:
+            q = str(item["question"]).strip()
+            a = str(item["answer"]).strip()
+            if q and a:
+                questions.append(q)
+                answers.append(a)
+                valid_faqs.append(item)
+            else:
+                print(f"Skipping empty Q/A at index {i}")
         else:
-            print(f"Skipping empty Q/A at index {i}")
-    else:
-        print(f"Skipping invalid entry at index {i}: {item}")
-
-print(f"Loaded {len(questions)} valid FAQs")
-
-if len(questions) == 0:
-    raise ValueError("No valid FAQs found! Check your faqs.json format.")
-
-# ───── EMBEDDINGS + FAISS (100% safe) ─────
-print("Loading embedding model...")
-model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-
-print("Generating embeddings...")
-embeddings = model.encode(
-    questions,
-    batch_size=32,
-    show_progress_bar=True,
-    convert_to_numpy=True,
-    normalize_embeddings=True  # ← This helps FAISS
-)
-
-print(f"Embeddings shape: {embeddings.shape}")  # Should be (N, 384)
-
-# Create FAISS index
-dimension = embeddings.shape[1]
-print(f"Creating FAISS index with dimension {dimension}")
-
-index = faiss.IndexFlatL2(dimension)
-index.add(embeddings)  # ← No need for .astype() — already float32
-faiss.write_index(index, index_path)
-print(f"FAISS index saved → {index_path} ({index.ntotal} vectors)")
-
-# ───── BM25 ─────
-print("Building BM25 index...")
-tokenized = [q.lower().split() for q in questions]
-bm25 = BM25Okapi(tokenized)
-
-with open(bm25_path, "wb") as f:
-    pickle.dump({
-        "bm25": bm25,
-        "questions": questions,
-        "answers": answers,
-        "faqs": valid_faqs
-    }, f)
-
-print(f"BM25 index saved → {bm25_path}")
-print("\nSUCCESS! Indexes built perfectly.")
-print("Now run: uvicorn app.main:app --reload")
\ No newline at end of file
+            print(f"Skipping invalid entry at index {i}: {item}")
+
+    print(f"Loaded {len(questions)} valid FAQs")
+
+    if len(questions) == 0:
+        raise ValueError("No valid FAQs found! Check your faqs.json format.")
+    return questions, answers, valid_faqs
+
+
+def build_indexes(questions, embedder, index_type="flat", use_cache=True, parity=True, timings=None, **faiss_params):
+    """
+    Embeddings + FAISS + sparse BM25 for `questions`. Returns (index, index_params, bm25, embeddings).
+    `timings`, if given, gets the seconds spent per phase (embed, faiss, bm25, parity).
+    """
+    timings = {} if timings is None else timings
+
+    # ───── EMBEDDINGS + FAISS (100% safe) ─────
+    print("Generating embeddings...")
+    started = time.perf_counter()
+    encoder = CachedEncoder(embedder) if use_cache else embedder
+    embeddings = encoder.encode(questions, batch_size=32)  # normalized float32 ← This helps FAISS
+    timings["embed"] = time.perf_counter() - started
+    if use_cache:
+        report = encoder.report()
+        print(f"Embedding cache: {report['hits']}/{report['texts']} hits ({report['hit_rate']:.0%}), "
+              f"encoded {report['misses']} in {report['encode_seconds']}s, "
+              f"~{report['seconds_saved']}s saved → {report['cache_path']} ({report['cache_mb']} MB)")
+
+    print(f"Embeddings shape: {embeddings.shape}")  # Should be (N, 384)
+
+    # Create FAISS index
+    dimension = embeddings.shape[1]
+    print(f"Creating {index_type} FAISS index with dimension {dimension}")
+
+    started = time.perf_counter()
+    index, index_params = build_faiss_index(
+        embeddings,
+        index_type,
+        ids=np.arange(len(questions)),   # ID-mapped → FAQ ids survive incremental updates
+        **faiss_params,
+    )
+    timings["faiss"] = time.perf_counter() - started
+    index_params["embedding"] = embedder.describe()  # recorded in index.meta.json
+    print(f"FAISS index built ({index.ntotal} vectors, {index_params['factory']})")
+
+    # ───── BM25 ─────
+    print("Building BM25 index...")
+    started = time.perf_counter()
+    tokenized = [tokenize(q) for q in questions]
+    bm25 = SparseBM25.from_corpus(tokenized)
+    timings["bm25"] = time.perf_counter() - started
+    print(f"Sparse BM25 built ({len(bm25.terms)} terms, {len(bm25.doc_ids)} postings)")
+
+    # Sanity check: sparse scores must match rank_bm25 on a sample of the corpus
+    if parity:
+        started = time.perf_counter()
+        sample = tokenized[:: max(1, len(tokenized) // 20)]
+        max_diff, ok = check_parity(bm25, BM25Okapi(tokenized), sample)
+        timings["parity"] = time.perf_counter() - started
+        print(f"BM25Okapi parity on {len(sample)} queries: max diff {max_diff:.2e} → {'OK' if ok else 'MISMATCH'}")
+        if not ok:
+            raise RuntimeError("Sparse BM25 scores diverge from BM25Okapi — refusing to publish indexes")
+
+    return index, index_params, bm25, embeddings
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    questions, answers, valid_faqs = load_faqs(os.path.join(DATA_DIR, "faqs.json"))
+
+    print(f"Loading embedding model ({args.embedding_backend} backend)...")
+    embedder = load_backend(args.embedding_backend)
+
+    index, index_params, bm25, embeddings = build_indexes(
+        questions,
+        embedder,
+        args.index_type,
+        use_cache=settings.EMBED_CACHE_ENABLED and not args.no_embed_cache,
+        nlist=args.nlist,
+        pq_m=args.pq_m,
+        pq_nbits=args.pq_nbits,
+        hnsw_m=args.hnsw_m,
+        hnsw_ef_construction=args.hnsw_ef_construction,
+    )
+
+    # ───── Paraphrases for the fast path (cached by content, so only new / edited FAQs hit the LLM) ─────
+    if args.paraphrase:
+        generated, failed = asyncio.run(generate_missing(zip(questions, answers)))
+        print(f"Paraphrases: {generated} generated, {failed} failed (those serve the stored answer)")
+
+    # ───── Publish as a new index generation ─────
+    with write_lock():
+        gen_path = write_generation(index, index_params, bm25, questions, answers, valid_faqs, embeddings)
+        publish(gen_path)
+
+    index_bytes = os.path.getsize(os.path.join(gen_path, "index.faiss"))
+    print(f"Generation published → {gen_path}")
+    print(f"FAISS {index_bytes / 1e6:.1f} MB vs {embeddings.nbytes / 1e6:.1f} MB raw float32")
+    print("\nSUCCESS! Indexes built perfectly.")
+    print("Running servers pick up the new generation automatically.")
+    print("Now run: uvicorn app.main:app --reload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+# backend/app/rag/context_packer.py
+#
+# Builds the LLM context from the retrieved chunks within a per-model token budget:
+#   1. near-duplicate chunks are dropped (word-set Jaccard ≥ CONTEXT_DEDUP_THRESHOLD
+#      against a chunk already kept — higher fused score wins)
+#   2. answers longer than CONTEXT_CHUNK_MAX_TOKENS keep only their most
+#      query-relevant sentences (IDF-weighted query-term overlap), in original order
+#   3. chunks are packed greedily by fused score until the budget is spent
+#
+# Tokens are counted with the target model's tokenizer (CONTEXT_TOKENIZERS: a
+# tokenizer.json path or HF hub id per model). Without one, ~4 characters per token.
+import math
+import os
+import re
+import string
+from functools import lru_cache
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.rag import index_store
+
+log = get_logger("context")
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+_SEPARATOR = "\n\n"
+
+
+def _model_map(spec):
+    """'model=value,model2=value2' → dict (model names may contain ':', e.g. gemma3:4b)."""
+    out = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, value = item.rsplit("=", 1)
+            out[model.strip()] = value.strip()
+    return out
+
+
+def token_budget(model):
+    budget = _model_map(settings.CONTEXT_MODEL_BUDGETS).get(model)
+    return int(budget) if budget else settings.CONTEXT_TOKEN_BUDGET
+
+
+class TokenCounter:
+    def __init__(self, tokenizer=None, name="chars/4"):
+        self.tokenizer = tokenizer
+        self.name = name
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self.tokenizer is None:
+            return math.ceil(len(text) / 4)
+        return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+
+
+@lru_cache(maxsize=8)
+def token_counter(model):
+    spec = _model_map(settings.CONTEXT_TOKENIZERS).get(model)
+    if not spec:
+        return TokenCounter()
+    try:
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_file(spec) if os.path.exists(spec) else Tokenizer.from_pretrained(spec)
+        return TokenCounter(tokenizer, name=spec)
+    except Exception as e:
+        log.warning(f"[CONTEXT] Tokenizer {spec} for {model} unavailable ({e}) — estimating ~4 chars/token")
+        return TokenCounter()
+
+
+def _words(text):
+    return {w.strip(string.punctuation) for w in index_store.tokenize(text)} - {""}
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _term_weights(query, bm25):
+    weights = {}
+    for term in _words(query):
+        tid = bm25.term_id(term) if bm25 is not None else -1
+        weights[term] = float(bm25.idf[tid]) if tid >= 0 else 1.0
+    return weights
+
+
+def trim_answer(answer, weights, counter, max_tokens):
+    """Best-matching sentences (kept in original order) that fit `max_tokens`."""
+    if counter.count(answer) <= max_tokens:
+        return answer, False
+    sentences = [s.strip() for s in _SENTENCE_RE.split(answer) if s.strip()]
+    ranked = sorted(
+        range(len(sentences)),
+        key=lambda i: (-sum(weights.get(w, 0.0) for w in _words(sentences[i])), i),
+    )
+    keep, used = [], 0
+    for i in ranked:
+        cost = counter.count(sentences[i]) + 1
+        if used + cost <= max_tokens:
+            keep.append(i)
+            used += cost
+    if not keep:  # one huge sentence — cut it to the budget instead of dropping the chunk
+        words = sentences[ranked[0]].split()
+        while words and counter.count(" ".join(words)) > max_tokens:
+            words = words[: max(1, len(words) * 3 // 4)] if len(words) > 1 else []
+        return " ".join(words), True
+    return " ".join(sentences[i] for i in sorted(keep)), True
+
+
+def _block(r, answer):
+    return f"Q: {r['question']}\nA: {answer}"
+
+
+def naive_context(results):
+    return _SEPARATOR.join(_block(r, r["answer"]) for r in results)
+
+
+def pack_context(query, results, model, bm25=None):
+    """
+    results: hybrid_search output. Returns (context, report); `bm25` (the served
+    generation's) supplies the IDF weights for sentence trimming.
+    """
+    counter = token_counter(model)
+    budget = token_budget(model)
+    weights = _term_weights(query, bm25)
+    sep_tokens = counter.count(_SEPARATOR)
+
+    blocks, seen, duplicates, trimmed, used = [], [], 0, 0, 0
+    for r in sorted(results, key=lambda r: -r["score"]):
+        words = _words(f"{r['question']} {r['answer']}")
+        if any(_jaccard(words, other) >= settings.CONTEXT_DEDUP_THRESHOLD for other in seen):
+            duplicates += 1
+            continue
+        seen.append(words)
+
+        answer, was_trimmed = trim_answer(r["answer"], weights, counter, settings.CONTEXT_CHUNK_MAX_TOKENS)
+        block = _block(r, answer)
+        cost = counter.count(block) + (sep_tokens if blocks else 0)
+        if used + cost > budget:
+            if blocks:
+                continue  # a smaller, lower-scored chunk may still fit
+            # Never send an empty context: squeeze the best chunk into the budget
+            room = budget - counter.count(_block(r, ""))
+            answer, was_trimmed = trim_answer(r["answer"], weights, counter, max(0, room))
+            block = _block(r, answer)
+            cost = counter.count(block)
+        blocks.append((r["id"], block))
+        used += cost
+        trimmed += was_trimmed
+
+    context = _SEPARATOR.join(block for _, block in blocks)
+    report = {
+        "model": model,
+        "tokenizer": counter.name,
+        "budget": budget,
+        "chunks_in": len(results),
+        "chunks_used": len(blocks),
+        "duplicates_dropped": duplicates,
+        "answers_trimmed": trimmed,
+        "context_ids": [i for i, _ in blocks],
+    }
+    return context, report
@@ -0,0 +1,99 @@
+# backend/app/rag/corpus_store.py
+#
+# Columnar, memory-mapped corpus: each string column is one UTF-8 byte arena
+# (<name>.bin) plus an int64 offsets array (<name>.offsets.npy, n + 1 entries).
+# Opening is O(1) — nothing is decoded until a row is actually read, and the
+# pages are shared between processes through the OS page cache.
+import json
+import os
+from array import array
+
+import numpy as np
+
+
+class StringArena:
+    """Read-only list-like view over an offset-indexed UTF-8 arena."""
+
+    def __init__(self, data, offsets, as_json=False):
+        # Plain ndarray views of the mapping: same pages, without np.memmap's per-slice overhead
+        self._data = data.view(np.ndarray) if isinstance(data, np.memmap) else data
+        self._offsets = offsets.view(np.ndarray) if isinstance(offsets, np.memmap) else offsets
+        self._as_json = as_json
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _raw(self, i):
+        return bytes(self._data[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        raw = self._raw(i)
+        return json.loads(raw) if self._as_json else raw
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def find(self, s):
+        """Binary search — only valid for arenas written from a sorted list. Returns index or -1."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            cur = self._raw(mid)
+            if cur < s:
+                lo = mid + 1
+            elif cur > s:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    @property
+    def nbytes(self):
+        return int(len(self._data) + self._offsets.nbytes)
+
+    # ───── persistence ─────
+    @staticmethod
+    def write(path_prefix, strings, as_json=False):
+        """`strings` may be any iterable (e.g. a generator over ingest shards) — rows are streamed."""
+        lengths = array("q", [0])
+        with open(path_prefix + ".bin", "wb") as f:
+            for s in strings:
+                b = (json.dumps(s, ensure_ascii=False) if as_json else str(s)).encode("utf-8")
+                f.write(b)
+                lengths.append(len(b))
+        np.save(path_prefix + ".offsets.npy", np.cumsum(np.frombuffer(lengths, dtype=np.int64)))
+
+    @classmethod
+    def open(cls, path_prefix, as_json=False, mmap=True):
+        offsets = np.load(path_prefix + ".offsets.npy", mmap_mode="r" if mmap else None)
+        if os.path.getsize(path_prefix + ".bin") == 0:
+            data = np.zeros(0, dtype=np.uint8)  # np.memmap can't map an empty file
+        elif mmap:
+            data = np.memmap(path_prefix + ".bin", dtype=np.uint8, mode="r")
+        else:
+            data = np.fromfile(path_prefix + ".bin", dtype=np.uint8)
+        return cls(data, offsets, as_json=as_json)
+
+
+# ───── corpus columns ─────
+def write_corpus(corpus_dir, questions, answers, faqs):
+    os.makedirs(corpus_dir, exist_ok=True)
+    StringArena.write(os.path.join(corpus_dir, "questions"), questions)
+    StringArena.write(os.path.join(corpus_dir, "answers"), answers)
+    StringArena.write(os.path.join(corpus_dir, "faqs"), faqs, as_json=True)
+
+
+def open_corpus(corpus_dir, mmap=True):
+    """(questions, answers, faqs) as lazy, memory-mapped columns."""
+    return (
+        StringArena.open(os.path.join(corpus_dir, "questions"), mmap=mmap),
+        StringArena.open(os.path.join(corpus_dir, "answers"), mmap=mmap),
+        StringArena.open(os.path.join(corpus_dir, "faqs"), as_json=True, mmap=mmap),
+    )
@@ -0,0 +1,128 @@
+# backend/app/rag/embed_batcher.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from app.core.log import get_logger
+
+log = get_logger("embed_batcher")
+
+
+class EmbeddingBatcher:
+    """
+    Collects query texts from concurrent requests and encodes them in ONE
+    SentenceTransformer.encode call. A batch is dispatched when it reaches
+    `max_batch_size` or when its oldest query has waited `max_wait_ms`.
+    """
+
+    def __init__(self, encode_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn          # list[str] -> np.ndarray (n, dim)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.total_wait = 0.0
+        self.max_wait_seen = 0.0
+        self.total_encode = 0.0
+        self.errors = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """Queue one query; the Future resolves to its (dim,) float32 vector."""
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((text, fut, time.perf_counter()))
+        return fut
+
+    def encode(self, text: str):
+        return self.submit(text).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())  # drain what's already queued
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._dispatch(batch)
+            except Exception as e:
+                # Never let one bad batch end the thread — every later query would wait forever
+                log.warning(f"[EMBED] batch of {len(batch)} failed: {e!r}")
+                for _, fut, _ in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _dispatch(self, batch):
+        # Marks each Future running; ones cancelled while queued (client went away) are dropped,
+        # and a running Future can't be cancelled any more, so setting its result below is safe
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = [text for text, _, _ in batch]
+        dispatched = time.perf_counter()
+        waits = [dispatched - enqueued for _, _, enqueued in batch]
+
+        try:
+            vectors = np.asarray(self.encode_fn(texts), dtype=np.float32)
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+            return
+        encode_time = time.perf_counter() - dispatched
+
+        for i, (_, fut, _) in enumerate(batch):
+            fut.set_result(vectors[i])
+
+        with self._stats_lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.total_wait += sum(waits)
+            self.max_wait_seen = max(self.max_wait_seen, max(waits))
+            self.total_encode += encode_time
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "batches": self.batches,
+                "queries": self.items,
+                "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max_batch_seen": self.max_batch_seen,
+                "avg_wait_ms": round(self.total_wait / self.items * 1000, 3) if self.items else 0.0,
+                "max_wait_ms_seen": round(self.max_wait_seen * 1000, 3),
+                "avg_encode_ms": round(self.total_encode / self.batches * 1000, 3) if self.batches else 0.0,
+                "queue_depth": self._queue.qsize(),
+                "errors": self.errors,
+            }
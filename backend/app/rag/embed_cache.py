@@ -0,0 +1,253 @@
+# backend/app/rag/embed_cache.py
+#
+# Content-addressed cache of document embeddings, so rebuilding the indexes only
+# encodes questions that are new or changed.
+#
+#   <EMBED_CACHE_DIR>/<model id>/
+#     keys.bin      16-byte digests, one per row  (blake2b of model id + normalized text)
+#     vectors.f32   float32 rows, memory-mapped
+#     meta.json     {model, dim, rows} — rows is the committed count (written last),
+#                   so a crash mid-append just leaves ignorable bytes at the end
+#
+# Both data files are append-only; lookups are a vectorized searchsorted over the
+# sorted key column, which is kept in memory and only merges rows appended since
+# the last look (never re-read + re-sorted per append). Writers that add many small
+# batches (ingest workers) stage them with commit=False and flush() once.
+import fcntl
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.core.config import settings
+from app.rag.index_store import DATA_DIR
+
+KEY_BYTES = 16
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+def model_id(backend) -> str:
+    """Backend + model: torch and ONNX vectors for the same text are close, not identical."""
+    return f"{backend.name}:{backend.model_name}"
+
+
+def default_cache_dir():
+    return settings.EMBED_CACHE_DIR or os.path.join(DATA_DIR, "embed_cache")
+
+
+class EmbeddingCache:
+    def __init__(self, root, model, dim):
+        self.model = model
+        self.dim = dim
+        self.path = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]+", "_", model))
+        os.makedirs(self.path, exist_ok=True)
+        self._keys_path = os.path.join(self.path, "keys.bin")
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._meta_path = os.path.join(self.path, "meta.json")
+        self._load()
+
+    def _read_meta(self):
+        if not os.path.exists(self._meta_path):
+            return 0
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("dim") != self.dim or meta.get("model") != self.model:
+            raise ValueError(f"Embedding cache at {self.path} is for {meta}, not {self.model} ({self.dim}d)")
+        self.sec_per_text = meta.get("sec_per_text")
+        return int(meta["rows"])
+
+    def _load(self):
+        """Full read + sort of the key column — once at open (or if the cache was wiped underneath us)."""
+        self.sec_per_text = None
+        self.rows = 0
+        self._order = np.zeros(0, dtype=np.int64)
+        self._sorted_keys = np.zeros(0, dtype=f"S{KEY_BYTES}")
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self._staged_keys, self._staged_vectors = [], []
+        self._staged_sorted = np.zeros(0, dtype=f"S{KEY_BYTES}")
+        self._staged_order = np.zeros(0, dtype=np.int64)
+        self._staged_sec = None
+        self._refresh()
+
+    def _refresh(self):
+        """Pick up rows committed since we last looked (by us or another process): only the new tail is read."""
+        rows = self._read_meta()
+        if rows < self.rows:  # cache deleted / rebuilt meanwhile
+            self._load()
+            return
+        if rows == self.rows:
+            return
+        new = np.fromfile(self._keys_path, dtype=f"S{KEY_BYTES}", count=rows - self.rows, offset=self.rows * KEY_BYTES)
+        order = np.argsort(new, kind="stable")
+        new_sorted = new[order]
+        pos = np.searchsorted(self._sorted_keys, new_sorted)
+        self._sorted_keys = np.insert(self._sorted_keys, pos, new_sorted)
+        self._order = np.insert(self._order, pos, order + self.rows)
+        self.rows = rows
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def keys_for(self, texts):
+        prefix = self.model.encode("utf-8") + b"\0"
+        return np.array(
+            [hashlib.blake2b(prefix + normalize_text(t).encode("utf-8"), digest_size=KEY_BYTES).digest() for t in texts],
+            dtype=f"S{KEY_BYTES}",
+        )
+
+    @staticmethod
+    def _search(sorted_keys, order, keys):
+        if not len(sorted_keys) or not len(keys):
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return np.where(sorted_keys[pos] == keys, order[pos], -1)
+
+    def lookup(self, keys):
+        """
+        Row of every key in the cache, -1 where missing. Rows past `self.rows` are
+        staged (add(commit=False)) and not on disk yet — pass them straight to vectors().
+        """
+        rows = self._search(self._sorted_keys, self._order, keys)
+        if len(self._staged_sorted):
+            staged = self._search(self._staged_sorted, self._staged_order, keys)
+            rows = np.where((rows < 0) & (staged >= 0), staged + self.rows, rows)
+        return rows
+
+    def vectors(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        committed = rows < self.rows
+        if committed.all():
+            return np.asarray(self._vectors[rows], dtype=np.float32)
+        out = np.empty((len(rows), self.dim), dtype=np.float32)
+        out[committed] = self._vectors[rows[committed]]
+        out[~committed] = np.concatenate(self._staged_vectors)[rows[~committed] - self.rows]
+        return out
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.path, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def add(self, keys, vectors, sec_per_text=None, commit=True):
+        """
+        Add new (key, vector) rows. Safe against concurrent writers and crashes.
+        commit=False only stages them in memory (lookups see them) until flush():
+        one append + fsync per batch instead of per call.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        new = self.lookup(keys) == -1
+        keys, vectors = keys[new], vectors[new]
+        _, first = np.unique(keys, return_index=True)  # duplicates within this batch
+        keys, vectors = keys[np.sort(first)], vectors[np.sort(first)]
+        if len(keys):
+            self._staged_keys.append(keys)
+            self._staged_vectors.append(vectors)
+            staged = np.concatenate(self._staged_keys)
+            self._staged_order = np.argsort(staged, kind="stable")
+            self._staged_sorted = staged[self._staged_order]
+            self._staged_sec = sec_per_text or self._staged_sec
+        if commit:
+            self.flush()
+        return len(keys)
+
+    def flush(self):
+        """Commit staged rows: one append per file, one fsync each, then meta.json. Returns rows written."""
+        if not self._staged_keys:
+            return 0
+        keys = np.concatenate(self._staged_keys)
+        vectors = np.concatenate(self._staged_vectors)
+        sec_per_text = self._staged_sec
+        self._staged_keys, self._staged_vectors = [], []
+        self._staged_sorted = np.zeros(0, dtype=f"S{KEY_BYTES}")
+        self._staged_order = np.zeros(0, dtype=np.int64)
+        self._staged_sec = None
+        with self._lock():
+            self._refresh()  # another process may have appended since we last looked
+            new = self.lookup(keys) == -1
+            keys, vectors = keys[new], vectors[new]
+            if not len(keys):
+                return 0
+            for path, data, size in ((self._keys_path, keys, KEY_BYTES), (self._vectors_path, vectors, self.dim * 4)):
+                with open(path, "ab") as f:
+                    f.truncate(self.rows * size)  # drop bytes of an interrupted append
+                    f.write(data.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+            tmp = self._meta_path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({
+                    "model": self.model, "dim": self.dim, "rows": self.rows + len(keys),
+                    "sec_per_text": sec_per_text or self.sec_per_text,  # for "time saved" on full hits
+                }, f)
+            os.replace(tmp, self._meta_path)
+            self._refresh()
+        return len(keys)
+
+    @property
+    def nbytes(self):
+        return self.rows * (KEY_BYTES + self.dim * 4)
+
+
+class CachedEncoder:
+    """Drop-in for backend.encode(texts) that only encodes cache misses."""
+
+    def __init__(self, backend, cache=None, commit=True):
+        self.backend = backend
+        self.commit = commit  # False → new vectors are staged until flush()
+        self.cache = cache or EmbeddingCache(default_cache_dir(), model_id(backend), backend.dim)
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def encode(self, texts, batch_size=32):
+        texts = list(texts)
+        keys = self.cache.keys_for(texts)
+        rows = self.cache.lookup(keys)
+        out = np.empty((len(texts), self.backend.dim), dtype=np.float32)
+
+        hit = rows >= 0
+        if hit.any():
+            out[hit] = self.cache.vectors(rows[hit])
+        missing = np.flatnonzero(~hit)
+        if len(missing):
+            # Repeated texts within one call are encoded once
+            _, first, inverse = np.unique(keys[missing], return_index=True, return_inverse=True)
+            started = time.perf_counter()
+            encoded = self.backend.encode([texts[missing[i]] for i in first], batch_size=batch_size)
+            elapsed = time.perf_counter() - started
+            self.encode_seconds += elapsed
+            out[missing] = encoded[inverse.reshape(-1)]
+            self.cache.add(keys[missing[first]], encoded, sec_per_text=elapsed / len(first), commit=self.commit)
+
+        self.hits += int(hit.sum())
+        self.misses += len(missing)
+        return out
+
+    def flush(self):
+        return self.cache.flush()
+
+    def report(self):
+        total = self.hits + self.misses
+        per_text = self.encode_seconds / self.misses if self.misses else self.cache.sec_per_text
+        return {
+            "texts": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "encode_seconds": round(self.encode_seconds, 2),
+            # Estimated from this run's encode rate (or the last run's, when everything hit)
+            "seconds_saved": round(per_text * self.hits, 2) if per_text is not None else None,
+            "cache_rows": self.cache.rows,
+            "cache_mb": round(self.cache.nbytes / 1e6, 1),
+            "cache_path": self.cache.path,
+        }
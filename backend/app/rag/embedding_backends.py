@@ -0,0 +1,165 @@
+# backend/app/rag/embedding_backends.py
+#
+# Pluggable sentence-embedding backends, selected with settings.EMBEDDING_BACKEND:
+#   torch      SentenceTransformer (PyTorch) — the reference
+#   onnx       ONNX Runtime export of the same transformer (app/rag/export_onnx.py)
+#   onnx_int8  same export, dynamically int8-quantized weights
+#
+# Every backend returns L2-normalized float32 vectors, so build_index.py, the
+# incremental updates and hybrid_retriever all get interchangeable embeddings.
+# The ONNX backends only read local files (model*.onnx + tokenizer.json).
+import json
+import os
+import time
+
+import numpy as np
+
+from app.core.config import settings
+from app.rag.index_store import DATA_DIR
+
+BACKENDS = ("torch", "onnx", "onnx_int8")
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+CONFIG_FILE = "backend.json"
+
+
+def default_onnx_dir(model_name=None):
+    """app/data/models/<model basename> unless EMBEDDING_ONNX_DIR says otherwise."""
+    if settings.EMBEDDING_ONNX_DIR and model_name is None:
+        return settings.EMBEDDING_ONNX_DIR
+    name = (model_name or settings.EMBEDDING_MODEL).rstrip("/").split("/")[-1]
+    return os.path.join(DATA_DIR, "models", name)
+
+
+class TorchBackend:
+    name = "torch"
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer  # heavy (torch) → imported lazily
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size=None):
+        return self.model.encode(
+            list(texts),
+            batch_size=batch_size or max(1, len(texts)),
+            convert_to_numpy=True,
+            normalize_embeddings=True
+        ).astype(np.float32, copy=False)
+
+    def describe(self):
+        return {"backend": self.name, "model": self.model_name, "dim": self.dim}
+
+
+class OnnxBackend:
+    """Tokenizer (HF `tokenizers`) → ONNX transformer → mean pooling → L2 normalize."""
+
+    def __init__(self, model_dir, quantized=False, threads=0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        self.name = "onnx_int8" if quantized else "onnx"
+        self.model_dir = model_dir
+        config_path = os.path.join(model_dir, CONFIG_FILE)
+        if not os.path.exists(config_path):
+            raise FileNotFoundError(
+                f"No ONNX export at {model_dir} — run `python app/rag/export_onnx.py` first"
+            )
+        with open(config_path, "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.model_name = self.config["model"]
+        self.dim = self.config["dim"]
+        self.model_path = os.path.join(model_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.output_name = self.session.get_outputs()[0].name  # last_hidden_state
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+    def encode(self, texts, batch_size=64):
+        texts = list(texts)
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+            feeds = {"input_ids": np.array([e.ids for e in encoded], dtype=np.int64), "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.array([e.type_ids for e in encoded], dtype=np.int64)
+            hidden = self.session.run([self.output_name], feeds)[0]          # (batch, seq, dim)
+
+            # Mean pooling over real tokens (same as sentence-transformers' Pooling module)
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            out[start:start + len(encoded)] = pooled
+        return out
+
+    def describe(self):
+        return {
+            "backend": self.name,
+            "model": self.model_name,
+            "dim": self.dim,
+            "file": os.path.basename(self.model_path),
+            "file_mb": round(os.path.getsize(self.model_path) / 1e6, 1),
+        }
+
+
+def load_backend(name=None, model_name=None, onnx_dir=None, threads=None):
+    """The embedding backend configured in Settings (or an explicit one, e.g. for parity checks)."""
+    name = name or settings.EMBEDDING_BACKEND
+    if name == "torch":
+        return TorchBackend(model_name or settings.EMBEDDING_MODEL)
+    if name in ("onnx", "onnx_int8"):
+        return OnnxBackend(
+            onnx_dir or default_onnx_dir(model_name),
+            quantized=(name == "onnx_int8"),
+            threads=settings.EMBEDDING_THREADS if threads is None else threads,
+        )
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {name!r} — expected one of {BACKENDS}")
+
+
+# ───── parity ─────
+def encode_latency_ms(backend, queries, repeats=3):
+    """Median single-query encode latency — the shape hybrid_search sees."""
+    backend.encode(queries[:1])  # warm-up
+    timings = []
+    for _ in range(repeats):
+        for q in queries:
+            started = time.perf_counter()
+            backend.encode([q])
+            timings.append((time.perf_counter() - started) * 1000)
+    return float(np.median(timings))
+
+
+def check_parity(reference, candidate, faiss_index, queries, k=5, min_cosine=0.98, min_overlap=0.9):
+    """
+    Does `candidate` find the same FAQs as `reference`? Compares embeddings (cosine)
+    and the top-k FAISS neighbours of every query. Returns (report, ok).
+    """
+    ref = reference.encode(queries)
+    cand = candidate.encode(queries)
+    cosine = np.sum(ref * cand, axis=1)
+
+    _, ref_ids = faiss_index.search(ref, k)
+    _, cand_ids = faiss_index.search(cand, k)
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(ref_ids.tolist(), cand_ids.tolist())]
+    top1 = float(np.mean(ref_ids[:, 0] == cand_ids[:, 0]))
+
+    report = {
+        "backend": candidate.name,
+        "queries": len(queries),
+        "cosine_min": round(float(cosine.min()), 5),
+        "cosine_mean": round(float(cosine.mean()), 5),
+        "top1_agreement": round(top1, 4),
+        f"top{k}_overlap": round(float(np.mean(overlap)), 4),
+    }
+    ok = report["cosine_min"] >= min_cosine and np.mean(overlap) >= min_overlap
+    return report, bool(ok)
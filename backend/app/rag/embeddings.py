@@ -1,9 +1,12 @@
-from sentence_transformers import SentenceTransformer
+from functools import lru_cache
 
+
+@lru_cache(maxsize=1)
 def get_embedding_model():
+    # Imported + loaded on first use, not at import time
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
 
-embedder = get_embedding_model()
 
 def embed_text(texts):
-    return embedder.encode(texts, normalize_embeddings=True).tolist()
+    return get_embedding_model().encode(texts, normalize_embeddings=True).tolist()
@@ -0,0 +1,119 @@
+# backend/app/rag/export_onnx.py
+# Export the embedding model for the ONNX backends, then check they retrieve the
+# same FAQs as PyTorch against the live FAISS index:
+#   python app/rag/export_onnx.py                  # export + int8 quantize + parity
+#   python app/rag/export_onnx.py --parity-only    # re-run the parity check
+# Afterwards set EMBEDDING_BACKEND=onnx (or onnx_int8) for the server AND build_index.py.
+import argparse
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.core.config import settings
+from app.rag import index_store
+from app.rag.embedding_backends import (
+    CONFIG_FILE, ONNX_FILE, ONNX_INT8_FILE, TorchBackend, check_parity,
+    default_onnx_dir, encode_latency_ms, load_backend,
+)
+
+
+def export(model_name, out_dir, opset):
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    reference = TorchBackend(model_name)
+    st_model = reference.model
+    pooling = st_model[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        sys.exit(f"{model_name} doesn't use mean pooling — the ONNX backend only implements mean pooling")
+
+    os.makedirs(out_dir, exist_ok=True)
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    dummy = tokenizer(["export the embedding model"], return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in dummy]
+    dynamic_axes = {n: {0: "batch", 1: "seq"} for n in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    onnx_path = os.path.join(out_dir, ONNX_FILE)
+    print(f"Exporting {model_name} → {onnx_path}")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(dummy[n] for n in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    int8_path = os.path.join(out_dir, ONNX_INT8_FILE)
+    print(f"Quantizing (dynamic int8) → {int8_path}")
+    quantize_dynamic(onnx_path, int8_path, weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)  # writes tokenizer.json (fast tokenizer)
+    config = {
+        "model": model_name,
+        "dim": reference.dim,
+        "max_seq_length": st_model.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "pooling": "mean",
+        "normalize": True,
+        "opset": opset,
+    }
+    with open(os.path.join(out_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+    for path in (onnx_path, int8_path):
+        print(f"  {os.path.basename(path)}: {os.path.getsize(path) / 1e6:.1f} MB")
+    return reference
+
+
+def parity(reference, model_name, out_dir, k, sample):
+    gen = index_store.load_current()
+    alive = [i for i in range(len(gen.questions)) if gen.is_alive(i)]
+    queries = [gen.questions[i] for i in alive[:: max(1, len(alive) // sample)]][:sample]
+    print(f"\nParity vs {reference.name} on {len(queries)} questions from {gen.gen_id} (top-{k})")
+
+    all_ok = True
+    baseline_ms = encode_latency_ms(reference, queries[:50])
+    print(f"  torch      encode {baseline_ms:6.2f} ms/query")
+    for name in ("onnx", "onnx_int8"):
+        candidate = load_backend(name, model_name=model_name, onnx_dir=out_dir)
+        report, ok = check_parity(reference, candidate, gen.faiss_index, queries, k=k)
+        ms = encode_latency_ms(candidate, queries[:50])
+        report.update({"encode_ms": round(ms, 2), "speedup": round(baseline_ms / ms, 2), **candidate.describe()})
+        print(f"  {name:<10} encode {ms:6.2f} ms/query ({baseline_ms / ms:.1f}x) → {'OK' if ok else 'MISMATCH'}")
+        print("    " + json.dumps(report))
+        all_ok &= ok
+    return all_ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export + quantize the embedding model for ONNX Runtime")
+    parser.add_argument("--model", default=settings.EMBEDDING_MODEL)
+    parser.add_argument("--out", default=None, help="defaults to app/data/models/<model>")
+    parser.add_argument("--opset", type=int, default=14)
+    parser.add_argument("--parity-only", action="store_true")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--sample", type=int, default=200, help="questions used for the parity check")
+    args = parser.parse_args()
+
+    out_dir = args.out or default_onnx_dir(args.model)
+    reference = TorchBackend(args.model) if args.parity_only else export(args.model, out_dir, args.opset)
+
+    if index_store.read_current_id() is None:
+        print("No index generation yet — build one with build_index.py, then run --parity-only")
+        return
+    if not parity(reference, args.model, out_dir, args.k, args.sample):
+        sys.exit("ONNX embeddings retrieve different FAQs than PyTorch — don't switch EMBEDDING_BACKEND")
+    print("\nParity OK → set EMBEDDING_BACKEND=onnx or onnx_int8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# backend/app/rag/faiss_factory.py
+import json
+import math
+import os
+
+import faiss
+import numpy as np
+
+# index_type → what gets built (all L2 over normalized MiniLM vectors)
+#   flat     exact search, float32 (the original IndexFlatL2)
+#   ivf_flat inverted lists, float32          → tune with nprobe
+#   hnsw     graph, float32                   → tune with efSearch
+#   ivf_pq   inverted lists + product quant.  → tune with nprobe, ~16-32x smaller
+#   sq_fp16  scalar-quantized fp16, exact scan, 2x smaller
+#   sq8      scalar-quantized int8, exact scan, 4x smaller
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq_fp16", "sq8")
+
+MIN_POINTS_PER_CENTROID = 39  # below this FAISS k-means warns and clusters get noisy
+
+
+def _largest_divisor_at_most(dim, m):
+    for cand in range(min(m, dim), 0, -1):
+        if dim % cand == 0:
+            return cand
+    return 1
+
+
+def resolve_params(index_type, dim, n, nlist=1024, pq_m=48, pq_nbits=8, hnsw_m=32, hnsw_ef_construction=200):
+    """Clamp requested parameters to what the corpus size / dimension supports."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Pick one of {INDEX_TYPES}")
+
+    params = {"index_type": index_type, "dimension": dim, "metric": "L2"}
+
+    if index_type in ("ivf_flat", "ivf_pq"):
+        params["nlist"] = max(1, min(nlist, n // MIN_POINTS_PER_CENTROID))
+        if params["nlist"] != nlist:
+            print(f"nlist {nlist} → {params['nlist']} (only {n} training vectors)")
+
+    if index_type == "ivf_pq":
+        params["pq_m"] = _largest_divisor_at_most(dim, pq_m)
+        params["pq_nbits"] = max(1, min(pq_nbits, int(math.log2(max(n // MIN_POINTS_PER_CENTROID, 2)))))
+        if params["pq_m"] != pq_m or params["pq_nbits"] != pq_nbits:
+            print(f"PQ{pq_m}x{pq_nbits} → PQ{params['pq_m']}x{params['pq_nbits']} (dim={dim}, n={n})")
+
+    if index_type == "hnsw":
+        params["hnsw_m"] = hnsw_m
+        params["hnsw_ef_construction"] = hnsw_ef_construction
+
+    return params
+
+
+def factory_string(params):
+    index_type = params["index_type"]
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{params['nlist']},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{params['hnsw_m']}"
+    if index_type == "ivf_pq":
+        return f"IVF{params['nlist']},PQ{params['pq_m']}x{params['pq_nbits']}"
+    if index_type == "sq_fp16":
+        return "SQfp16"
+    return "SQ8"
+
+
+def create_faiss_index(train_vectors, index_type="flat", id_mapped=True, **kwargs):
+    """
+    Empty, trained index of the requested type. Returns (index, params).
+    Fill it with add / add_with_ids — all at once, or shard by shard (ingest.py).
+    """
+    train_vectors = np.ascontiguousarray(train_vectors, dtype=np.float32)
+    n, dim = train_vectors.shape
+    params = resolve_params(index_type, dim, n, **kwargs)
+    params["factory"] = factory_string(params)
+
+    index = faiss.index_factory(dim, params["factory"], faiss.METRIC_L2)
+    if index_type == "hnsw":
+        faiss.downcast_index(index).hnsw.efConstruction = params["hnsw_ef_construction"]
+
+    if not index.is_trained:
+        print(f"Training {params['factory']} on {n} vectors...")
+        index.train(train_vectors)
+
+    if id_mapped:
+        index = faiss.IndexIDMap2(index)
+        params["id_mapped"] = True
+    return index, params
+
+
+def build_faiss_index(embeddings, index_type="flat", ids=None, **kwargs):
+    """
+    Train + fill an index of the requested type. Returns (index, params).
+    With `ids`, the index is wrapped in IndexIDMap2 so vectors keep stable
+    FAQ ids across incremental add / update / delete.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index, params = create_faiss_index(embeddings, index_type, id_mapped=ids is not None, **kwargs)
+    if ids is not None:
+        index.add_with_ids(embeddings, np.asarray(ids, dtype=np.int64))
+    else:
+        index.add(embeddings)
+    params["ntotal"] = int(index.ntotal)
+    return index, params
+
+
+def supports_remove(params):
+    """HNSW graphs can't delete vectors in place — they get rebuilt from stored vectors."""
+    return params.get("index_type", "flat") != "hnsw"
+
+
+def meta_path_for(index_path):
+    return os.path.splitext(index_path)[0] + ".meta.json"
+
+
+def write_index(index, params, index_path):
+    faiss.write_index(index, index_path)
+    params = dict(params, bytes=os.path.getsize(index_path))
+    with open(meta_path_for(index_path), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return params
+
+
+def read_meta(index_path):
+    """Build parameters recorded next to the index; pre-metadata builds were always Flat."""
+    path = meta_path_for(index_path)
+    if not os.path.exists(path):
+        return {"index_type": "flat", "factory": "Flat", "metric": "L2"}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def filtered_search_params(params, bitmap, n_ids, nprobe=None, ef_search=None):
+    """
+    Per-call SearchParameters restricting a search to the ids set in `bitmap`
+    (np.packbits(mask, bitorder="little")). Per-call parameters replace the index's
+    own nprobe / efSearch, so the runtime knobs are passed along explicitly.
+    """
+    sel = faiss.IDSelectorBitmap(n_ids, faiss.swig_ptr(bitmap))
+    index_type = params.get("index_type", "flat")
+    if index_type in ("ivf_flat", "ivf_pq"):
+        search_params = faiss.SearchParametersIVF(sel=sel, nprobe=min(int(nprobe or 1), params.get("nlist", 1)))
+    elif index_type == "hnsw":
+        search_params = faiss.SearchParametersHNSW(sel=sel, efSearch=int(ef_search or 16))
+    else:
+        search_params = faiss.SearchParameters(sel=sel)
+    search_params.bitmap_ref = (sel, bitmap)  # keep the selector and its buffer alive with the params
+    return search_params
+
+
+def apply_search_params(index, params, nprobe=None, ef_search=None):
+    """Set runtime recall/speed knobs that apply to this index type; returns what was set."""
+    ps = faiss.ParameterSpace()
+    applied = {}
+    index_type = params.get("index_type", "flat")
+    if nprobe and index_type in ("ivf_flat", "ivf_pq"):
+        nprobe = min(int(nprobe), params.get("nlist", nprobe))
+        ps.set_index_parameter(index, "nprobe", nprobe)
+        applied["nprobe"] = nprobe
+    if ef_search and index_type == "hnsw":
+        ps.set_index_parameter(index, "efSearch", int(ef_search))
+        applied["efSearch"] = int(ef_search)
+    return applied
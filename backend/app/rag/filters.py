@@ -0,0 +1,147 @@
+# backend/app/rag/filters.py
+#
+# Metadata filters (category, product, locale, tenant, ...) for hybrid_search.
+#
+# Each generation stores one dictionary-encoded column per FILTER_FIELDS entry:
+#   metadata/<field>.values.json   distinct values, code = position in the list
+#   metadata/<field>.codes.npy     int32 code per row (-1 = missing / deleted)
+#
+# filters={"category": "vpn", "locale": ["en", "de"]} → any of the values within a
+# field, all fields must match. A filter resolves to a Selection (sorted row ids +
+# bitmap), cached per generation, that the searches are restricted to up front.
+import json
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from app.core.config import settings
+
+SELECTION_CACHE_SIZE = 64
+
+
+def filter_fields():
+    return [f.strip() for f in settings.FILTER_FIELDS.split(",") if f.strip()]
+
+
+def _value(faq, field):
+    """Scalar metadata only — nested values can't be dictionary-encoded."""
+    if not isinstance(faq, dict):
+        return None
+    value = faq.get(field)
+    if value is None or isinstance(value, (dict, list)):
+        return None
+    return str(value)
+
+
+def write_metadata(meta_dir, faqs, fields=None):
+    """One streaming pass over `faqs` (a list or any iterable, e.g. an ingest column)."""
+    fields = filter_fields() if fields is None else fields
+    os.makedirs(meta_dir, exist_ok=True)
+    vocabs = {f: {} for f in fields}
+    codes = {f: array("i") for f in fields}
+    for faq in faqs:
+        for field in fields:
+            value = _value(faq, field)
+            codes[field].append(-1 if value is None else vocabs[field].setdefault(value, len(vocabs[field])))
+    for field in fields:
+        with open(os.path.join(meta_dir, f"{field}.values.json"), "w", encoding="utf-8") as f:
+            json.dump(list(vocabs[field]), f, ensure_ascii=False)
+        np.save(os.path.join(meta_dir, f"{field}.codes.npy"), np.frombuffer(codes[field], dtype=np.int32))
+
+
+class Selection:
+    """The rows a filter allows: sorted ids, a row mask, and a packed bitmap for FAISS."""
+
+    def __init__(self, mask):
+        self.mask = mask
+        self.ids = np.flatnonzero(mask)
+        self.bitmap = np.packbits(mask, bitorder="little")  # must outlive any IDSelectorBitmap on it
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class MetadataIndex:
+    def __init__(self, columns, n_rows):
+        self.columns = columns     # field → (values, {value: code}, codes)
+        self.n_rows = n_rows
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, meta_dir, n_rows):
+        columns = {}
+        for field in filter_fields():
+            values_path = os.path.join(meta_dir, f"{field}.values.json")
+            if not os.path.exists(values_path):
+                continue  # field added to FILTER_FIELDS after this generation was built
+            with open(values_path, "r", encoding="utf-8") as f:
+                values = json.load(f)
+            codes = np.load(os.path.join(meta_dir, f"{field}.codes.npy"), mmap_mode="r")
+            columns[field] = (values, {v: i for i, v in enumerate(values)}, codes)
+        return cls(columns, n_rows)
+
+    @classmethod
+    def from_faqs(cls, faqs):
+        """Generations built before metadata columns existed: encoded once, in memory."""
+        columns = {}
+        for field in filter_fields():
+            vocab = {}
+            codes = np.fromiter(
+                ((-1 if (v := _value(faq, field)) is None else vocab.setdefault(v, len(vocab))) for faq in faqs),
+                dtype=np.int32,
+            )
+            columns[field] = (list(vocab), vocab, codes)
+        return cls(columns, len(faqs))
+
+    @staticmethod
+    def normalize(filters):
+        """{field: value | [values]} → hashable cache key; empty filters → None."""
+        if not filters:
+            return None
+        key = []
+        for field, wanted in sorted(filters.items()):
+            wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+            key.append((field, tuple(sorted({str(v) for v in wanted if v is not None}))))
+        return tuple(key)
+
+    def validate(self, filters):
+        unknown = sorted(set(filters or {}) - set(self.columns))
+        if unknown:
+            raise ValueError(f"Unknown filter field(s) {unknown} — filterable: {sorted(self.columns)}")
+
+    def select(self, filters):
+        """Selection for `filters`, or None when nothing is filtered."""
+        key = self.normalize(filters)
+        if key is None:
+            return None
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        self.validate(filters)
+        mask = np.ones(self.n_rows, dtype=bool)
+        for field, wanted in key:
+            _, vocab, codes = self.columns[field]
+            wanted_codes = [vocab[v] for v in wanted if v in vocab]
+            mask &= np.isin(codes, wanted_codes) if wanted_codes else False
+        selection = Selection(mask)
+
+        with self._lock:
+            self._cache[key] = selection
+            while len(self._cache) > SELECTION_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return selection
+
+    def facets(self):
+        """field → {value: number of FAQs}, e.g. for building a filter UI."""
+        out = {}
+        for field, (values, _, codes) in self.columns.items():
+            counts = np.bincount(np.asarray(codes)[np.asarray(codes) >= 0], minlength=len(values))
+            out[field] = {v: int(c) for v, c in zip(values, counts) if c}
+        return out
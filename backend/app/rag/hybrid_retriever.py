@@ -1,112 +1,306 @@
 # backend/app/rag/hybrid_retriever.py
-import os
-import pickle
-import faiss
+import asyncio
+import heapq
+import threading
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.metrics import stage
+from app.rag.embed_batcher import EmbeddingBatcher
+from app.rag import index_store
+from app.rag.faiss_factory import apply_search_params, filtered_search_params
+from app.rag.embedding_backends import load_backend
 
-# PATHS
-CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(CURRENT_DIR, "..", "data")
-INDEX_PATH = os.path.join(DATA_DIR, "index.faiss")
-BM25_PATH = os.path.join(DATA_DIR, "bm25_index.pkl")
+log = get_logger("retriever")
 
-# Global variables (will be set after loading)
+# Global variables (will be set after loading — replaced wholesale on every hot swap)
+generation = None     # IndexGeneration currently served
 faiss_index = None
+faiss_meta = {}
 bm25 = None
 questions = []
 answers = []
 faqs = []
-embedder = None
+embedder = None       # embedding backend (torch / onnx / onnx_int8, see embedding_backends)
+index_version = None  # changes whenever a new index generation is swapped in
 
-# SAFE LOADING WITH FULL ERROR REPORT
-try:
-    print("Loading FAISS index...")
-    if not os.path.exists(INDEX_PATH):
-        raise FileNotFoundError(f"index.faiss NOT FOUND at {INDEX_PATH}")
+_swap_lock = threading.Lock()
+_reload_lock = threading.Lock()
+_last_reload_check = 0.0
+# Runtime FAISS knobs, re-applied to every generation that gets swapped in
+_search_overrides = {"nprobe": settings.FAISS_NPROBE, "ef_search": settings.FAISS_EF_SEARCH}
 
-    faiss_index = faiss.read_index(INDEX_PATH)
-    print(f"FAISS loaded: {faiss_index.ntotal} vectors")
 
-    print("Loading BM25 index...")
-    if not os.path.exists(BM25_PATH):
-        raise FileNotFoundError(f"bm25_index.pkl NOT FOUND at {BM25_PATH}")
+def swap_generation(new_gen):
+    """Atomically make `new_gen` the served index. In-flight searches finish on the old one."""
+    global generation, faiss_index, faiss_meta, bm25, questions, answers, faqs, index_version
+    search_params = apply_search_params(new_gen.faiss_index, new_gen.faiss_meta, **_search_overrides)
+    with _swap_lock:
+        generation = new_gen
+        faiss_index = new_gen.faiss_index
+        faiss_meta = new_gen.faiss_meta
+        bm25 = new_gen.bm25
+        questions = new_gen.questions
+        answers = new_gen.answers
+        faqs = new_gen.faqs
+        index_version = new_gen.version
+    log.info(f"[INDEX] Serving {new_gen.gen_id}: {faiss_index.ntotal} vectors "
+             f"({faiss_meta.get('factory', 'Flat')}) {search_params or ''}, {len(bm25.terms)} BM25 terms")
 
-    with open(BM25_PATH, "rb") as f:
-        bm25_data = pickle.load(f)
 
-    bm25 = bm25_data["bm25"]
-    questions = bm25_data["questions"]
-    answers = bm25_data["answers"]
-    faqs = bm25_data["faqs"]
+def reload_generation():
+    """Load whatever CURRENT points at and swap to it (blocking)."""
+    with _reload_lock:
+        new_gen = index_store.load_current()
+        if generation is None or new_gen.gen_id != generation.gen_id:
+            swap_generation(new_gen)
+    return generation
 
-    print(f"BM25 loaded: {len(questions)} FAQs")
 
-    print("Loading embedding model...")
-    embedder = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    print("Embedding model loaded")
+def _reload_in_background():
+    try:
+        reload_generation()
+    except Exception as e:
+        log.warning(f"[INDEX] Reload failed, still serving {generation.gen_id}: {e}")
 
-    print("\nHYBRID RETRIEVER FULLY LOADED AND READY!")
-    print("=" * 60)
 
-except Exception as e:
-    print("\nFATAL ERROR: RAG INDEXES FAILED TO LOAD!")
-    print(f"Error: {e}")
-    print("Traceback:")
-    traceback.print_exc()
-    print("\nFIX THIS NOW:")
-    print("1. Run: python app/rag/build_index.py")
-    print("2. Make sure faqs.json exists and has valid Q&A")
-    print("3. Restart the server")
-    print("=" * 60)
-    raise  # Crash the app — better than silent failure
+def current_generation():
+    """Served generation; every few seconds also checks whether CURRENT moved on."""
+    global _last_reload_check
+    if generation is None:
+        raise RuntimeError("RAG indexes are not loaded yet")
+    now = time.monotonic()
+    if now - _last_reload_check >= settings.INDEX_RELOAD_CHECK_SECONDS:
+        _last_reload_check = now
+        latest = index_store.read_current_id()
+        if latest and latest != generation.gen_id and not _reload_lock.locked():
+            threading.Thread(target=_reload_in_background, name="index-reload", daemon=True).start()
+    return generation
+
+
+# ───── Loading (driven by app.rag.lifecycle in the background, NOT at import) ─────
+def load_indexes():
+    log.info("Loading indexes...")
+    swap_generation(index_store.load_current())
+    log.info(f"Corpus loaded: {int(generation.alive.sum())} FAQs")
+
+
+def load_embedder():
+    global embedder
+    log.info(f"Loading embedding model ({settings.EMBEDDING_BACKEND} backend)...")
+    embedder = load_backend()
+    log.info(f"Embedding model loaded: {embedder.describe()}")
+    built_with = (generation.faiss_meta.get("embedding") or {}) if generation is not None else {}
+    if built_with and built_with.get("model") != embedder.model_name:
+        log.warning(f"[WARNING] Index was built with {built_with.get('model')}, serving with {embedder.model_name}")
+
+
+def warm_up():
+    """First encode + search pay one-off costs (kernels, page faults) — pay them before traffic."""
+    query_emb = np.asarray(encode_texts(["how do I reset my password"]), dtype=np.float32)
+    return hybrid_search("how do I reset my password", k=5, query_emb=query_emb)
+
+
+def set_search_params(nprobe=None, ef_search=None):
+    """Runtime recall/latency knobs: nprobe for IVF indexes, efSearch for HNSW."""
+    if nprobe:
+        _search_overrides["nprobe"] = nprobe
+    if ef_search:
+        _search_overrides["ef_search"] = ef_search
+    gen = current_generation()
+    return apply_search_params(gen.faiss_index, gen.faiss_meta, **_search_overrides)
+
+
+def encode_texts(texts):
+    """Normalized float32 embeddings for a list of texts (same settings as build_index)."""
+    return embedder.encode(texts)
+
+
+# Bounded pool for blocking retrieval work (FAISS / BM25 / unbatched encode),
+# so it never runs on the event loop
+retrieval_executor = ThreadPoolExecutor(
+    max_workers=settings.RETRIEVAL_WORKERS,
+    thread_name_prefix="retrieval",
+)
+
+# Micro-batches query embeddings across concurrent requests
+embed_batcher = EmbeddingBatcher(
+    encode_texts,
+    max_batch_size=settings.EMBED_BATCH_MAX_SIZE,
+    max_wait_ms=settings.EMBED_BATCH_MAX_WAIT_MS,
+)
+
+
+def embed_query(query: str):
+    """Normalized (1, dim) float32 query embedding, reusable across search + answer cache."""
+    if settings.EMBED_BATCH_ENABLED:
+        query_emb = embed_batcher.encode(query)
+    else:
+        query_emb = encode_texts([query])[0]
+    return np.expand_dims(query_emb, axis=0).astype(np.float32)
+
+
+async def embed_query_async(query: str):
+    """Same as embed_query, but awaits the batcher instead of blocking the event loop."""
+    with stage("embed"):  # includes the batcher's wait and the executor queue
+        if not settings.EMBED_BATCH_ENABLED:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(retrieval_executor, embed_query, query)
+        query_emb = await asyncio.wrap_future(embed_batcher.submit(query))
+        return np.expand_dims(query_emb, axis=0).astype(np.float32)
+
+
+def validate_filters(filters):
+    """Raises ValueError for fields that aren't indexed (FILTER_FIELDS) in the served generation."""
+    if filters:
+        current_generation().metadata.validate(filters)
+
+
+def _dense_search(gen, query_embs, n, selection=None):
+    """FAISS ids, shape (queries, n), -1 padded. With a Selection only its rows are searched."""
+    if selection is None:
+        return gen.faiss_index.search(query_embs, n)[1]
+    if len(selection) <= settings.FILTER_EXACT_MAX and gen.vectors is not None:
+        # Small slice: exact L2 over just its stored vectors — cheaper the smaller it gets
+        vecs = np.asarray(gen.vectors[selection.ids], dtype=np.float32)
+        dist = (vecs * vecs).sum(axis=1)[None, :] - 2 * (query_embs @ vecs.T)
+        kk = min(n, len(vecs))
+        part = np.argpartition(dist, kk - 1, axis=1)[:, :kk]
+        part = np.take_along_axis(part, np.take_along_axis(dist, part, axis=1).argsort(axis=1, kind="stable"), axis=1)
+        out = np.full((len(query_embs), n), -1, dtype=np.int64)
+        out[:, :kk] = selection.ids[part]
+        return out
+    # Large slice: FAISS skips everything outside the bitmap while it searches
+    params = filtered_search_params(gen.faiss_meta, selection.bitmap, len(selection.mask), **_search_overrides)
+    return gen.faiss_index.search(query_embs, n, params=params)[1]
+
+
+RRF_K = 60
+# Best possible fused score: rank 1 in both FAISS and BM25 → 1 / (1 + RRF_K)
+RRF_MAX_SCORE = 1.0 / (1 + RRF_K)
 
 
 # Hybrid search
-def hybrid_search(query: str, k: int = 5, alpha: float = 0.75):
-    query_emb = embedder.encode(query, convert_to_numpy=True, normalize_embeddings=True)
-    query_emb = np.expand_dims(query_emb, axis=0).astype(np.float32)
+def hybrid_search(query: str, k: int = 5, alpha: float = 0.75, query_emb=None, filters=None):
+    """
+    filters={"category": "vpn", "locale": ["en", "de"]} restricts FAISS and BM25 to
+    the matching FAQs up front (see app/rag/filters.py) — not retrieve-then-discard.
+    """
+    # Pin one generation for the whole search — a hot swap mid-query can't mix indexes
+    gen = current_generation()
+    questions, answers = gen.questions, gen.answers
+    selection = gen.metadata.select(filters) if filters else None
+    if selection is not None and len(selection) == 0:
+        return []
+
+    if query_emb is None:
+        with stage("embed"):
+            query_emb = embed_query(query)
 
     # FAISS
-    faiss_distances, faiss_indices = faiss_index.search(query_emb, k * 2)
-    faiss_scores = 1.0 / (1.0 + faiss_distances[0])
+    with stage("faiss"):
+        faiss_indices = _dense_search(gen, query_emb, k * 2, selection)
+
+    # BM25 — sparse scoring, top k*2 via argpartition
+    with stage("bm25"):
+        bm25_top, _ = gen.bm25.top_k(index_store.tokenize(query), k * 2, selection)
+
+    # RRF Fusion — only over the FAISS + BM25 candidates
+    with stage("fusion"):
+        fused = {}
+        rank = 1
+        for idx in faiss_indices[0]:
+            if idx < len(questions) and idx != -1:
+                fused[int(idx)] = fused.get(int(idx), 0.0) + alpha * (1.0 / (rank + RRF_K))
+                rank += 1
+
+        for rank, idx in enumerate(bm25_top, start=1):
+            fused[int(idx)] = fused.get(int(idx), 0.0) + (1 - alpha) * (1.0 / (rank + RRF_K))
+
+        top = heapq.nlargest(k, fused.items(), key=lambda item: item[1])
+        results = []
+        for idx, score in top:
+            if idx >= len(questions):
+                continue
+            results.append({
+                "id": idx,
+                "question": questions[idx],
+                "answer": answers[idx],
+                "score": round(float(score), 4),
+                "source": "faqs.json"
+            })
+
+    return results
+
+
+# Batch search — retrieval only, for offline jobs (triage, FAQ gap analysis)
+def batch_search(queries, k: int = 5, alpha: float = 0.75, query_embs=None, filters=None):
+    """
+    hybrid_search for many queries at once: one encode call, one multi-row FAISS
+    search, one sparse BM25 product and a vectorized RRF fusion. Returns a list of
+    result lists, identical to calling hybrid_search on each query. `filters`
+    apply to every query.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+    gen = current_generation()
+    selection = gen.metadata.select(filters) if filters else None
+    if selection is not None and len(selection) == 0:
+        return [[] for _ in queries]
+
+    if query_embs is None:
+        query_embs = encode_texts(queries)
+    query_embs = np.ascontiguousarray(query_embs, dtype=np.float32)
+    n_rows = len(gen.questions)
+    nq = len(queries)
+
+    # FAISS — rank only counts valid hits, like hybrid_search
+    faiss_indices = _dense_search(gen, query_embs, k * 2, selection)
+    valid = (faiss_indices != -1) & (faiss_indices < n_rows)
+    faiss_rank = np.cumsum(valid, axis=1)
+    f_q = np.repeat(np.arange(nq), faiss_indices.shape[1])[valid.ravel()]
+    f_doc = faiss_indices[valid]
+    f_score = alpha * (1.0 / (faiss_rank[valid] + RRF_K))
 
     # BM25
-    bm25_scores = np.array(bm25.get_scores(query.lower().split()))
-
-    # RRF Fusion
-    all_scores = np.zeros(len(questions))
-    rank = 1
-    for idx in faiss_indices[0]:
-        if idx < len(all_scores) and idx != -1:
-            all_scores[idx] += alpha * (1.0 / (rank + 60))
-            rank += 1
-
-    rank = 1
-    top_bm25 = np.argsort(-bm25_scores)[:k * 2]
-    for idx in top_bm25:
-        all_scores[idx] += (1 - alpha) * (1.0 / (rank + 60))
-        rank += 1
-
-    top_indices = np.argsort(-all_scores)[:k]
-    results = []
-    for idx in top_indices:
-        if idx >= len(questions):
-            continue
-        results.append({
-            "question": questions[idx],
-            "answer": answers[idx],
-            "score": round(float(all_scores[idx]), 4),
+    bm25_top = gen.bm25.top_k_batch([index_store.tokenize(q) for q in queries], k * 2, selection)
+    b_q = np.repeat(np.arange(nq), [len(docs) for docs, _ in bm25_top])
+    b_doc = np.concatenate([docs for docs, _ in bm25_top]).astype(np.int64)
+    b_rank = np.concatenate([np.arange(1, len(docs) + 1) for docs, _ in bm25_top]).astype(np.float64)
+    b_score = (1 - alpha) * (1.0 / (b_rank + RRF_K))
+
+    # RRF fusion over (query, doc) keys; ties keep first-seen order (FAISS, then BM25)
+    q = np.concatenate([f_q, b_q])
+    doc = np.concatenate([f_doc, b_doc])
+    contrib = np.concatenate([f_score, b_score])
+    keys, first, inverse = np.unique(q * n_rows + doc, return_index=True, return_inverse=True)
+    fused = np.bincount(inverse.reshape(-1), weights=contrib, minlength=len(keys))
+    key_q = keys // n_rows
+    order = np.lexsort((first, -fused, key_q))
+    key_q, key_doc, fused = key_q[order], (keys % n_rows)[order], fused[order]
+    group_start = np.searchsorted(key_q, np.arange(nq))
+    keep = (np.arange(len(key_q)) - group_start[key_q]) < k
+
+    results = [[] for _ in range(nq)]
+    for qi, idx, score in zip(key_q[keep].tolist(), key_doc[keep].tolist(), fused[keep].tolist()):
+        results[qi].append({
+            "id": idx,
+            "question": gen.questions[idx],
+            "answer": gen.answers[idx],
+            "score": round(score, 4),
             "source": "faqs.json"
         })
-
     return results
 
 
 if __name__ == "__main__":
+    # Smoke test against the published generation; benchmarks live in backend/benchmarks/
+    load_indexes()
+    load_embedder()
     print("Testing hybrid search...")
     results = hybrid_search("how to change password", k=3)
     for r in results:
-        print(f"{r['score:0.4f']} → {r['question']}")
+        print(f"{r['score']:0.4f} → {r['question']}")
@@ -0,0 +1,336 @@
+# backend/app/rag/index_store.py
+#
+# Versioned index generations:
+#   app/data/generations/gen-000001/  index.faiss, index.meta.json, vectors.npy,
+#                                     bm25/ (CSR postings as .npy), corpus/ (UTF-8 string arenas),
+#                                     metadata/ (dictionary-encoded filter columns),
+#                                     paraphrases.* (pre-generated answer rewordings, see paraphrases.py)
+#   app/data/CURRENT                  name of the live generation
+#
+# A published generation is never modified. Add / update / delete build the next
+# one from the previous (only changed questions are encoded), then CURRENT is
+# switched atomically and running servers hot-swap to it.
+import fcntl
+import json
+import os
+import pickle
+import shutil
+import time
+from contextlib import contextmanager
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.rag.sparse_bm25 import SparseBM25
+from app.rag.corpus_store import write_corpus, open_corpus
+from app.rag.faiss_factory import build_faiss_index, write_index, read_meta, supports_remove
+from app.rag.filters import MetadataIndex, write_metadata
+from app.rag.paraphrases import open_paraphrases, write_paraphrases
+
+log = get_logger("index")
+
+# PATHS
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.abspath(os.path.join(CURRENT_DIR, "..", "data"))
+GENERATIONS_DIR = os.path.join(DATA_DIR, "generations")
+CURRENT_FILE = os.path.join(DATA_DIR, "CURRENT")
+LOCK_FILE = os.path.join(DATA_DIR, ".index.lock")
+
+# Pre-generation layout (single set of files, rebuilt in place)
+LEGACY_INDEX_PATH = os.path.join(DATA_DIR, "index.faiss")
+LEGACY_BM25_PATH = os.path.join(DATA_DIR, "bm25_index.pkl")
+LEGACY_BM25_SPARSE_PATH = os.path.join(DATA_DIR, "bm25_sparse.npz")
+
+INDEX_FILE = "index.faiss"
+BM25_DIR = "bm25"
+CORPUS_DIR = "corpus"
+VECTORS_FILE = "vectors.npy"
+METADATA_DIR = "metadata"
+
+KEEP_GENERATIONS = 3
+
+
+def tokenize(text: str):
+    """BM25 tokenization — must be identical at build and query time."""
+    return text.lower().split()
+
+
+class IndexGeneration:
+    """One immutable, fully loaded set of indexes. Searches hold a reference for their whole duration."""
+
+    def __init__(self, gen_id, path, faiss_index, faiss_meta, bm25, questions, answers, faqs, vectors=None,
+                 metadata=None, paraphrases=None):
+        self.gen_id = gen_id
+        self.path = path
+        self.faiss_index = faiss_index
+        self.faiss_meta = faiss_meta
+        self.bm25 = bm25
+        self.questions = questions
+        self.answers = answers
+        self.faqs = faqs
+        self.vectors = vectors          # (rows, dim) float32, None for legacy builds
+        self._metadata = metadata       # MetadataIndex, built from faqs on first use if not stored
+        self.paraphrases = paraphrases  # row-aligned pre-generated answer paraphrases ("" = none), or None
+        self.loaded_at = time.time()
+
+    @property
+    def version(self):
+        return self.gen_id
+
+    @property
+    def alive(self):
+        return self.bm25.alive
+
+    def is_alive(self, faq_id):
+        return 0 <= faq_id < len(self.questions) and bool(self.alive[faq_id])
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            log.info(f"[INDEX] {self.gen_id} has no metadata columns → encoding filters from the corpus")
+            self._metadata = MetadataIndex.from_faqs(self.faqs)
+        return self._metadata
+
+    def info(self):
+        return {
+            "generation": self.gen_id,
+            "path": self.path,
+            "faqs": int(self.alive.sum()),
+            "rows": len(self.questions),
+            "faiss_vectors": int(self.faiss_index.ntotal),
+            "faiss_type": self.faiss_meta.get("factory", "Flat"),
+            "bm25_terms": len(self.bm25.terms),
+            "incremental": self.vectors is not None,
+            "filter_fields": sorted(self._metadata.columns) if self._metadata is not None else [],
+            "paraphrases": self.paraphrases is not None,
+            "loaded_at": self.loaded_at,
+        }
+
+
+# ───── CURRENT pointer ─────
+def read_current_id():
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def publish(gen_path):
+    """Atomically point CURRENT at a fully written generation."""
+    tmp = CURRENT_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(gen_path))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, CURRENT_FILE)
+    prune_generations()
+
+
+def prune_generations(keep=KEEP_GENERATIONS):
+    """Delete old generations, never the live one (other workers may still be swapping)."""
+    if not os.path.isdir(GENERATIONS_DIR):
+        return
+    live = read_current_id()
+    names = sorted(n for n in os.listdir(GENERATIONS_DIR) if n.startswith("gen-"))
+    for name in names[:-keep]:
+        if name != live:
+            shutil.rmtree(os.path.join(GENERATIONS_DIR, name), ignore_errors=True)
+
+
+@contextmanager
+def write_lock():
+    """Cross-process lock so the server and the CLI never publish on top of each other."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(LOCK_FILE, "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# ───── write / load ─────
+def _next_generation_path(generations_dir=GENERATIONS_DIR):
+    os.makedirs(generations_dir, exist_ok=True)
+    existing = [int(n.split("-")[1]) for n in os.listdir(generations_dir)
+                if n.startswith("gen-") and n.split("-")[1].isdigit()]
+    return os.path.join(generations_dir, f"gen-{max(existing, default=0) + 1:06d}")
+
+
+def write_generation_with(write_files, generations_dir=GENERATIONS_DIR):
+    """
+    Call write_files(tmp_dir) to fill a new generation, then rename it into place. Returns its path.
+    Another `generations_dir` (benchmarks) writes a loadable generation the server never sees.
+    """
+    gen_path = _next_generation_path(generations_dir)
+    tmp_path = gen_path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    write_files(tmp_path)
+    os.rename(tmp_path, gen_path)
+    return gen_path
+
+
+def write_generation(faiss_index, faiss_meta, bm25, questions, answers, faqs, vectors,
+                     generations_dir=GENERATIONS_DIR):
+    """Write a complete generation to a temp dir, then rename it into place. Returns its path."""
+    def write_files(tmp_path):
+        write_index(faiss_index, faiss_meta, os.path.join(tmp_path, INDEX_FILE))
+        bm25.save_dir(os.path.join(tmp_path, BM25_DIR))
+        write_corpus(os.path.join(tmp_path, CORPUS_DIR), questions, answers, faqs)
+        np.save(os.path.join(tmp_path, VECTORS_FILE), np.asarray(vectors, dtype=np.float32))
+        write_metadata(os.path.join(tmp_path, METADATA_DIR), faqs)
+        write_paraphrases(tmp_path, questions, answers)
+
+    return write_generation_with(write_files, generations_dir)
+
+
+def load_generation(gen_path):
+    """Near-instant: BM25 arrays, corpus strings and vectors are memory-mapped, not unpickled."""
+    index_path = os.path.join(gen_path, INDEX_FILE)
+    faiss_index = faiss.read_index(index_path)
+
+    if os.path.isdir(os.path.join(gen_path, BM25_DIR)):
+        bm25 = SparseBM25.load_dir(os.path.join(gen_path, BM25_DIR))
+        questions, answers, faqs = open_corpus(os.path.join(gen_path, CORPUS_DIR))
+    else:
+        # Generations written before the columnar format (bm25_sparse.npz + corpus.json)
+        bm25 = SparseBM25.load(os.path.join(gen_path, "bm25_sparse.npz"))
+        with open(os.path.join(gen_path, "corpus.json"), "r", encoding="utf-8") as f:
+            corpus = json.load(f)
+        questions, answers, faqs = corpus["questions"], corpus["answers"], corpus["faqs"]
+
+    vectors = np.load(os.path.join(gen_path, VECTORS_FILE), mmap_mode="r")
+    meta_dir = os.path.join(gen_path, METADATA_DIR)
+    metadata = MetadataIndex.load(meta_dir, len(questions)) if os.path.isdir(meta_dir) else None
+    return IndexGeneration(
+        os.path.basename(gen_path), gen_path, faiss_index, read_meta(index_path), bm25,
+        questions, answers, faqs, vectors, metadata, open_paraphrases(gen_path),
+    )
+
+
+def _file_version(path):
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def load_legacy():
+    """Old single-directory build (index.faiss + bm25_index.pkl). Read-only: no incremental updates."""
+    if not settings.ALLOW_LEGACY_PICKLE:
+        raise RuntimeError(
+            "No index generation found (app/data/CURRENT). Run build_index.py, or set "
+            "ALLOW_LEGACY_PICKLE=true to load the old bm25_index.pkl"
+        )
+    if not os.path.exists(LEGACY_INDEX_PATH):
+        raise FileNotFoundError(f"index.faiss NOT FOUND at {LEGACY_INDEX_PATH}")
+    if not os.path.exists(LEGACY_BM25_PATH):
+        raise FileNotFoundError(f"bm25_index.pkl NOT FOUND at {LEGACY_BM25_PATH}")
+
+    faiss_index = faiss.read_index(LEGACY_INDEX_PATH)
+    with open(LEGACY_BM25_PATH, "rb") as f:
+        bm25_data = pickle.load(f)
+
+    version = f"legacy-{_file_version(LEGACY_INDEX_PATH)}:{_file_version(LEGACY_BM25_PATH)}"
+    if os.path.exists(LEGACY_BM25_SPARSE_PATH):
+        bm25 = SparseBM25.load(LEGACY_BM25_SPARSE_PATH)
+        version += f":{_file_version(LEGACY_BM25_SPARSE_PATH)}"
+    else:
+        # Old build — convert the pickled BM25Okapi once at startup
+        log.warning("bm25_sparse.npz not found → converting legacy BM25Okapi (rebuild indexes to skip this)")
+        bm25 = SparseBM25.from_bm25okapi(bm25_data["bm25"])
+
+    return IndexGeneration(
+        version, DATA_DIR, faiss_index, read_meta(LEGACY_INDEX_PATH), bm25,
+        bm25_data["questions"], bm25_data["answers"], bm25_data["faqs"],
+    )
+
+
+def load_current():
+    gen_id = read_current_id()
+    if gen_id:
+        return load_generation(os.path.join(GENERATIONS_DIR, gen_id))
+    return load_legacy()
+
+
+# ───── incremental updates ─────
+def apply_changes(base, encode_fn, upserts=(), deletes=()):
+    """
+    Build, write and publish the generation after `base` with:
+      upserts: [(faq_id or None, faq_dict)] — None appends a new FAQ, an id replaces it in place
+      deletes: [faq_id]
+    Only the upserted questions are encoded. Returns (new_generation, assigned_ids).
+    """
+    with write_lock():
+        # Someone else may have published since `base` was loaded — build on the latest
+        if read_current_id() and read_current_id() != base.gen_id:
+            base = load_current()
+        if base.vectors is None:
+            raise RuntimeError("Legacy index has no stored vectors — run build_index.py once to create a generation")
+
+        deletes = {int(i) for i in deletes}
+        for faq_id in deletes | {int(i) for i, _ in upserts if i is not None}:
+            if not base.is_alive(faq_id):
+                raise KeyError(faq_id)
+
+        questions, answers, faqs = list(base.questions), list(base.answers), list(base.faqs)
+        ids, texts = [], []
+        for faq_id, faq in upserts:
+            if faq_id is None:
+                faq_id = len(questions)
+                questions.append("")
+                answers.append("")
+                faqs.append(None)
+            questions[faq_id] = str(faq["question"]).strip()
+            answers[faq_id] = str(faq["answer"]).strip()
+            faqs[faq_id] = faq
+            ids.append(faq_id)
+            texts.append(questions[faq_id])
+
+        for faq_id in deletes:
+            questions[faq_id], answers[faq_id], faqs[faq_id] = "", "", None
+
+        # Vectors: copy, then overwrite only what changed
+        vectors = np.zeros((len(questions), base.vectors.shape[1]), dtype=np.float32)
+        vectors[: len(base.vectors)] = base.vectors
+        new_vecs = np.asarray(encode_fn(texts), dtype=np.float32) if texts else None
+        if new_vecs is not None:
+            vectors[ids] = new_vecs
+        vectors[list(deletes)] = 0
+
+        bm25 = base.bm25.with_changes({i: tokenize(questions[i]) for i in ids}, deletes)
+
+        # FAISS: edit a clone in place when the index type allows it, else rebuild from vectors
+        meta = dict(base.faiss_meta)
+        if supports_remove(meta):
+            faiss_index = faiss.clone_index(base.faiss_index)
+            stale = [i for i in ids if i < len(base.questions)] + list(deletes)
+            if stale:
+                faiss_index.remove_ids(np.asarray(stale, dtype=np.int64))
+            if new_vecs is not None:
+                faiss_index.add_with_ids(new_vecs, np.asarray(ids, dtype=np.int64))
+            meta["ntotal"] = int(faiss_index.ntotal)
+        else:
+            alive_ids = np.flatnonzero(bm25.alive)
+            faiss_index, meta = build_faiss_index(
+                vectors[alive_ids],
+                meta["index_type"],
+                ids=alive_ids,
+                hnsw_m=meta.get("hnsw_m", 32),
+                hnsw_ef_construction=meta.get("hnsw_ef_construction", 200),
+            )
+
+        gen_path = write_generation(faiss_index, meta, bm25, questions, answers, faqs, vectors)
+        publish(gen_path)
+        log.info(f"[INDEX] Published {os.path.basename(gen_path)}: "
+                 f"{len(ids)} upserted, {len(deletes)} deleted, {int(bm25.alive.sum())} FAQs live")
+
+        new_gen = IndexGeneration(
+            os.path.basename(gen_path), gen_path, faiss_index, read_meta(os.path.join(gen_path, INDEX_FILE)),
+            bm25, questions, answers, faqs, vectors,
+            MetadataIndex.load(os.path.join(gen_path, METADATA_DIR), len(questions)),
+            open_paraphrases(gen_path),
+        )
+        return new_gen, ids
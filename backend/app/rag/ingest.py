@@ -0,0 +1,500 @@
+# backend/app/rag/ingest.py
+#
+# Streaming, parallel, resumable ingest for corpora that don't fit build_index.py
+# (which json.loads everything and holds all embeddings in memory):
+#   python app/rag/ingest.py --input big.jsonl --workers 4
+#   python app/rag/ingest.py --input manual.json --chunk-size 1000   # split long answers
+#
+#   read     JSONL, or a top-level JSON array, one record at a time
+#   chunk    optional: answers longer than --chunk-size are split with
+#            langchain-text-splitters; every chunk becomes its own row
+#   encode   cache misses go to --workers processes, each with its own backend; the
+#            embed cache stays in this process and new vectors are committed once per shard
+#   shard    every ~--shard-size rows: vectors, corpus columns and BM25 postings are
+#            written to app/data/ingest/<run>/shard-NNNNN/ and recorded in manifest.json
+#   publish  shards are streamed into one index generation (vectors.npy memmap, FAISS
+#            filled shard by shard, BM25 postings merged, filter columns) and CURRENT is switched
+#
+# Interrupted? Run the same command again: finished shards are kept, the records they
+# cover are skipped, and encoding resumes at the first unfinished shard.
+import argparse
+import codecs
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.core.config import settings
+from app.rag import index_store
+from app.rag.corpus_store import open_corpus, write_corpus
+from app.rag.embed_cache import EmbeddingCache, default_cache_dir
+from app.rag.embedding_backends import BACKENDS, load_backend
+from app.rag.faiss_factory import INDEX_TYPES, create_faiss_index, write_index
+from app.rag.filters import write_metadata
+from app.rag.paraphrases import write_paraphrases
+from app.rag.sparse_bm25 import SparseBM25
+
+INGEST_DIR = os.path.join(index_store.DATA_DIR, "ingest")
+MANIFEST_FILE = "manifest.json"
+MAX_TRAIN_VECTORS = 100_000   # IVF / PQ training sample, drawn evenly from all shards
+PROGRESS_EVERY_SECONDS = 10.0
+
+
+# ───── reading ─────
+def _iter_jsonl(f):
+    read = 0
+    for lineno, line in enumerate(f, start=1):
+        read += len(line)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line.decode("utf-8-sig")), read
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            print(f"Skipping malformed line {lineno}: {e}")
+
+
+def _iter_json_array(f, chunk_bytes):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8-sig")()
+    buf, pos, read, eof = "", 0, 0, False
+    opened = False
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf):
+            if not opened:
+                if buf[pos] != "[":
+                    raise ValueError("Expected a JSON array of FAQ objects (or use JSONL)")
+                opened = True
+                pos += 1
+                continue
+            if buf[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+                # A record ending exactly at the buffer edge may be cut short (e.g. a number)
+                complete = end < len(buf) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+            if complete:
+                pos = end
+                yield record, read
+                continue
+        elif eof:
+            return
+
+        chunk = f.read(chunk_bytes)
+        read += len(chunk)
+        eof = not chunk
+        buf = buf[pos:] + text.decode(chunk, final=eof)  # only the unparsed tail is kept
+        pos = 0
+
+
+def iter_records(path, chunk_bytes=1 << 20):
+    """(record, bytes_read) from a JSONL file or a top-level JSON array — never loaded whole."""
+    with open(path, "rb") as f:
+        head = f.read(4096).lstrip(b"\xef\xbb\xbf \t\r\n")
+        f.seek(0)
+        if head.startswith(b"["):
+            yield from _iter_json_array(f, chunk_bytes)
+        else:
+            yield from _iter_jsonl(f)
+
+
+# ───── chunking ─────
+def make_splitter(chunk_size, chunk_overlap):
+    if not chunk_size:
+        return None
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        sys.exit("--chunk-size needs langchain-text-splitters (pip install -r requirements.txt)")
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=min(chunk_overlap, chunk_size // 2))
+
+
+def faq_rows(item, splitter=None, chunk_size=0):
+    """(question, answer, faq, indexed_text) rows for one record, [] if it isn't a valid FAQ."""
+    if not isinstance(item, dict) or "question" not in item or "answer" not in item:
+        return []
+    q = str(item["question"]).strip()
+    a = str(item["answer"]).strip()
+    if not q or not a:
+        return []
+    if splitter is None or len(a) <= chunk_size:
+        return [(q, a, item, q)]
+    # Chunks are found by their own content as well as the question
+    chunks = splitter.split_text(a)
+    return [
+        (q, chunk, {**item, "answer": chunk, "chunk": i, "chunks": len(chunks)}, f"{q}\n{chunk}")
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+# ───── encoding workers ─────
+_worker_encoder = None
+
+
+def _init_worker(backend_name, threads):
+    global _worker_encoder
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)  # read by torch on (lazy) import
+    _worker_encoder = load_backend(backend_name, threads=threads)
+
+
+def _encode(texts, batch_size):
+    """(vectors, seconds spent encoding) for one batch."""
+    started = time.perf_counter()
+    vectors = _worker_encoder.encode(texts, batch_size=batch_size)
+    return vectors, time.perf_counter() - started
+
+
+def _describe():
+    return _worker_encoder.describe()
+
+
+class _InlineExecutor:
+    """--workers 0: encode in this process (small corpora, debugging)."""
+
+    def __init__(self, initializer, initargs):
+        initializer(*initargs)
+
+    def submit(self, fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+def _executor(workers, backend_name):
+    initargs = (backend_name, max(1, (os.cpu_count() or 1) // max(1, workers)))
+    if workers <= 0:
+        return _InlineExecutor(_init_worker, (backend_name, settings.EMBEDDING_THREADS))
+    # spawn: workers never inherit this process' buffers; each loads the model once
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=initargs,
+    )
+
+
+# ───── run state ─────
+def run_dir_for(input_path, options):
+    key = json.dumps({"input": os.path.abspath(input_path), **options}, sort_keys=True)
+    return os.path.join(INGEST_DIR, hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest())
+
+
+def _source_stamp(input_path):
+    st = os.stat(input_path)
+    return {"source": os.path.abspath(input_path), "source_size": st.st_size, "source_mtime_ns": st.st_mtime_ns}
+
+
+def load_manifest(run_dir, input_path, options, restart=False):
+    path = os.path.join(run_dir, MANIFEST_FILE)
+    stamp = _source_stamp(input_path)
+    if os.path.exists(path) and not restart:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if all(manifest.get(k) == v for k, v in stamp.items()):
+            return manifest
+        print("Input changed since the interrupted run → starting over")
+    shutil.rmtree(run_dir, ignore_errors=True)
+    os.makedirs(run_dir)
+    manifest = {**stamp, "options": options, "embedding": None, "shards": [],
+                "records_done": 0, "rows_done": 0, "skipped": 0, "complete": False}
+    save_manifest(run_dir, manifest)
+    return manifest
+
+
+def save_manifest(run_dir, manifest):
+    tmp = os.path.join(run_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, os.path.join(run_dir, MANIFEST_FILE))
+
+
+def write_shard(run_dir, number, rows, vectors):
+    """One self-contained shard, renamed into place only once complete."""
+    name = f"shard-{number:05d}"
+    tmp = os.path.join(run_dir, name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    np.save(os.path.join(tmp, index_store.VECTORS_FILE), vectors)
+    write_corpus(os.path.join(tmp, index_store.CORPUS_DIR), *zip(*(r[:3] for r in rows)))
+    SparseBM25.from_corpus([index_store.tokenize(r[3]) for r in rows]).save_dir(os.path.join(tmp, index_store.BM25_DIR))
+    os.rename(tmp, os.path.join(run_dir, name))
+    return name
+
+
+# ───── ingest ─────
+class _Progress:
+    def __init__(self, total_bytes, records_before):
+        self.total_bytes = total_bytes
+        self.records_before = records_before
+        self.started = time.monotonic()
+        self.last = self.started
+
+    def report(self, records, rows, bytes_read, cache_hits, force=False):
+        now = time.monotonic()
+        if not force and now - self.last < PROGRESS_EVERY_SECONDS:
+            return
+        self.last = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = (records - self.records_before) / elapsed
+        frac = bytes_read / self.total_bytes if self.total_bytes else 1.0
+        eta = elapsed * (1 - frac) / frac if 0 < frac < 1 and bytes_read else 0.0
+        hit_rate = f", {cache_hits / rows:.0%} cached" if rows and cache_hits else ""
+        print(f"[INGEST] {records:,} docs → {rows:,} rows | {rate:,.1f} docs/s | "
+              f"{frac:.1%} of input, ETA {eta / 60:.1f} min{hit_rate}")
+
+
+def ingest(input_path, run_dir, manifest, workers, batch_size, shard_size, splitter, chunk_size,
+           backend_name, use_cache):
+    """Read → chunk → encode → shard until the input is exhausted (or resume where it stopped)."""
+    executor = _executor(workers, backend_name)
+    try:
+        if manifest["embedding"] is None:
+            manifest["embedding"] = executor.submit(_describe).result()
+            save_manifest(run_dir, manifest)
+        embedding = manifest["embedding"]
+        # Only this process reads and writes the cache (same model id as embed_cache.model_id)
+        cache = EmbeddingCache(default_cache_dir(), f"{embedding['backend']}:{embedding['model']}",
+                               embedding["dim"]) if use_cache else None
+        where = f"{workers} worker processes" if workers > 0 else "the main process"
+        print(f"Encoding with {manifest['embedding']} in {where}")
+
+        skip = manifest["records_done"]
+        if skip:
+            print(f"Resuming after {len(manifest['shards'])} shards ({skip:,} docs, {manifest['rows_done']:,} rows)")
+        progress = _Progress(os.path.getsize(input_path), skip)
+
+        records, rows_done, cache_hits = 0, manifest["rows_done"], 0
+        rows, batch, batches = [], [], []
+        in_flight = deque()
+        max_in_flight = max(2, 2 * workers)
+        shard_started = time.monotonic()
+
+        def submit(texts):
+            # Cache hits are served here; only the misses (each text once) go to a worker
+            keys = found = inverse = None
+            unique = missing = np.arange(len(texts))
+            if cache is not None:
+                keys = cache.keys_for(texts)
+                found = cache.lookup(keys)
+                missing = np.flatnonzero(found < 0)
+                _, first, inverse = np.unique(keys[missing], return_index=True, return_inverse=True)
+                unique = missing[first]
+            future = executor.submit(_encode, [texts[i] for i in unique], batch_size) if len(unique) else None
+            batches.append((len(texts), keys, found, unique, missing, inverse, future))
+            if future is not None:
+                in_flight.append(future)
+            while len(in_flight) > max_in_flight:  # bounded: the reader waits for the encoders
+                in_flight.popleft().result()
+
+        def gather(n, keys, found, unique, missing, inverse, future):
+            if cache is None:
+                return future.result()[0]
+            out = np.empty((n, embedding["dim"]), dtype=np.float32)
+            hit = found >= 0
+            if hit.any():
+                out[hit] = cache.vectors(found[hit])
+            if future is not None:
+                encoded, seconds = future.result()
+                out[missing] = encoded[inverse.reshape(-1)]
+                # Staged in memory; committed with one append + fsync when the shard is done
+                cache.add(keys[unique], encoded, sec_per_text=seconds / len(unique), commit=False)
+            return out
+
+        def flush_shard():
+            nonlocal rows, batches, rows_done, cache_hits, shard_started
+            if batch:
+                submit(list(batch))
+                batch.clear()
+            vectors = np.concatenate([gather(*b) for b in batches]).astype(np.float32, copy=False)
+            if cache is not None:
+                cache_hits += sum(int((b[2] >= 0).sum()) for b in batches)
+                cache.flush()
+            name = write_shard(run_dir, len(manifest["shards"]) + 1, rows, vectors)
+            rows_done += len(rows)
+            now = time.monotonic()
+            manifest["shards"].append({"name": name, "rows": len(rows), "records_end": records,
+                                       "seconds": round(now - shard_started, 3)})
+            manifest.update(records_done=records, rows_done=rows_done)
+            save_manifest(run_dir, manifest)
+            rows, batches = [], []
+            in_flight.clear()
+            shard_started = now
+
+        for records, (item, bytes_read) in enumerate(iter_records(input_path), start=1):
+            if records <= skip:
+                continue
+            item_rows = faq_rows(item, splitter, chunk_size)
+            if not item_rows:
+                manifest["skipped"] += 1
+                if manifest["skipped"] <= 10:
+                    print(f"Skipping invalid entry #{records}: {str(item)[:120]}")
+            for row in item_rows:
+                rows.append(row)
+                batch.append(row[3])
+                if len(batch) >= batch_size:
+                    submit(list(batch))
+                    batch.clear()
+            # Shards end on record boundaries, so resuming never splits a FAQ's chunks
+            if len(rows) >= shard_size:
+                flush_shard()
+            progress.report(records, rows_done + len(rows), bytes_read, cache_hits)
+
+        if rows:
+            flush_shard()
+        manifest.update(records_done=max(records, skip), complete=True)
+        save_manifest(run_dir, manifest)
+        progress.report(manifest["records_done"], rows_done, progress.total_bytes, cache_hits, force=True)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+# ───── publish ─────
+def publish_shards(run_dir, manifest, index_type, index_kwargs):
+    """Stream every shard into one new index generation and make it CURRENT."""
+    shard_paths = [os.path.join(run_dir, s["name"]) for s in manifest["shards"]]
+    n, dim = manifest["rows_done"], manifest["embedding"]["dim"]
+    if n == 0:
+        raise ValueError("No valid FAQs found! Check the input format.")
+
+    def shard_vectors():
+        start = 0
+        for path in shard_paths:
+            vecs = np.load(os.path.join(path, index_store.VECTORS_FILE), mmap_mode="r")
+            yield start, vecs
+            start += len(vecs)
+
+    def column(i):
+        for path in shard_paths:
+            yield from open_corpus(os.path.join(path, index_store.CORPUS_DIR))[i]
+
+    def write_files(tmp_path):
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, index_store.VECTORS_FILE), "w+", np.float32, (n, dim)
+        )
+        for start, vecs in shard_vectors():
+            vectors[start:start + len(vecs)] = vecs
+        vectors.flush()
+
+        sample = np.unique(np.linspace(0, n - 1, min(n, MAX_TRAIN_VECTORS)).astype(np.int64))
+        index, params = create_faiss_index(vectors[sample], index_type, **index_kwargs)
+        for start, vecs in shard_vectors():
+            index.add_with_ids(np.ascontiguousarray(vecs), np.arange(start, start + len(vecs), dtype=np.int64))
+        params["ntotal"] = int(index.ntotal)
+        params["embedding"] = manifest["embedding"]
+        write_index(index, params, os.path.join(tmp_path, index_store.INDEX_FILE))
+        print(f"FAISS index built ({index.ntotal} vectors, {params['factory']})")
+        del index
+
+        n_docs, n_terms = SparseBM25.merge_dirs(
+            os.path.join(tmp_path, index_store.BM25_DIR),
+            [os.path.join(p, index_store.BM25_DIR) for p in shard_paths],
+        )
+        print(f"Sparse BM25 merged ({n_terms} terms, {n_docs} docs)")
+        write_corpus(os.path.join(tmp_path, index_store.CORPUS_DIR), column(0), column(1), column(2))
+        write_metadata(os.path.join(tmp_path, index_store.METADATA_DIR), column(2))
+        write_paraphrases(tmp_path, column(0), column(1))
+
+    print(f"Publishing {n:,} rows from {len(shard_paths)} shards...")
+    with index_store.write_lock():
+        gen_path = index_store.write_generation_with(write_files)
+        index_store.publish(gen_path)
+    return gen_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming, parallel, resumable FAQ ingest")
+    parser.add_argument("--input", default=os.path.join(index_store.DATA_DIR, "faqs.json"),
+                        help="JSONL (one FAQ per line) or a JSON array")
+    parser.add_argument("--workers", type=int, default=settings.INGEST_WORKERS, help="encoder processes (0 = inline)")
+    parser.add_argument("--batch-size", type=int, default=settings.INGEST_BATCH_SIZE)
+    parser.add_argument("--shard-size", type=int, default=settings.INGEST_SHARD_SIZE, help="rows per shard")
+    parser.add_argument("--chunk-size", type=int, default=settings.INGEST_CHUNK_SIZE,
+                        help="split answers longer than this many characters (0 = never)")
+    parser.add_argument("--chunk-overlap", type=int, default=settings.INGEST_CHUNK_OVERLAP)
+    parser.add_argument("--embedding-backend", choices=BACKENDS, default=settings.EMBEDDING_BACKEND,
+                        help="must match the server's EMBEDDING_BACKEND")
+    parser.add_argument("--no-embed-cache", action="store_true")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=settings.FAISS_INDEX_TYPE)
+    parser.add_argument("--nlist", type=int, default=settings.FAISS_NLIST)
+    parser.add_argument("--pq-m", type=int, default=settings.FAISS_PQ_M)
+    parser.add_argument("--pq-nbits", type=int, default=settings.FAISS_PQ_NBITS)
+    parser.add_argument("--hnsw-m", type=int, default=settings.FAISS_HNSW_M)
+    parser.add_argument("--hnsw-ef-construction", type=int, default=settings.FAISS_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--restart", action="store_true", help="discard shards of an interrupted run")
+    parser.add_argument("--keep-shards", action="store_true", help="keep the run directory after publishing")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input):
+        raise FileNotFoundError(f"Input NOT FOUND at {args.input}")
+
+    # Anything that changes the rows or vectors gets its own run directory
+    options = {
+        "chunk_size": args.chunk_size,
+        "chunk_overlap": args.chunk_overlap,
+        "embedding_backend": args.embedding_backend,
+        "embedding_model": settings.EMBEDDING_MODEL,
+    }
+    run_dir = run_dir_for(args.input, options)
+    manifest = load_manifest(run_dir, args.input, options, restart=args.restart)
+    print(f"Ingesting {args.input} → {run_dir}")
+
+    started = time.monotonic()
+    if not manifest["complete"]:
+        try:
+            ingest(
+                args.input, run_dir, manifest,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                shard_size=max(1, args.shard_size),
+                splitter=make_splitter(args.chunk_size, args.chunk_overlap),
+                chunk_size=args.chunk_size,
+                backend_name=args.embedding_backend,
+                use_cache=settings.EMBED_CACHE_ENABLED and not args.no_embed_cache,
+            )
+        except KeyboardInterrupt:
+            sys.exit(f"\nInterrupted after {len(manifest['shards'])} shards — run the same command to resume")
+    if manifest["skipped"]:
+        print(f"Skipped {manifest['skipped']} invalid entries")
+
+    gen_path = publish_shards(run_dir, manifest, args.index_type, {
+        "nlist": args.nlist,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+        "hnsw_m": args.hnsw_m,
+        "hnsw_ef_construction": args.hnsw_ef_construction,
+    })
+    if not args.keep_shards:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+    elapsed = time.monotonic() - started
+    print(f"Generation published → {gen_path}")
+    print(f"{manifest['records_done']:,} docs / {manifest['rows_done']:,} rows in {elapsed:.1f}s "
+          f"({manifest['records_done'] / max(elapsed, 1e-9):,.1f} docs/s overall)")
+    print("Running servers pick up the new generation automatically.")
+
+
+if __name__ == "__main__":
+    main()
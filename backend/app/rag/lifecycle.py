@@ -0,0 +1,121 @@
+# backend/app/rag/lifecycle.py
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.rag import hybrid_retriever
+
+log = get_logger("lifecycle")
+
+
+class Component:
+    def __init__(self, name, load_fn):
+        self.name = name
+        self.load_fn = load_fn
+        self.status = "pending"     # pending → loading → ready | failed
+        self.seconds = None
+        self.error = None
+
+    def run(self):
+        self.status = "loading"
+        self.error = None
+        started = time.perf_counter()
+        try:
+            self.load_fn()
+            self.status = "ready"
+        except Exception as e:
+            self.status = "failed"
+            self.error = f"{type(e).__name__}: {e}"
+            log.exception(f"[LIFECYCLE] {self.name} failed")
+        self.seconds = round(time.perf_counter() - started, 3)
+        return self.status == "ready"
+
+    def as_dict(self):
+        return {"status": self.status, "seconds": self.seconds, "error": self.error}
+
+
+class RAGLifecycle:
+    """
+    Loads indexes, the embedding model and a warm-up query in a background thread,
+    so the process answers /health immediately and /rag/query only once warm.
+    """
+
+    def __init__(self):
+        self.components = OrderedDict(
+            (c.name, c) for c in (
+                Component("indexes", hybrid_retriever.load_indexes),
+                Component("embedder", hybrid_retriever.load_embedder),
+                Component("warmup", hybrid_retriever.warm_up),
+            )
+        )
+        self.process_started = time.time()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return all(c.status == "ready" for c in self.components.values())
+
+    def load_all(self):
+        """Load every component that isn't ready yet (idempotent). Stops at the first failure."""
+        with self._lock:
+            for component in self.components.values():
+                if component.status == "ready":
+                    continue
+                log.info(f"[LIFECYCLE] Loading {component.name}...")
+                if not component.run():
+                    log.critical(f"FATAL ERROR: RAG component '{component.name}' FAILED TO LOAD: {component.error} "
+                                 "— run `python app/rag/build_index.py`, check faqs.json, then restart")
+                    return False
+                log.info(f"[LIFECYCLE] {component.name} ready in {component.seconds}s")
+            log.info("HYBRID RETRIEVER FULLY LOADED AND READY!")
+            return True
+
+    def preload(self):
+        """
+        Run in a gunicorn master (preload_app) before forking: load indexes + model
+        once so every worker shares the pages copy-on-write. Warm-up is left to the
+        workers — running torch/FAISS thread pools before fork() can hang the children.
+        """
+        with self._lock:
+            for name in ("indexes", "embedder"):
+                component = self.components[name]
+                log.info(f"[LIFECYCLE] Preloading {name} in master (pid {os.getpid()})...")
+                if not component.run():
+                    log.warning(f"[LIFECYCLE] Preload of {name} failed ({component.error}) — workers will retry")
+                    return False
+                log.info(f"[LIFECYCLE] {name} ready in {component.seconds}s")
+            return True
+
+    def start_background(self):
+        if self.ready or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self.load_all, name="rag-loader", daemon=True)
+        self._thread.start()
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "failed": any(c.status == "failed" for c in self.components.values()),
+            "uptime_seconds": round(time.time() - self.process_started, 3),
+            "components": {name: c.as_dict() for name, c in self.components.items()},
+            "index_generation": hybrid_retriever.index_version,
+        }
+
+
+lifecycle = RAGLifecycle()
+
+
+def require_rag_ready():
+    """Dependency: fast 503 + Retry-After instead of queueing requests behind model loading."""
+    if not lifecycle.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="RAG system is still warming up",
+            headers={"Retry-After": str(settings.READY_RETRY_AFTER_SECONDS)},
+        )
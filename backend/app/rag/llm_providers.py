@@ -0,0 +1,587 @@
+# backend/app/rag/llm_providers.py
+#
+# Process-wide LLM provider layer:
+#   - one pooled keep-alive client per provider and worker process (no TLS
+#     handshake per answer), created lazily so a preloaded gunicorn master never
+#     owns sockets its forked workers would share
+#   - LLM_PROVIDERS sets the preference order (default: Groq when GROQ_API_KEY
+#     is set, then Ollama)
+#   - if the provider in use hasn't streamed a token within its TTFT deadline,
+#     the next provider gets a hedged copy of the request; whichever streams
+#     first wins and the other is cancelled. A provider that errors before its
+#     first token fails over to the next one straight away
+#   - per-provider circuit breakers: LLM_BREAKER_FAILURES consecutive failures
+#     keep traffic away for LLM_BREAKER_COOLDOWN_SECONDS, then one probe decides
+#   - per-provider admission control (per worker process): at most
+#     <PROVIDER>_MAX_CONCURRENCY generations at once. A request takes a free
+#     slot on any provider in preference order, otherwise it waits in the
+#     primary's queue — round-robin across users, so one user can't starve the
+#     rest. Full queue → 429, no slot within LLM_QUEUE_TIMEOUT_SECONDS → 503
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+
+import httpx
+
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.metrics import LLM_REQUESTS, LLM_TOKENS, LLM_TOKENS_PER_SECOND, LLM_TTFT_SECONDS
+
+log = get_logger("llm")
+
+# Yielded when no provider produced an answer — never cached
+LLM_ERROR_MESSAGE = "Sorry, I'm having trouble connecting to the model right now. Please try again in a moment."
+
+
+class LLMOverloaded(Exception):
+    """No generation slot for this request. Raised before the first token, so routes can still send 429/503."""
+
+    def __init__(self, status_code, detail, retry_after=1):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _pct(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+
+class CircuitBreaker:
+    """closed → (N consecutive failures) → open → (cooldown) → half-open: one probe decides."""
+
+    def __init__(self, failures=3, cooldown=30.0):
+        self.failures = max(1, failures)
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def available(self):
+        """Would allow() let a request through? (without taking the half-open probe)"""
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self.opened_at >= self.cooldown
+            return self.state == "closed" or not self.probing
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive = 0
+            self.probing = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            self.probing = False
+            if self.state == "half_open" or (self.state == "closed" and self.consecutive >= self.failures):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.trips += 1
+
+    def release(self):
+        """Attempt cancelled (lost a hedge, client went away) — no verdict either way."""
+        with self._lock:
+            self.probing = False
+
+    def as_dict(self):
+        return {"state": self.state, "consecutive_failures": self.consecutive, "trips": self.trips}
+
+
+class FairLimiter:
+    """
+    Concurrency slots with a bounded wait queue, served round-robin per user:
+    each user has a FIFO, and a freed slot goes to the head of the next user's.
+    Event-loop only (no locks) — one instance per provider and worker process.
+    """
+
+    def __init__(self, name, max_concurrency, queue_max, per_user_max, timeout):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.queue_max = queue_max
+        self.per_user_max = per_user_max
+        self.timeout = timeout
+        self.active = 0
+        self.queued = 0
+        self._waiters = OrderedDict()   # user → deque of futures, in round-robin order
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.waits = deque(maxlen=1024)
+
+    def try_acquire(self):
+        # Never overtake someone already waiting
+        if self.has_free_slot():
+            self.active += 1
+            self.admitted += 1
+            return True
+        return False
+
+    def has_free_slot(self):
+        return self.active < self.max_concurrency and not self.queued
+
+    def check(self, user):
+        """Raise the 429 acquire() would give `user` right now, without taking a slot or queueing."""
+        if self.has_free_slot():
+            return
+        if self.queued >= self.queue_max:
+            self.rejected += 1
+            raise LLMOverloaded(429, f"{self.name}: too many requests waiting for the model, try again shortly")
+        if len(self._waiters.get(user or "_anonymous", ())) >= self.per_user_max:
+            self.rejected += 1
+            raise LLMOverloaded(429, "You already have requests waiting for the model — let those finish first")
+
+    async def acquire(self, user):
+        if self.try_acquire():
+            return
+        self.check(user)
+        user = user or "_anonymous"
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(user, deque()).append(future)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self._drop(user, future)
+            self.timeouts += 1
+            raise LLMOverloaded(503, f"{self.name}: no model slot within {self.timeout:.0f}s", retry_after=5)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # granted just as we were cancelled — pass it on
+            else:
+                self._drop(user, future)
+            raise
+        self.admitted += 1
+        self.waits.append(time.monotonic() - started)
+
+    def _drop(self, user, future):
+        waiting = self._waiters.get(user)
+        if waiting is not None and future in waiting:
+            waiting.remove(future)
+            self.queued -= 1
+            if not waiting:
+                del self._waiters[user]
+
+    def release(self):
+        # Hand the slot straight to the next user in line (active count unchanged)
+        while self._waiters:
+            user, waiting = next(iter(self._waiters.items()))
+            future = waiting.popleft()
+            self.queued -= 1
+            if waiting:
+                self._waiters.move_to_end(user)
+            else:
+                del self._waiters[user]
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "queued_users": len(self._waiters),
+            "queue_max": self.queue_max,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "wait_ms": {"p50": _pct(self.waits, 0.5), "p95": _pct(self.waits, 0.95), "max": _pct(self.waits, 1.0)},
+        }
+
+
+class Provider:
+    name = "provider"
+
+    def __init__(self, ttft_seconds, max_concurrency):
+        self.ttft_seconds = ttft_seconds
+        self.breaker = CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_COOLDOWN_SECONDS)
+        self.limiter = FairLimiter(
+            self.name, max_concurrency, settings.LLM_QUEUE_MAX, settings.LLM_QUEUE_PER_USER,
+            settings.LLM_QUEUE_TIMEOUT_SECONDS,
+        )
+        self._client = None
+        self._owner = None   # (pid, event loop) the pooled client belongs to
+        self.requests = 0
+        self.hedges = 0      # times this provider was started as the hedge
+        self.wins = 0        # streamed the answer
+        self.failures = 0
+        self.cancelled = 0   # lost a hedge race or the client disconnected
+        self.ttft_misses = 0
+        self.ttft = deque(maxlen=1024)
+
+    @property
+    def model(self):
+        return None
+
+    def configured(self):
+        return True
+
+    def _new_client(self):
+        raise NotImplementedError
+
+    def client(self):
+        # Pools are tied to the event loop (and process) that opened their connections
+        owner = (os.getpid(), asyncio.get_running_loop())
+        if self._client is None or self._owner != owner:
+            self._client = self._new_client()
+            self._owner = owner
+        return self._client
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=settings.LLM_POOL_SIZE,
+            max_keepalive_connections=settings.LLM_POOL_SIZE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+        )
+
+    def _timeout(self):
+        return httpx.Timeout(settings.LLM_TIMEOUT_SECONDS, connect=settings.LLM_CONNECT_TIMEOUT_SECONDS)
+
+    async def stream(self, prompt):
+        raise NotImplementedError
+        yield
+
+    async def _close(self, client):
+        await client.aclose()
+
+    async def aclose(self):
+        client, owner = self._client, self._owner
+        self._client = self._owner = None
+        if client is not None and owner[0] == os.getpid():
+            await self._close(client)
+
+    def stats(self):
+        return {
+            "ttft_deadline_s": self.ttft_seconds,
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "ttft_misses": self.ttft_misses,
+            "ttft_ms": {"p50": _pct(self.ttft, 0.5), "p95": _pct(self.ttft, 0.95), "max": _pct(self.ttft, 1.0)},
+            "breaker": self.breaker.as_dict(),
+            "admission": self.limiter.stats(),
+        }
+
+
+class GroqProvider(Provider):
+    name = "groq"
+
+    def __init__(self):
+        super().__init__(settings.GROQ_TTFT_SECONDS, settings.GROQ_MAX_CONCURRENCY)
+
+    @property
+    def model(self):
+        return settings.GROQ_MODEL
+
+    def configured(self):
+        return bool(settings.GROQ_API_KEY)
+
+    def _new_client(self):
+        from groq import AsyncGroq
+        # No SDK retries — a slow or failing Groq is what hedging + the breaker are for
+        return AsyncGroq(
+            api_key=settings.GROQ_API_KEY,
+            timeout=self._timeout(),
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=self._limits(), timeout=self._timeout()),
+        )
+
+    async def _close(self, client):
+        await client.close()
+
+    async def stream(self, prompt):
+        stream = await self.client().chat.completions.create(
+            model=settings.GROQ_MODEL,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=0.3,
+            max_tokens=512,
+            stream=True
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class OllamaProvider(Provider):
+    name = "ollama"
+
+    def __init__(self):
+        super().__init__(settings.OLLAMA_TTFT_SECONDS, settings.OLLAMA_MAX_CONCURRENCY)
+
+    @property
+    def model(self):
+        return settings.OLLAMA_MODEL
+
+    def _new_client(self):
+        return httpx.AsyncClient(base_url=settings.OLLAMA_BASE_URL, timeout=self._timeout(), limits=self._limits())
+
+    async def stream(self, prompt):
+        async with self.client().stream(
+            "POST",
+            "/api/generate",
+            json={
+                "model": settings.OLLAMA_MODEL,
+                "prompt": prompt,
+                "stream": True,
+                "options": {
+                    "temperature": 0.2,
+                    "num_ctx": 4096,
+                }
+            },
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line:
+                    data = json.loads(line)
+                    if data.get("done"):
+                        break
+                    token = data.get("response", "")
+                    if token.strip():
+                        yield token
+
+
+PROVIDERS = {"groq": GroqProvider, "ollama": OllamaProvider}
+
+
+class _Attempt:
+    """One provider streaming into a queue from its own task, so attempts can race. Owns one limiter slot."""
+
+    def __init__(self, provider, prompt, hedge=False):
+        self.provider = provider
+        self.started = time.monotonic()
+        self.queue = asyncio.Queue()
+        self.finished = False
+        provider.requests += 1
+        provider.hedges += hedge
+        self.task = asyncio.create_task(self._pump(prompt))
+        # Done callback, not `finally`: also runs if the task is cancelled before it ever starts
+        self.task.add_done_callback(lambda _: provider.limiter.release())
+
+    async def _pump(self, prompt):
+        try:
+            async for token in self.provider.stream(prompt):
+                await self.queue.put(("token", token))
+            await self.queue.put(("done", None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self.queue.put(("error", e))
+
+    def fail(self, error):
+        self.finished = True
+        self.provider.failures += 1
+        self.provider.breaker.failure()
+        LLM_REQUESTS.labels(self.provider.name, "failure").inc()
+        log.warning(f"[LLM] {self.provider.name} failed: {error!r}")
+
+    def cancel(self):
+        if not self.finished:
+            self.finished = True
+            self.provider.cancelled += 1
+            self.provider.breaker.release()
+            LLM_REQUESTS.labels(self.provider.name, "cancelled").inc()
+        self.task.cancel()
+
+
+class LLMRouter:
+    def __init__(self, order=None):
+        names = [n.strip() for n in (order if order is not None else settings.LLM_PROVIDERS).split(",") if n.strip()]
+        if not names:
+            names = ["groq", "ollama"]
+        unknown = [n for n in names if n not in PROVIDERS]
+        if unknown:
+            raise ValueError(f"Unknown LLM provider(s) {unknown} — available: {sorted(PROVIDERS)}")
+        # Groq without an API key can't serve anything → not in the rotation at all
+        self.providers = [p for p in (PROVIDERS[n]() for n in dict.fromkeys(names)) if p.configured()]
+        self.no_provider = 0   # requests that found every breaker open
+
+    def primary_model(self):
+        """Model of the provider that will most likely answer (first one not shut out by its breaker)."""
+        for provider in self.providers:
+            if provider.breaker.state != "open":
+                return provider.model
+        return self.providers[0].model if self.providers else None
+
+    def describe(self):
+        return " → ".join(p.name for p in self.providers) or "none"
+
+    def check_admission(self, user=None):
+        """
+        Raise LLMOverloaded if stream() would turn `user` away right now (full queues).
+        Cheap and non-blocking: routes call it before committing to a streamed response.
+        """
+        usable = [p for p in self.providers if p.breaker.available()]
+        if not usable or any(p.limiter.has_free_slot() for p in usable):
+            return
+        usable[0].limiter.check(user)
+
+    async def stream(self, prompt, user=None):
+        """
+        Tokens from the first provider to start streaming; LLM_ERROR_MESSAGE if none
+        does. Raises LLMOverloaded (before any token) when no generation slot is
+        available, and re-raises if the winner fails after its first token.
+        """
+        # Breakers are asked only when a provider is actually about to get a request
+        # (a half-open breaker hands out exactly one probe)
+        candidates = deque(self.providers)
+        attempts = []
+
+        def launch(hedge=False):
+            # Hedges and failovers only take a free slot — they never queue
+            while candidates:
+                provider = candidates.popleft()
+                if not provider.breaker.allow():
+                    continue
+                if provider.limiter.try_acquire():
+                    attempts.append(_Attempt(provider, prompt, hedge=hedge))
+                    return True
+                provider.breaker.release()
+            return False
+
+        # ── Admission: a free slot in preference order, else wait in the primary's fair queue ──
+        usable = [p for p in self.providers if p.breaker.available()]
+        if not usable:
+            self.no_provider += 1
+            log.warning("[LLM] Every provider's circuit breaker is open")
+            yield LLM_ERROR_MESSAGE
+            return
+        if not launch():
+            primary = usable[0]
+            await primary.limiter.acquire(user)
+            candidates = deque(p for p in self.providers if p is not primary)
+            # The breaker may have opened (or handed its probe to someone else) while we queued
+            if primary.breaker.allow():
+                attempts.append(_Attempt(primary, prompt))
+            else:
+                primary.limiter.release()
+                if not launch():  # failover
+                    raise LLMOverloaded(503, f"{primary.name}: model unavailable, try again shortly",
+                                        retry_after=max(1, round(primary.breaker.cooldown)))
+
+        give_up_at = time.monotonic() + settings.LLM_FIRST_TOKEN_TIMEOUT_SECONDS
+        winner = first = None
+        try:
+            # ── Race for the first token ──
+            while winner is None:
+                live = [a for a in attempts if not a.finished]
+                if not live:
+                    if not launch():  # failover
+                        break
+                    continue
+                now = time.monotonic()
+                if now >= give_up_at:
+                    break
+                newest = attempts[-1]
+                wait = give_up_at - now
+                if candidates:
+                    wait = min(wait, newest.started + newest.provider.ttft_seconds - now)
+                getters = {asyncio.ensure_future(a.queue.get()): a for a in live}
+                done, pending = await asyncio.wait(getters, timeout=max(0.0, wait), return_when=asyncio.FIRST_COMPLETED)
+                for g in pending:
+                    g.cancel()
+                if not done:
+                    if candidates and time.monotonic() < give_up_at:
+                        newest.provider.ttft_misses += 1
+                        log.info(f"[LLM] {newest.provider.name}: no token after {newest.provider.ttft_seconds}s → hedging")
+                        launch(hedge=True)
+                    continue
+                for g in done:
+                    attempt = getters[g]
+                    kind, value = g.result()
+                    if kind == "token" and winner is None:
+                        winner, first = attempt, value
+                    elif kind == "error":
+                        attempt.fail(value)
+                    elif kind == "done":
+                        attempt.fail(RuntimeError("empty response"))
+
+            if winner is None:
+                # Still silent at the deadline → a failure for the breaker (the finally stops the tasks)
+                for attempt in attempts:
+                    if not attempt.finished:
+                        attempt.fail(TimeoutError("no first token"))
+                yield LLM_ERROR_MESSAGE
+                return
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+
+            # ── Stream the winner ──
+            provider = winner.provider
+            first_at = time.monotonic()
+            provider.ttft.append(first_at - winner.started)
+            LLM_TTFT_SECONDS.labels(provider.name).observe(first_at - winner.started)
+            winner_tokens = LLM_TOKENS.labels(provider.name)
+            winner_tokens.inc()
+            streamed = 1
+            yield first
+            while True:
+                kind, value = await winner.queue.get()
+                if kind == "token":
+                    streamed += 1
+                    winner_tokens.inc()
+                    yield value
+                    continue
+                if kind == "done":
+                    winner.finished = True
+                    provider.wins += 1
+                    provider.breaker.success()
+                    LLM_REQUESTS.labels(provider.name, "win").inc()
+                    elapsed = time.monotonic() - first_at
+                    if streamed > 1 and elapsed > 0:
+                        LLM_TOKENS_PER_SECOND.labels(provider.name).observe((streamed - 1) / elapsed)
+                else:
+                    # Tokens already went out — can't switch providers mid-answer
+                    winner.fail(value)
+                    raise RuntimeError(f"{provider.name} failed mid-answer: {value}")
+                return
+        finally:
+            # Client disconnected / consumer stopped early → stop paying for the generation
+            for attempt in attempts:
+                if not attempt.task.done():
+                    attempt.cancel()
+
+    def stats(self):
+        return {
+            "order": [p.name for p in self.providers],
+            "no_provider_available": self.no_provider,
+            "providers": {p.name: p.stats() for p in self.providers},
+        }
+
+    async def aclose(self):
+        for provider in self.providers:
+            try:
+                await provider.aclose()
+            except Exception as e:
+                log.warning(f"[LLM] closing {provider.name}: {e}")
+
+
+llm_router = LLMRouter()
+log.info(f"[LLM] Providers: {llm_router.describe()}")
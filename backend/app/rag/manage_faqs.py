@@ -0,0 +1,71 @@
+# backend/app/rag/manage_faqs.py
+# Edit FAQs without a full rebuild or a server restart:
+#   python app/rag/manage_faqs.py add --question "..." --answer "..."
+#   python app/rag/manage_faqs.py update 42 --question "..." --answer "..."
+#   python app/rag/manage_faqs.py delete 42
+#   python app/rag/manage_faqs.py info
+# Each edit publishes a new index generation; running servers swap to it within
+# INDEX_RELOAD_CHECK_SECONDS.
+import argparse
+import json
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
+
+from app.rag import index_store
+from app.core.config import settings
+from app.rag.embedding_backends import load_backend
+from app.rag.embed_cache import CachedEncoder
+
+
+def _encoder():
+    # Same backend as the server, so new vectors are comparable with the indexed ones
+    backend = load_backend()
+    return CachedEncoder(backend).encode if settings.EMBED_CACHE_ENABLED else backend.encode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental FAQ index updates")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    add = sub.add_parser("add")
+    add.add_argument("--question", required=True)
+    add.add_argument("--answer", required=True)
+
+    update = sub.add_parser("update")
+    update.add_argument("faq_id", type=int)
+    update.add_argument("--question", required=True)
+    update.add_argument("--answer", required=True)
+
+    delete = sub.add_parser("delete")
+    delete.add_argument("faq_id", type=int)
+
+    sub.add_parser("info")
+    args = parser.parse_args()
+
+    base = index_store.load_current()
+    if args.command == "info":
+        print(json.dumps(base.info(), indent=2))
+        return
+
+    try:
+        if args.command == "delete":
+            new_gen, ids = index_store.apply_changes(base, None, deletes=[args.faq_id])
+        else:
+            faq = {"question": args.question.strip(), "answer": args.answer.strip()}
+            if not faq["question"] or not faq["answer"]:
+                parser.error("question and answer cannot be empty")
+            faq_id = args.faq_id if args.command == "update" else None
+            new_gen, ids = index_store.apply_changes(base, _encoder(), upserts=[(faq_id, faq)])
+    except KeyError as e:
+        sys.exit(f"FAQ {e.args[0]} not found")
+    except RuntimeError as e:
+        sys.exit(str(e))
+
+    print(f"Done → ids {ids}, generation {new_gen.gen_id} ({int(new_gen.alive.sum())} FAQs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+# backend/app/rag/paraphrases.py
+#
+# Pre-generated answer paraphrases for the confidence fast path: a high-confidence
+# query gets the FAQ's answer without an LLM round-trip, reworded ahead of time
+# (build_index.py --paraphrase) so it still reads like the copilot wrote it.
+#
+#   app/data/paraphrases.jsonl         content-addressed cache, append-only:
+#                                      {"key": blake2b(question + answer), "model", "text"}
+#   <generation>/paraphrases.bin/.offsets.npy
+#                                      row-aligned column ("" = none), filled from the
+#                                      cache whenever a generation is written
+#
+# Keys cover the question AND answer, so editing a FAQ simply stops its stale
+# paraphrase from matching — the fast path then serves the stored answer.
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import unicodedata
+
+from app.core.config import settings
+from app.rag.corpus_store import StringArena
+
+PARAPHRASE_FILE = "paraphrases"
+CACHE_PATH = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "paraphrases.jsonl"))
+
+
+def _normalize(text):
+    return " ".join(unicodedata.normalize("NFC", str(text)).split())
+
+
+def content_key(question, answer):
+    text = _normalize(question) + "\0" + _normalize(answer)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def paraphrase_prompt(question, answer):
+    return f"""You are Neurostack Copilot — a world-class, friendly IT support assistant.
+Rewrite the FAQ answer below as a reply to the question: warm, clear, confident and short.
+Keep every fact, step and name exactly; add nothing. Reply with the rewritten answer only.
+Question: {question}
+FAQ answer: {answer}
+Rewritten answer:"""
+
+
+class ParaphraseCache:
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn last line from an interrupted run
+                    self.entries[row["key"]] = row["text"]
+
+    def get(self, question, answer):
+        return self.entries.get(content_key(question, answer), "")
+
+    def add(self, question, answer, text, model=None):
+        key = content_key(question, answer)
+        with self._lock:
+            self.entries[key] = text
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "model": model, "text": text}, ensure_ascii=False) + "\n")
+
+
+def write_paraphrases(gen_dir, questions, answers, cache=None):
+    """Row-aligned paraphrase column for a generation being written. Returns how many rows have one."""
+    cache = cache or ParaphraseCache()
+    found = 0
+
+    def column():
+        nonlocal found
+        for q, a in zip(questions, answers):
+            text = cache.get(q, a) if q and a else ""
+            found += bool(text)
+            yield text
+
+    StringArena.write(os.path.join(gen_dir, PARAPHRASE_FILE), column())
+    return found
+
+
+def open_paraphrases(gen_dir):
+    """The generation's paraphrase column, or None for generations written before it existed."""
+    prefix = os.path.join(gen_dir, PARAPHRASE_FILE)
+    if not os.path.exists(prefix + ".offsets.npy"):
+        return None
+    return StringArena.open(prefix)
+
+
+async def _paraphrase(router, question, answer):
+    from app.rag.llm_providers import LLM_ERROR_MESSAGE
+    text = "".join([token async for token in router.stream(paraphrase_prompt(question, answer))]).strip()
+    return None if not text or text == LLM_ERROR_MESSAGE else text
+
+
+async def generate_missing(pairs, cache=None, concurrency=None):
+    """LLM-paraphrase every (question, answer) not in the cache yet. Returns (generated, failed)."""
+    from app.rag.llm_providers import llm_router
+    cache = cache or ParaphraseCache()
+    todo = list({content_key(q, a): (q, a) for q, a in pairs if q and a and not cache.get(q, a)}.values())
+    semaphore = asyncio.Semaphore(concurrency or settings.PARAPHRASE_CONCURRENCY)
+    done = failed = 0
+
+    async def one(question, answer):
+        nonlocal done, failed
+        async with semaphore:
+            try:
+                text = await _paraphrase(llm_router, question, answer)
+            except Exception as e:
+                print(f"[PARAPHRASE] {question[:60]!r}: {e}")
+                text = None
+        if text is None:
+            failed += 1
+        else:
+            cache.add(question, answer, text, model=llm_router.primary_model())
+            done += 1
+        if (done + failed) % 50 == 0:
+            print(f"  paraphrased {done + failed}/{len(todo)} ({failed} failed)")
+
+    print(f"Paraphrasing {len(todo)} answers ({len(cache.entries)} already cached) via {llm_router.describe()}")
+    try:
+        await asyncio.gather(*(one(q, a) for q, a in todo))
+    finally:
+        await llm_router.aclose()
+    return done, failed
@@ -1,32 +1,23 @@
 # backend/app/rag/pipeline.py
-import requests
-import json
-import os
+import asyncio
+import logging
+from functools import partial
+import numpy as np
 from app.core.config import settings
-from app.rag.hybrid_retriever import hybrid_search
-from app.rag.validator import validate_relevance
-
-# ──────── BULLETPROOF HF SPACE DETECTION ────────
-IS_HF_SPACE = any([
-    os.getenv("HF_SPACE_ID"),
-    os.getenv("SPACE_ID"),
-    os.getenv("SYSTEM_PROMPT"),
-    "huggingface" in str(os.getenv("HOSTNAME", "")),
-    "hf.space" in str(os.getenv("HOSTNAME", "")),
-    os.path.exists("/etc/hf-space"),
-    os.path.exists("/var/lib/hf-space"),
-])
-
-if IS_HF_SPACE:
-    print("\n" + "="*80)
-    print("HUGGING FACE SPACE DETECTED → USING GROQ + llama-3.1-8b-instant")
-    print("="*80 + "\n")
-else:
-    print("Local dev → using Ollama")
-
-
-def stream_answer(query: str, context: str):
-    prompt = f"""You are Neurostack Copilot — a world-class, friendly IT support assistant.
+from app.rag import hybrid_retriever
+from app.rag.hybrid_retriever import hybrid_search, embed_query_async, retrieval_executor, RRF_MAX_SCORE
+from app.rag.validator import answer_tier
+from app.rag.answer_cache import answer_cache, replay_tokens
+from app.rag.llm_providers import llm_router, LLM_ERROR_MESSAGE, LLMOverloaded
+from app.rag.context_packer import naive_context, pack_context, token_counter
+from app.core.event_store import event_store
+from app.core.log import get_logger
+from app.core.metrics import ANSWERS, stage
+
+log = get_logger("pipeline")
+
+def build_prompt(query: str, context: str) -> str:
+    return f"""You are Neurostack Copilot — a world-class, friendly IT support assistant.
 INSTRUCTIONS (follow exactly):
 1. Use ONLY the information from the context below.
 2. NEVER copy the FAQ answer word-for-word. Always rephrase it naturally and conversationally.
@@ -38,79 +29,94 @@ Context:
 User Question: {query}
 Answer in a natural, human way (do NOT repeat the FAQ verbatim):"""
 
-    # ─────────────────── PRODUCTION: GROQ (llama-3.1-8b-instant) ───────────────────
-    if IS_HF_SPACE:
-        try:
-            from groq import Groq
 
-            if not settings.GROQ_API_KEY:
-                raise RuntimeError("GROQ_API_KEY missing! Add it in HF Spaces Secrets")
-
-            client = Groq(api_key=settings.GROQ_API_KEY)
-
-            stream = client.chat.completions.create(
-                model="llama-3.1-8b-instant",        # ← locked exactly as you want
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=512,
-                stream=True
-            )
-
-            # This is the OFFICIAL 2025 Groq SDK way (matches their example)
-            for chunk in stream:
-                if chunk.choices[0].delta.content is not None:
-                    yield chunk.choices[0].delta.content
-
-            return  # success → stop here
-
-        except Exception as e:
-            print(f"[GROQ ERROR] {e}")
-            yield "Sorry, I'm having a moment. Try again in 5 seconds."
-            return
-
-    # ─────────────────── LOCAL DEV: OLLAMA (100% UNTOUCHED) ───────────────────
-    try:
-        response = requests.post(
-            f"{settings.OLLAMA_BASE_URL}/api/generate",
-            json={
-                "model": settings.OLLAMA_MODEL,
-                "prompt": prompt,
-                "stream": True,
-                "options": {
-                    "temperature": 0.2,
-                    "num_ctx": 4096,
-                }
-            },
-            stream=True,
-            timeout=120
-        )
-        response.raise_for_status()
-        for line in response.iter_lines():
-            if line:
-                data = json.loads(line)
-                if data.get("done"):
-                    break
-                token = data.get("response", "")
-                if token.strip():
-                    yield token
-    except Exception as e:
-        print(f"[OLLAMA ERROR] {e}")
-        yield "Sorry, I'm having trouble connecting to the model right now. Please try again in a moment."
-
-
-async def stream_rag_pipeline(query: str):
-    print(f"\n[QUERY] {query}")
-    results = hybrid_search(query, k=6, alpha=0.75)
-
-    print(f"[RETRIEVED] {len(results)} chunks, scores: {[r['score'] for r in results]}")
-    if not validate_relevance(results, threshold=0.008):
-        print("[BLOCKED] Low relevance")
+async def stream_answer(query: str, context: str, user: str = None):
+    """Async token stream — pooled provider clients, TTFT hedging + failover, per-user fair admission."""
+    async for token in llm_router.stream(build_prompt(query, context), user=user):
+        yield token
+
+
+def assemble_context(query, results, bm25):
+    """Token-budgeted context for the likely-answering model, plus prompt-token counts before/after."""
+    model = llm_router.primary_model()
+    naive = naive_context(results)
+    if settings.CONTEXT_PACKING_ENABLED:
+        context, report = pack_context(query, results, model, bm25=bm25)
+    else:
+        context, report = naive, {"model": model, "chunks_in": len(results), "chunks_used": len(results)}
+    counter = token_counter(model)
+    report["prompt_tokens_before"] = counter.count(build_prompt(query, naive))
+    report["prompt_tokens_after"] = counter.count(build_prompt(query, context))
+    return context, report
+
+
+def confidence_tier(query_emb, results):
+    """
+    ("low" | "mid" | "high", answer). For "high" the answer comes straight from the
+    top FAQ — its pre-generated paraphrase if the generation has one, else the stored answer.
+    """
+    gen = hybrid_retriever.generation
+    similarities = None
+    if settings.FAST_PATH_ENABLED and gen is not None and gen.vectors is not None and results:
+        ids = [r["id"] for r in results]
+        # Only trust the stored vectors if no hot swap happened since the search
+        if all(gen.questions[i] == r["question"] for i, r in zip(ids, results)):
+            similarities = (np.asarray(gen.vectors[ids], dtype=np.float32) @ query_emb[0]).tolist()
+    tier = answer_tier(
+        results, similarities, RRF_MAX_SCORE, threshold=0.008,
+        min_relevance=settings.FAST_PATH_MIN_RELEVANCE,
+        min_similarity=settings.FAST_PATH_MIN_SIMILARITY,
+        min_margin=settings.FAST_PATH_MIN_MARGIN,
+    )
+    if tier != "high":
+        return tier, None
+    top = max(results, key=lambda r: r["score"])
+    faq = gen.faqs[top["id"]]
+    if isinstance(faq, dict) and faq.get("chunks"):
+        return "mid", None  # ingest chunk row: the stored answer is only part of the FAQ
+    paraphrase = gen.paraphrases[top["id"]] if settings.FAST_PATH_PARAPHRASE and gen.paraphrases is not None else ""
+    return tier, paraphrase or top["answer"]
+
+
+def record_retrieval(results, with_sources, cache_hit=False, tier=None):
+    """Feed /analytics: top fused score, normalized to 0–1 (1.0 = rank 1 in FAISS and BM25)."""
+    top_score = max((r["score"] for r in results), default=0.0)
+    event_store.append(
+        "retrieval",
+        top_score=top_score,
+        relevance=round(min(1.0, top_score / RRF_MAX_SCORE), 4),
+        with_sources=with_sources,
+        cache_hit=cache_hit,
+        chunks=len(results) if with_sources else 0,
+        tier=tier,
+    )
+
+
+async def stream_rag_pipeline(query: str, filters=None, user: str = None):
+    log.debug("[QUERY] %s%s", query, f" {filters}" if filters else "")
+    query_emb = await embed_query_async(query)
+    index_version = hybrid_retriever.index_version  # before retrieval, so a hot swap can't mislabel the cache entry
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(
+        retrieval_executor,
+        partial(hybrid_search, query, k=6, alpha=0.75, query_emb=query_emb, filters=filters)
+    )
+
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(f"[RETRIEVED] {len(results)} chunks, scores: {[r['score'] for r in results]}")
+    with stage("validation"):
+        tier, direct_answer = confidence_tier(query_emb, results)
+    if tier == "low":
+        log.debug("[BLOCKED] Low relevance")
+        ANSWERS.labels("blocked").inc()
+        record_retrieval(results, with_sources=False, tier=tier)
         yield {"answer": "I don't have enough information to answer this accurately."}
         yield {"chunks": []}
         return
 
     chunks = [
         {
+            "id": r["id"],
             "question": r["question"],
             "answer": r["answer"],
             "score": round(r["score"], 4),
@@ -119,20 +125,67 @@ async def stream_rag_pipeline(query: str):
         for r in results
     ]
 
-    context = "\n\n".join([f"Q: {r['question']}\nA: {r['answer']}" for r in results])
-    print(f"[CONTEXT SENT TO GROQ (llama-3.1-8b-instant)] {len(context)} chars")
+    # ───── Fast path: unambiguous match for a known FAQ → no LLM round-trip ─────
+    if direct_answer:
+        log.debug("[FAST PATH] High confidence → answering from the FAQ")
+        ANSWERS.labels("fast_path").inc()
+        record_retrieval(results, with_sources=True, tier=tier)
+        for token in replay_tokens(direct_answer):
+            yield {"token": token}
+        yield {"answer": direct_answer}
+        yield {"chunks": chunks}
+        log.debug("[STREAM COMPLETE]")
+        return
+
+    # ───── Semantic answer cache ─────
+    chunk_ids = [r["id"] for r in results]
+    if settings.ANSWER_CACHE_ENABLED:
+        cached = answer_cache.lookup(query_emb, chunk_ids, index_version)
+        if cached is not None:
+            log.debug("[CACHE HIT] Replaying cached answer")
+            ANSWERS.labels("cache").inc()
+            record_retrieval(results, with_sources=True, cache_hit=True, tier=tier)
+            for token in replay_tokens(cached):
+                yield {"token": token}
+            yield {"answer": cached}
+            yield {"chunks": chunks}
+            log.debug("[STREAM COMPLETE]")
+            return
 
-    full_answer = ""
+    record_retrieval(results, with_sources=True, tier=tier)
+    ANSWERS.labels("llm").inc()
+    with stage("context"):
+        context, report = await loop.run_in_executor(
+            retrieval_executor, assemble_context, query, results, hybrid_retriever.bm25
+        )
+    event_store.append(
+        "context",
+        prompt_tokens_before=report["prompt_tokens_before"],
+        prompt_tokens_after=report["prompt_tokens_after"],
+        chunks_used=report["chunks_used"],
+        duplicates_dropped=report.get("duplicates_dropped", 0),
+        answers_trimmed=report.get("answers_trimmed", 0),
+        model=report["model"],
+    )
+    log.debug("[CONTEXT SENT TO LLM (%s)] %s/%s chunks, prompt %s → %s tokens", llm_router.describe(),
+              report["chunks_used"], len(results), report["prompt_tokens_before"], report["prompt_tokens_after"])
+
+    parts = []  # joined once at the end — `+=` per token is quadratic on long answers
     try:
-        for token in stream_answer(query, context):
-            full_answer += token
+        async for token in stream_answer(query, context, user):
+            parts.append(token)
             yield {"token": token}
-        yield {"answer": full_answer.strip() or "No answer generated."}
+        final_answer = "".join(parts).strip()
+        yield {"answer": final_answer or "No answer generated."}
         yield {"chunks": chunks}
-        print("[STREAM SUCCESS] Answer sent")
+        log.debug("[STREAM SUCCESS] Answer sent")
+        if settings.ANSWER_CACHE_ENABLED and final_answer and final_answer != LLM_ERROR_MESSAGE:
+            answer_cache.store(query_emb, chunk_ids, final_answer, index_version)
+    except LLMOverloaded:
+        raise  # nothing streamed yet → the route reports it in the stream
     except Exception as e:
-        print(f"[STREAM FAILED] {e}")
-        yield {"answer": full_answer.strip() or "Sorry, the model took too long."}
+        log.warning(f"[STREAM FAILED] {e}")
+        yield {"answer": "".join(parts).strip() or "Sorry, the model took too long."}
         yield {"chunks": chunks}
-        print("[FALLBACK] Final chunks sent anyway")
-    print("[STREAM COMPLETE]")
+        log.warning("[FALLBACK] Final chunks sent anyway")
+    log.debug("[STREAM COMPLETE]")
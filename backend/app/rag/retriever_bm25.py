@@ -6,18 +6,17 @@ FAQ_PATH = "app/data/faqs.json"
 class BM25Retriever:
     def __init__(self):
         self.docs = []
-        if FAQ_PATH:
+        self.bm25 = None
+
+    def retrieve(self, query, k=5):
+        if self.bm25 is None:
             try:
                 self.docs = json.load(open(FAQ_PATH))
             except:
                 pass
-
-        tokenized = [d["content"].lower().split() for d in self.docs]
-        self.bm25 = BM25Okapi(tokenized)
-
-    def retrieve(self, query, k=5):
+            self.bm25 = BM25Okapi([d["content"].lower().split() for d in self.docs])
         scores = self.bm25.get_scores(query.lower().split())
         top = sorted(list(enumerate(scores)), key=lambda x: x[1], reverse=True)[:k]
         return [(self.docs[i], float(score)) for i, score in top]
 
-bm25 = BM25Retriever()
+bm25 = BM25Retriever()  # index is built on first retrieve
@@ -0,0 +1,389 @@
+# backend/app/rag/sparse_bm25.py
+import json
+import os
+from collections import Counter
+
+import numpy as np
+
+from app.rag.corpus_store import StringArena
+
+
+class SparseBM25:
+    """
+    BM25Okapi-compatible scorer over a term-major CSR postings matrix.
+
+    Row t of the matrix holds (doc_id, tf) for every document containing term t.
+    IDF per term and the length norm k1 * (1 - b + b * dl / avgdl) per document
+    are precomputed, so scoring a query only touches the postings of its terms —
+    no Python loop over the corpus like rank_bm25's get_scores.
+    """
+
+    def __init__(self, terms, indptr, doc_ids, tfs, idf, doc_len, k1=1.5, b=0.75, epsilon=0.25,
+                 alive=None, norms=None):
+        # In memory: a list + dict. Memory-mapped: a sorted StringArena, looked up by binary search
+        if isinstance(terms, StringArena):
+            self.terms, self._vocab = terms, None
+        else:
+            self.terms = list(terms)
+            self._vocab = {t: i for i, t in enumerate(self.terms)}
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.tfs = np.asarray(tfs, dtype=np.float32)
+        self.idf = np.asarray(idf, dtype=np.float64)
+        self.doc_len = np.asarray(doc_len, dtype=np.float64)
+        self.k1 = float(k1)
+        self.b = float(b)
+        self.epsilon = float(epsilon)
+        # Deleted documents keep their row (doc ids are stable) but have no postings
+        # and don't count towards corpus size / avgdl
+        self.alive = np.ones(len(self.doc_len), dtype=bool) if alive is None else np.asarray(alive, dtype=bool)
+
+        self.corpus_size = int(self.alive.sum())
+        self.avgdl = float(self.doc_len[self.alive].sum() / self.corpus_size) if self.corpus_size else 0.0
+        if norms is not None:
+            self.norms = norms
+        elif self.avgdl > 0:
+            self.norms = self.k1 * (1 - self.b + self.b * self.doc_len / self.avgdl)
+        else:
+            self.norms = np.full(len(self.doc_len), self.k1 * (1 - self.b))
+
+    def term_id(self, term):
+        if self._vocab is not None:
+            return self._vocab.get(term, -1)
+        return self.terms.find(term)
+
+    # ───── construction ─────
+    @staticmethod
+    def _sorted_vocab(terms, rows):
+        """Sort terms (so the on-disk vocab is binary-searchable) and remap posting rows to match."""
+        order = sorted(range(len(terms)), key=terms.__getitem__)
+        remap = np.empty(len(terms), dtype=np.int64)
+        remap[order] = np.arange(len(terms))
+        return [terms[i] for i in order], remap[rows]
+
+    @staticmethod
+    def _compute_idf(df, corpus_size, epsilon):
+        """Exactly BM25Okapi._calc_idf, vectorized. Terms with df == 0 (all their docs deleted) get 0."""
+        idf = np.zeros(len(df), dtype=np.float64)
+        present = df > 0
+        idf[present] = np.log(corpus_size - df[present] + 0.5) - np.log(df[present] + 0.5)
+        if present.any():
+            eps = epsilon * idf[present].mean()
+            idf[present & (idf < 0)] = eps
+        return idf
+
+    @classmethod
+    def _from_doc_freqs(cls, doc_freqs, k1, b, epsilon, idf_by_term=None):
+        vocab = {}
+        rows, docs, tfs = [], [], []
+        doc_len = np.zeros(len(doc_freqs), dtype=np.float64)
+        for d, freqs in enumerate(doc_freqs):
+            doc_len[d] = sum(freqs.values())
+            for term, tf in freqs.items():
+                rows.append(vocab.setdefault(term, len(vocab)))
+                docs.append(d)
+                tfs.append(tf)
+
+        terms, rows = cls._sorted_vocab(list(vocab), np.asarray(rows, dtype=np.int64))
+        order = np.argsort(rows, kind="stable")   # doc ids stay sorted within each row
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(terms)), out=indptr[1:])
+
+        if idf_by_term is None:
+            df = np.diff(indptr).astype(np.float64)
+            idf = cls._compute_idf(df, len(doc_freqs), epsilon)
+        else:
+            idf = np.array([idf_by_term.get(t, 0.0) for t in terms], dtype=np.float64)
+
+        return cls(
+            terms,
+            indptr,
+            np.asarray(docs, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.float32)[order],
+            idf,
+            doc_len,
+            k1=k1, b=b, epsilon=epsilon,
+        )
+
+    @classmethod
+    def from_corpus(cls, tokenized_corpus, k1=1.5, b=0.75, epsilon=0.25):
+        return cls._from_doc_freqs([Counter(doc) for doc in tokenized_corpus], k1, b, epsilon)
+
+    @classmethod
+    def from_bm25okapi(cls, bm25):
+        """Convert a pickled rank_bm25.BM25Okapi without re-tokenizing anything."""
+        return cls._from_doc_freqs(bm25.doc_freqs, bm25.k1, bm25.b, bm25.epsilon, idf_by_term=bm25.idf)
+
+    # ───── incremental updates ─────
+    def with_changes(self, upserts=None, deletes=()):
+        """
+        New SparseBM25 with documents added/replaced/removed — no re-tokenizing
+        of the rest of the corpus. `upserts` maps doc_id → tokens (a doc_id past
+        the end appends a row); `deletes` are doc_ids to tombstone.
+        The current object is left untouched so in-flight searches stay valid.
+        """
+        upserts = upserts or {}
+        n_rows = max([len(self.doc_len)] + [d + 1 for d in upserts])
+        touched = np.fromiter(set(upserts) | set(deletes), dtype=np.int64)
+
+        # Existing postings as (term, doc, tf), minus every touched document
+        rows = np.repeat(np.arange(len(self.terms), dtype=np.int64), np.diff(self.indptr))
+        keep = ~np.isin(self.doc_ids, touched)
+        rows, docs, tfs = rows[keep], self.doc_ids[keep].astype(np.int64), self.tfs[keep]
+
+        doc_len = np.zeros(n_rows, dtype=np.float64)
+        doc_len[: len(self.doc_len)] = self.doc_len
+        alive = np.zeros(n_rows, dtype=bool)
+        alive[: len(self.alive)] = self.alive
+        doc_len[touched] = 0
+        alive[touched] = False
+
+        terms = list(self.terms)
+        vocab = {t: i for i, t in enumerate(terms)}
+        new_rows, new_docs, new_tfs = [], [], []
+        for doc_id, tokens in upserts.items():
+            freqs = Counter(tokens)
+            doc_len[doc_id] = sum(freqs.values())
+            alive[doc_id] = True
+            for term, tf in freqs.items():
+                if term not in vocab:
+                    vocab[term] = len(terms)
+                    terms.append(term)
+                new_rows.append(vocab[term])
+                new_docs.append(doc_id)
+                new_tfs.append(tf)
+
+        rows = np.concatenate([rows, np.asarray(new_rows, dtype=np.int64)])
+        terms, rows = self._sorted_vocab(terms, rows)
+        docs = np.concatenate([docs, np.asarray(new_docs, dtype=np.int64)])
+        tfs = np.concatenate([tfs, np.asarray(new_tfs, dtype=np.float32)])
+
+        order = np.lexsort((docs, rows))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(terms)), out=indptr[1:])
+        idf = self._compute_idf(np.diff(indptr).astype(np.float64), int(alive.sum()), self.epsilon)
+
+        return SparseBM25(
+            terms, indptr, docs[order].astype(np.int32), tfs[order], idf, doc_len,
+            k1=self.k1, b=self.b, epsilon=self.epsilon, alive=alive,
+        )
+
+    # ───── persistence ─────
+    _ARRAYS = ("indptr", "doc_ids", "tfs", "idf", "doc_len", "norms", "alive")
+
+    def save_dir(self, path):
+        """One .npy per array + a sorted term arena, so load_dir can memory-map everything."""
+        os.makedirs(path, exist_ok=True)
+        StringArena.write(os.path.join(path, "terms"), self.terms)
+        for name in self._ARRAYS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "params.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "epsilon": self.epsilon}, f)
+
+    @classmethod
+    def load_dir(cls, path, mmap=True):
+        mode = "r" if mmap else None
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode) for name in cls._ARRAYS}
+        with open(os.path.join(path, "params.json"), "r", encoding="utf-8") as f:
+            params = json.load(f)
+        return cls(StringArena.open(os.path.join(path, "terms"), mmap=mmap), **arrays, **params)
+
+    @classmethod
+    def load(cls, path):
+        """bm25_sparse.npz written by older builds (loaded fully into memory)."""
+        with np.load(path, allow_pickle=False) as data:
+            k1, b, epsilon = data["params"].tolist()
+            return cls(
+                data["terms"].tolist(),
+                data["indptr"],
+                data["doc_ids"],
+                data["tfs"],
+                data["idf"],
+                data["doc_len"],
+                k1=k1, b=b, epsilon=epsilon,
+                alive=data["alive"] if "alive" in data.files else None,
+            )
+
+    @classmethod
+    def merge_dirs(cls, out_path, shard_paths, k1=1.5, b=0.75, epsilon=0.25):
+        """
+        Concatenate shard indexes (each saved with save_dir, doc ids local to the shard)
+        into one index at `out_path`, in save_dir's layout. Postings are streamed into
+        memory-mapped arrays one shard at a time — only the vocabulary is held in memory.
+        Returns (n_docs, n_terms).
+        """
+        shards = [cls.load_dir(p) for p in shard_paths]
+        terms = sorted(set().union(*(iter(s.terms) for s in shards)))
+        vocab = {t: i for i, t in enumerate(terms)}
+        remaps = [np.fromiter((vocab[t] for t in s.terms), dtype=np.int64, count=len(s.terms)) for s in shards]
+        del vocab
+
+        df = np.zeros(len(terms), dtype=np.int64)
+        for s, remap in zip(shards, remaps):
+            df[remap] += np.diff(s.indptr)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        n_docs = sum(len(s.doc_len) for s in shards)
+
+        os.makedirs(out_path, exist_ok=True)
+        StringArena.write(os.path.join(out_path, "terms"), terms)
+        del terms
+        open_memmap = np.lib.format.open_memmap
+        doc_ids = open_memmap(os.path.join(out_path, "doc_ids.npy"), "w+", np.int32, (int(indptr[-1]),))
+        tfs = open_memmap(os.path.join(out_path, "tfs.npy"), "w+", np.float32, (int(indptr[-1]),))
+        doc_len = open_memmap(os.path.join(out_path, "doc_len.npy"), "w+", np.float64, (n_docs,))
+
+        # Shards come in doc order and are term-major inside, so appending each shard's
+        # postings at the end of their global row keeps doc ids sorted within every row
+        cursor = indptr[:-1].copy()
+        base = 0
+        for s, remap in zip(shards, remaps):
+            counts = np.diff(s.indptr)
+            rows = np.repeat(remap, counts)
+            pos = cursor[rows] + (np.arange(len(rows)) - np.repeat(s.indptr[:-1], counts))
+            doc_ids[pos] = np.asarray(s.doc_ids) + base
+            tfs[pos] = s.tfs
+            cursor[remap] += counts
+            doc_len[base:base + len(s.doc_len)] = s.doc_len
+            base += len(s.doc_len)
+
+        avgdl = float(doc_len.sum() / n_docs) if n_docs else 0.0
+        norms = k1 * (1 - b + b * np.asarray(doc_len) / avgdl) if avgdl > 0 else np.full(n_docs, k1 * (1 - b))
+        for arr in (doc_ids, tfs, doc_len):
+            arr.flush()
+        np.save(os.path.join(out_path, "indptr.npy"), indptr)
+        np.save(os.path.join(out_path, "idf.npy"), cls._compute_idf(df.astype(np.float64), n_docs, epsilon))
+        np.save(os.path.join(out_path, "norms.npy"), norms)
+        np.save(os.path.join(out_path, "alive.npy"), np.ones(n_docs, dtype=bool))
+        with open(os.path.join(out_path, "params.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": k1, "b": b, "epsilon": epsilon}, f)
+        return n_docs, len(indptr) - 1
+
+    # ───── scoring ─────
+    def score_candidates(self, query_tokens, selection=None):
+        """
+        (doc_ids, scores) for every document sharing at least one term with the query.
+        With a filters.Selection only its documents are scored — small slices are
+        looked up in the posting lists instead of scanning them.
+        """
+        ids = {t: self.term_id(t) for t in set(query_tokens)}
+        counts = Counter(ids[t] for t in query_tokens if ids[t] >= 0)
+        if not counts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        rows = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        qtf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        if selection is not None and len(selection.ids) * len(rows) < int((ends - starts).sum()):
+            return self._score_selection(rows, qtf, starts, ends, selection.ids)
+
+        docs = np.concatenate([self.doc_ids[s:e] for s, e in zip(starts, ends)])
+        tf = np.concatenate([self.tfs[s:e] for s, e in zip(starts, ends)]).astype(np.float64)
+        term_weight = np.repeat(self.idf[rows] * qtf, ends - starts)
+
+        contrib = term_weight * (tf * (self.k1 + 1) / (tf + self.norms[docs]))
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=contrib, minlength=len(candidates))
+        if selection is not None:
+            keep = selection.mask[candidates]
+            candidates, scores = candidates[keep], scores[keep]
+        return candidates, scores
+
+    def _score_selection(self, rows, qtf, starts, ends, doc_ids):
+        """Binary-search each selected doc in each query term's (doc-sorted) posting list."""
+        scores = np.zeros(len(doc_ids), dtype=np.float64)
+        matched = np.zeros(len(doc_ids), dtype=bool)
+        norms = self.norms[doc_ids]
+        for weight, s, e in zip(self.idf[rows] * qtf, starts, ends):
+            postings = self.doc_ids[s:e]
+            pos = np.searchsorted(postings, doc_ids)
+            found = pos < len(postings)
+            found[found] = postings[pos[found]] == doc_ids[found]
+            tf = self.tfs[s + pos[found]].astype(np.float64)
+            scores[found] += weight * (tf * (self.k1 + 1) / (tf + norms[found]))
+            matched |= found
+        return doc_ids[matched].astype(np.int32), scores[matched]
+
+    def get_scores(self, query_tokens):
+        """Dense score vector — same output as BM25Okapi.get_scores."""
+        scores = np.zeros(len(self.doc_len), dtype=np.float64)
+        candidates, cand_scores = self.score_candidates(query_tokens)
+        scores[candidates] = cand_scores
+        return scores
+
+    def top_k(self, query_tokens, k, selection=None):
+        """Best k (doc_ids, scores), highest first, selected with argpartition."""
+        candidates, scores = self.score_candidates(query_tokens, selection)
+        if len(candidates) > k:
+            # Everything above the k-th score, then ties at the boundary by lowest doc id
+            kth = -np.partition(-scores, k - 1)[k - 1]
+            tied = np.flatnonzero(scores == kth)[: k - int((scores > kth).sum())]
+            keep = np.concatenate([np.flatnonzero(scores > kth), tied])
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
+
+    def _batch_postings(self, tokenized_queries):
+        """(query_idx, doc_ids, contrib) of every posting hit by every query, in query-term order."""
+        ids = {t: self.term_id(t) for t in set().union(*map(set, tokenized_queries))}  # shared words looked up once
+        qidx, rows, qtf = [], [], []
+        for i, tokens in enumerate(tokenized_queries):
+            counts = Counter(ids[t] for t in tokens if ids[t] >= 0)
+            qidx.extend([i] * len(counts))
+            rows.extend(counts.keys())
+            qtf.extend(counts.values())
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lens = ends - starts
+        # Positions of every posting of every (query, term) pair, gathered in one shot
+        pos = np.repeat(starts - (np.cumsum(lens) - lens), lens) + np.arange(int(lens.sum()))
+        docs = self.doc_ids[pos].astype(np.int64)
+        tf = self.tfs[pos].astype(np.float64)
+        term_weight = np.repeat(self.idf[rows] * np.asarray(qtf, dtype=np.float64), lens)
+        contrib = term_weight * (tf * (self.k1 + 1) / (tf + self.norms[docs]))
+        return np.repeat(np.asarray(qidx, dtype=np.int64), lens), docs, contrib
+
+    def top_k_batch(self, tokenized_queries, k, selection=None, max_cells=1 << 22):
+        """
+        top_k for many queries at once. The sparse (query × term) · (term × doc) product
+        is accumulated into a dense block of scores, a few thousand cells per query, and
+        the top k of every row is selected in one vectorized pass. Same results as top_k.
+        """
+        n_docs = len(self.doc_len)
+        step = max(1, max_cells // max(1, n_docs))
+        out = []
+        for start in range(0, len(tokenized_queries), step):
+            block = tokenized_queries[start:start + step]
+            qidx, docs, contrib = self._batch_postings(block)
+            keys = qidx * n_docs + docs
+            cells = len(block) * n_docs
+            scores = np.bincount(keys, weights=contrib, minlength=cells).reshape(len(block), n_docs)
+            present = np.bincount(keys, minlength=cells).reshape(len(block), n_docs) > 0
+            if selection is not None:
+                present &= selection.mask
+            scores[~present] = -np.inf
+
+            # k-th best score per row; ties at the boundary go to the lowest doc ids (as in top_k)
+            kk = min(k, n_docs)
+            kth = -np.partition(-scores, kk - 1, axis=1)[:, kk - 1:kk]
+            above = scores > kth
+            tied = (scores == kth) & present
+            need = kk - above.sum(axis=1, keepdims=True)
+            selected = above | (tied & (np.cumsum(tied, axis=1) <= need))
+
+            rows, cols = np.nonzero(selected)
+            vals = scores[rows, cols]
+            order = np.lexsort((cols, -vals, rows))
+            rows, cols, vals = rows[order], cols[order], vals[order]
+            bounds = np.searchsorted(rows, np.arange(len(block) + 1))
+            out.extend((cols[s:e], vals[s:e]) for s, e in zip(bounds[:-1], bounds[1:]))
+        return out
+
+
+def check_parity(sparse, bm25okapi, queries, atol=1e-6):
+    """Max abs score difference vs rank_bm25 over the given tokenized queries."""
+    worst = 0.0
+    for tokens in queries:
+        expected = np.asarray(bm25okapi.get_scores(tokens), dtype=np.float64)
+        worst = max(worst, float(np.max(np.abs(sparse.get_scores(tokens) - expected), initial=0.0)))
+    return worst, worst <= atol
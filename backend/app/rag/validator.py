@@ -1,4 +1,9 @@
 # backend/app/rag/validator.py
+from app.core.log import get_logger
+
+log = get_logger("validator")
+
+
 def validate_relevance(results, threshold=0.008):  # ← LOWERED FROM 0.018
     """
     RRF scores are usually between 0.005 and 0.03
@@ -8,6 +13,30 @@ def validate_relevance(results, threshold=0.008):  # ← LOWERED FROM 0.018
         return False
     
     max_score = max(item.get("score", 0) for item in results)
-    print(f"[VALIDATOR] Max relevance score: {max_score:.5f} | Threshold: {threshold}")
+    log.debug("[VALIDATOR] Max relevance score: %.5f | Threshold: %s", max_score, threshold)
     
-    return max_score > threshold
\ No newline at end of file
+    return max_score > threshold
+
+def answer_tier(results, similarities, max_score, threshold=0.008,
+                min_relevance=0.98, min_similarity=0.92, min_margin=0.05):
+    """
+    "low"  → refuse (validate_relevance fails)
+    "high" → answer straight from the FAQ: top hit is (nearly) rank 1 in FAISS AND
+             BM25, the query is a near-verbatim match of its question, and no other
+             FAQ with a different answer comes close
+    "mid"  → everything else goes to the LLM
+    similarities: cosine(query, question) per result, same order as `results`
+    """
+    if not validate_relevance(results, threshold=threshold):
+        return "low"
+    if similarities is None or len(similarities) != len(results):
+        return "mid"
+    top = max(range(len(results)), key=lambda i: results[i].get("score", 0))
+    relevance = results[top].get("score", 0) / max_score
+    runner_up = max(
+        (similarities[i] for i in range(len(results)) if results[i]["answer"] != results[top]["answer"]),
+        default=-1.0,
+    )
+    if relevance >= min_relevance and similarities[top] >= min_similarity and similarities[top] - runner_up >= min_margin:
+        return "high"
+    return "mid"
@@ -0,0 +1,106 @@
+# backend/app/routes/admin_routes.py
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from app.core.config import settings
+from app.core.procmem import worker_report
+from app.utils.hash_pool import hash_pool
+from app.rag import hybrid_retriever, index_store
+from app.rag.lifecycle import require_rag_ready
+from app.rag.llm_providers import llm_router
+from app.core import auth_cache
+from app.core.auth_cache import get_current_user
+
+# Only the index / FAQ endpoints wait for the RAG system: auth and pool admin work during startup
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+class FAQIn(BaseModel):
+    question: str
+    answer: str
+
+    model_config = {"extra": "allow"}  # keep extra metadata fields on the FAQ
+
+
+def get_admin_user(current_user: str = Depends(get_current_user)):
+    admins = {u.strip() for u in settings.ADMIN_USERNAMES.split(",") if u.strip()}
+    if current_user not in admins:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
+
+def _apply(upserts=(), deletes=()):
+    base = hybrid_retriever.current_generation()
+    try:
+        new_gen, ids = index_store.apply_changes(
+            base, hybrid_retriever.encode_texts, upserts=upserts, deletes=deletes
+        )
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"FAQ {e.args[0]} not found")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    hybrid_retriever.swap_generation(new_gen)
+    return {"ids": ids, "index": new_gen.info()}
+
+
+def _validated(payload: FAQIn):
+    faq = payload.model_dump()
+    faq["question"], faq["answer"] = faq["question"].strip(), faq["answer"].strip()
+    if not faq["question"] or not faq["answer"]:
+        raise HTTPException(status_code=400, detail="Question and answer cannot be empty")
+    return faq
+
+
+# Blocking work (encode + write generation) → plain `def`, runs in FastAPI's threadpool
+@router.get("/index", dependencies=[Depends(require_rag_ready)])
+def index_info(admin: str = Depends(get_admin_user)):
+    return hybrid_retriever.current_generation().info()
+
+
+@router.post("/index/reload", dependencies=[Depends(require_rag_ready)])
+def reload_index(admin: str = Depends(get_admin_user)):
+    return hybrid_retriever.reload_generation().info()
+
+
+@router.get("/workers")
+def workers_info(admin: str = Depends(get_admin_user)):
+    """Per-worker memory: with a preloaded master, `private_mb` is the cost of one more worker."""
+    return worker_report()
+
+
+@router.get("/llm")
+def llm_info(admin: str = Depends(get_admin_user)):
+    """LLM providers: order, TTFT p50/p95, hedges/wins/failures and circuit-breaker state."""
+    return llm_router.stats()
+
+
+@router.get("/auth/hashing")
+def hashing_info(admin: str = Depends(get_admin_user)):
+    """Password-hash pool: in-flight, rejections, p50/p95 latency per operation, rehash-on-login count."""
+    return hash_pool.stats()
+
+
+@router.get("/auth/cache")
+def auth_cache_info(admin: str = Depends(get_admin_user)):
+    return auth_cache.stats()
+
+
+@router.post("/users/{username}/revoke")
+def revoke_user_tokens(username: str, admin: str = Depends(get_admin_user)):
+    """Sign a user out everywhere (all tokens issued until now)."""
+    auth_cache.revoke_user(username)
+    return {"status": "revoked", "username": username}
+
+
+@router.post("/faqs", dependencies=[Depends(require_rag_ready)])
+def add_faq(payload: FAQIn, admin: str = Depends(get_admin_user)):
+    return _apply(upserts=[(None, _validated(payload))])
+
+
+@router.put("/faqs/{faq_id}", dependencies=[Depends(require_rag_ready)])
+def update_faq(faq_id: int, payload: FAQIn, admin: str = Depends(get_admin_user)):
+    return _apply(upserts=[(faq_id, _validated(payload))])
+
+
+@router.delete("/faqs/{faq_id}", dependencies=[Depends(require_rag_ready)])
+def delete_faq(faq_id: int, admin: str = Depends(get_admin_user)):
+    return _apply(deletes=[faq_id])
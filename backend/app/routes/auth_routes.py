@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from starlette.concurrency import run_in_threadpool
 from app.utils.schema import UserCreate, TokenResponse
+from app.utils.hash_pool import hash_pool
 from app.core.security import create_access_token
 from app.core.auth import SessionLocal
+from app.core.auth_cache import get_current_user, revoke_token, invalidate_user
 from app.models.user import User
 from sqlalchemy.orm import Session
 
@@ -14,31 +17,59 @@ def get_db():
     finally:
         db.close()
 
+# Handlers are async: Argon2 runs in app.utils.hash_pool (its own processes) and is
+# awaited, DB calls go to the threadpool — a login burst can't pin request threads.
+
 # REGISTER
 @router.post("/register", response_model=TokenResponse)
-def register(payload: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(User.username == payload.username).first()
+async def register(payload: UserCreate, db: Session = Depends(get_db)):
+    existing = await run_in_threadpool(
+        lambda: db.query(User).filter(User.username == payload.username).first()
+    )
     if existing:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    user = User(username=payload.username, password=payload.password)
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    password_hash = await hash_pool.hash(payload.password)
+
+    def save():
+        user = User(username=payload.username, password_hash=password_hash)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user
+
+    user = await run_in_threadpool(save)
+    invalidate_user(user.username)  # drop a cached "no such user"
 
     token = create_access_token({"sub": user.username})
     return {"access_token": token, "token_type": "bearer"}
 
 # LOGIN
 @router.post("/login", response_model=TokenResponse)
-def login(payload: UserCreate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == payload.username).first()
+async def login(payload: UserCreate, db: Session = Depends(get_db)):
+    user = await run_in_threadpool(
+        lambda: db.query(User).filter(User.username == payload.username).first()
+    )
 
     if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
-    if not user.verify_password(payload.password):
+    ok, new_hash = await hash_pool.verify(payload.password, user.password)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Stored hash used old parameters / scheme → upgrade it transparently
+    if new_hash:
+        def upgrade():
+            user.password = new_hash
+            db.commit()
+        await run_in_threadpool(upgrade)
+
     token = create_access_token({"sub": user.username})
     return {"access_token": token, "token_type": "bearer"}
+
+# LOGOUT — revokes this token in every worker
+@router.post("/logout")
+def logout(Authorization: str = Header(None), current_user: str = Depends(get_current_user)):
+    revoke_token(Authorization.split("Bearer ")[-1].strip())
+    return {"status": "logged out"}
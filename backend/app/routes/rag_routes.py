@@ -1,87 +1,196 @@
 # backend/app/routes/rag_routes.py
-from fastapi import APIRouter, Header, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
 from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from app.rag.pipeline import stream_rag_pipeline
-from app.core.security import decode_token  # your JWT decode function
+from app.rag.answer_cache import answer_cache
+from app.rag import hybrid_retriever
+from app.rag.hybrid_retriever import embed_batcher, batch_search, retrieval_executor, validate_filters
+from app.rag.lifecycle import require_rag_ready
+from app.core.auth_cache import get_current_user
+from app.core.chat_history import chat_history
+from app.core.config import settings
+from app.core.log import get_logger
+from app.core.metrics import SSE_FLUSH_SECONDS, SSE_FRAMES
+from app.rag.llm_providers import LLMOverloaded, llm_router
+from app.utils.sse import (
+    AnswerStream, DONE_FRAME, PipelineStream, cancel_on_disconnect, coalesced_frames, frame, legacy_frames,
+)
+from functools import partial
+import asyncio
 import json
+import time
 
 router = APIRouter(prefix="/rag")
-
-# In-memory chat history (replace with DB later if you want)
-user_chats = {}
+log = get_logger("routes")
 
 # Request schema
+# {"category": "vpn", "locale": ["en", "de"]} — fields listed in FILTER_FIELDS
+Filters = dict[str, str | list[str]] | None
+
 class RAGQuery(BaseModel):
     query: str
+    filters: Filters = None
 
-# Auth dependency
-def get_current_user(Authorization: str = Header(None)):
-    if not Authorization or not Authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Invalid or missing token")
-    
-    token = Authorization.split("Bearer ")[-1].strip()
-    username = decode_token(token)
-    if not username:
-        raise HTTPException(status_code=401, detail="Invalid or expired token")
-    
-    return username
+class BatchQuery(BaseModel):
+    queries: list[str]
+    filters: Filters = None
+    k: int = Field(5, ge=1, le=settings.BATCH_K_MAX)
+    alpha: float = Field(0.75, ge=0.0, le=1.0)
 
 @router.get("/history")
-async def get_chat_history(current_user: str = Depends(get_current_user)):
-    return user_chats.get(current_user, [])
+def get_chat_history(
+    limit: int = Query(settings.HISTORY_PAGE_SIZE, ge=1, le=settings.HISTORY_PAGE_MAX),
+    before: int | None = Query(None, description="next_cursor from the previous page"),
+    current_user: str = Depends(get_current_user)
+):
+    return chat_history.page(current_user, limit=limit, before=before)
+
+@router.get("/history/stats")
+async def get_history_stats(current_user: str = Depends(get_current_user)):
+    return chat_history.stats()
+
+@router.get("/cache/stats")
+async def get_cache_stats(current_user: str = Depends(get_current_user)):
+    return answer_cache.stats()
 
+@router.get("/embed/stats")
+async def get_embed_stats(current_user: str = Depends(get_current_user)):
+    return embed_batcher.stats()
+
+
+def check_filters(filters):
+    try:
+        validate_filters(filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/filters", dependencies=[Depends(require_rag_ready)])
+async def get_filter_values(current_user: str = Depends(get_current_user)):
+    """Filterable fields and their values (with FAQ counts) in the served index."""
+    return hybrid_retriever.current_generation().metadata.facets()
+
+@router.post("/batch", dependencies=[Depends(require_rag_ready)])
+async def rag_batch_search(
+    payload: BatchQuery,
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    current_user: str = Depends(get_current_user)
+):
+    """Retrieval only (no LLM): top-k FAQs for every query, as JSON or streamed NDJSON."""
+    queries = [q.strip() for q in payload.queries]
+    if not queries:
+        raise HTTPException(status_code=400, detail="queries cannot be empty")
+    if len(queries) > settings.BATCH_QUERY_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {settings.BATCH_QUERY_MAX} queries per request")
+    empty = [i for i, q in enumerate(queries) if not q]
+    if empty:
+        raise HTTPException(status_code=400, detail=f"Query {empty[0]} is empty")
+    check_filters(payload.filters)
 
-@router.post("/query")
+    generation = hybrid_retriever.index_version
+    started = time.perf_counter()
+
+    async def run_chunks():
+        # One search pass per chunk on the retrieval pool — bounded memory, and NDJSON
+        # lines start flowing before the whole batch is done
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(queries), settings.BATCH_CHUNK_SIZE):
+            chunk = queries[start:start + settings.BATCH_CHUNK_SIZE]
+            results = await loop.run_in_executor(
+                retrieval_executor, partial(batch_search, chunk, k=payload.k, alpha=payload.alpha, filters=payload.filters)
+            )
+            yield start, results
+
+    def stats():
+        elapsed = time.perf_counter() - started
+        log.info(f"[BATCH] {len(queries)} queries in {elapsed:.2f}s ({len(queries) / elapsed:.0f} q/s)")
+        return {
+            "queries": len(queries),
+            "seconds": round(elapsed, 3),
+            "queries_per_sec": round(len(queries) / elapsed, 1),
+            "generation": generation,
+        }
+
+    if format == "ndjson":
+        async def ndjson_lines():
+            async for start, results in run_chunks():
+                yield "".join(
+                    json.dumps({"index": start + i, "query": queries[start + i], "results": r}) + "\n"
+                    for i, r in enumerate(results)
+                )
+            yield json.dumps({"stats": stats()}) + "\n"
+
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+    all_results = []
+    async for _, results in run_chunks():
+        all_results.extend(results)
+    return {"results": all_results, "stats": stats()}
+
+
+@router.post("/query", dependencies=[Depends(require_rag_ready)])
 async def rag_query_stream(
     payload: RAGQuery,
+    request: Request,
+    stream_format: str | None = Query(
+        None, pattern="^(legacy|coalesced)$",
+        description="legacy = one SSE frame per token (default for old clients); coalesced = batched frames"
+    ),
     current_user: str = Depends(get_current_user)
 ):
     query = payload.query.strip()
     if not query:
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    check_filters(payload.filters)
+    stream_format = stream_format or settings.SSE_DEFAULT_FORMAT
+
+    # Only admission is checked before the headers go out (full LLM queues → 429); anything
+    # later (queue timeout, provider errors) is reported inside the stream
+    try:
+        llm_router.check_admission(current_user)
+    except LLMOverloaded as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+
+    # Pipeline runs in its own task; a closed connection cancels it (and the LLM call) right away
+    stream = PipelineStream(stream_rag_pipeline(query, payload.filters, user=current_user))
+    watcher = asyncio.create_task(cancel_on_disconnect(request, stream, settings.DISCONNECT_POLL_SECONDS))
 
     async def event_generator():
-        answer_so_far = ""
-        final_chunks = []
+        state = AnswerStream()
+        if stream_format == "coalesced":
+            frames = coalesced_frames(
+                stream, state, "No response",
+                window_ms=settings.SSE_COALESCE_MS, max_chars=settings.SSE_COALESCE_MAX_CHARS,
+            )
+        else:
+            frames = legacy_frames(stream, state, "No response")
 
+        flushes, sent = SSE_FLUSH_SECONDS.labels(stream_format), SSE_FRAMES.labels(stream_format)
         try:
-            async for data in stream_rag_pipeline(query):
-                # Stream tokens
-                if "token" in data:
-                    token = data["token"]
-                    answer_so_far += token
-                    yield f"data: {json.dumps({'token': token})}\n\n"
-
-                # Full answer fallback
-                if "answer" in data:
-                    answer_so_far = data["answer"]
-                    yield f"data: {json.dumps({'answer': answer_so_far})}\n\n"
-
-                # Send chunks when available
-                if "chunks" in data:
-                    final_chunks = data["chunks"]
-                    yield f"data: {json.dumps({'chunks': final_chunks})}\n\n"
-
-            # Always send final state + DONE
-            yield f"data: {json.dumps({'answer': answer_so_far.strip() or 'No response'})}\n\n"
-            yield f"data: {json.dumps({'chunks': final_chunks})}\n\n"
-            yield "data: [DONE]\n\n"
-
-            # Save to history
-            if current_user not in user_chats:
-                user_chats[current_user] = []
-            user_chats[current_user].append({
-                "query": query,
-                "answer": answer_so_far.strip(),
-                "chunks": final_chunks,
-                "timestamp": __import__('time').time()
-            })
+            async for chunk in frames:
+                # The generator resumes once the server has handed the frame to the connection
+                started = time.perf_counter()
+                yield chunk
+                flushes.observe(time.perf_counter() - started)
+                sent.inc()
+
+            # Save to history (write-behind: queued here, committed by the history writer)
+            if not stream.cancelled:
+                chat_history.append(current_user, query, state.text(), state.chunks)
 
+        except LLMOverloaded as e:
+            # No model slot after all (e.g. timed out in the queue) — nothing was streamed yet
+            yield frame(json.dumps({"answer": e.detail, "error": {"status": e.status_code, "retry_after": e.retry_after}}))
+            yield DONE_FRAME
         except Exception as e:
             error_msg = "Sorry, something went wrong on the server."
-            yield f"data: {json.dumps({'answer': error_msg})}\n\n"
-            yield "data: [DONE]\n\n"
+            yield frame(json.dumps({'answer': error_msg}))
+            yield DONE_FRAME
+        finally:
+            # Also reached when the server gives up on the connection mid-write
+            watcher.cancel()
+            if not stream.task.done():
+                stream.cancel()
 
     return StreamingResponse(
         event_generator(),
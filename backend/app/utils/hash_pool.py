@@ -0,0 +1,152 @@
+# app/utils/hash_pool.py
+# Argon2 (64 MB, time_cost=4) is deliberately expensive. Running it inline in
+# request threads lets a login burst eat the threadpool and add 64 MB of RSS per
+# concurrent hash. Here it runs in a small dedicated process pool instead:
+#   - at most HASH_POOL_WORKERS hashes run at once (bounded CPU + memory)
+#   - at most HASH_QUEUE_MAX more wait; anything beyond is rejected with 429
+#   - a hash that can't finish within HASH_TIMEOUT_SECONDS (or a dead pool) → 503
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.utils.hashing import hash_password, verify_and_rehash
+
+
+def _timed(fn, *args):
+    # Runs in the pool process → measures pure hashing time, without queueing
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+class _OpStats:
+    def __init__(self, window=1024):
+        self.count = 0
+        self.errors = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.total = deque(maxlen=window)   # submit → result (seconds)
+        self.hashing = deque(maxlen=window) # time inside the pool process
+
+    def as_dict(self):
+        def pct(values, q):
+            if not values:
+                return None
+            ordered = sorted(values)
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 1)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "total_ms": {"p50": pct(self.total, 0.5), "p95": pct(self.total, 0.95), "max": pct(self.total, 1.0)},
+            "hash_ms": {"p50": pct(self.hashing, 0.5), "p95": pct(self.hashing, 0.95), "max": pct(self.hashing, 1.0)},
+        }
+
+
+class HashPool:
+    def __init__(self, workers=2, queue_max=8, timeout=10.0):
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, queue_max)
+        self.timeout = timeout
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.rehashed = 0
+        self.ops = {"hash": _OpStats(), "verify": _OpStats()}
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # spawn: the children never inherit the server's threads, sockets or indexes
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def _reset(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _done(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def _run(self, op, fn, *args):
+        stats = self.ops[op]
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                stats.rejected += 1
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many sign-in attempts right now, please retry shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self._in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            try:
+                future = self._executor().submit(_timed, fn, *args)
+            except BaseException:
+                self._done()
+                raise
+            # The slot is freed when the pool is done with the hash, not when we stop waiting:
+            # after a timeout it may still be running and holding a worker
+            future.add_done_callback(self._done)
+            result, hashing = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            raise HTTPException(status_code=503, detail="Authentication is overloaded, please retry")
+        except BrokenProcessPool:
+            stats.errors += 1
+            self._reset()  # a worker died (e.g. OOM-killed) → fresh pool for the next request
+            raise HTTPException(status_code=503, detail="Authentication is temporarily unavailable")
+        except Exception:
+            stats.errors += 1
+            raise
+
+        stats.count += 1
+        stats.total.append(time.perf_counter() - started)
+        stats.hashing.append(hashing)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify(self, password: str, hashed: str):
+        """(ok, new_hash) — see hashing.verify_and_rehash."""
+        ok, new_hash = await self._run("verify", verify_and_rehash, password, hashed)
+        if new_hash:
+            self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self):
+        return {
+            "pid": os.getpid(),
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "in_flight": self._in_flight,
+            "rehashed_on_login": self.rehashed,
+            **{op: s.as_dict() for op, s in self.ops.items()},
+        }
+
+
+hash_pool = HashPool(
+    workers=settings.HASH_POOL_WORKERS,
+    queue_max=settings.HASH_QUEUE_MAX,
+    timeout=settings.HASH_TIMEOUT_SECONDS,
+)
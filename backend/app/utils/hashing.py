@@ -27,3 +27,15 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         else:
             # Last resort: plain text (from early dev)
             return plain_password == hashed_password
+
+
+def verify_and_rehash(plain_password: str, hashed_password: str):
+    """
+    (ok, new_hash). new_hash is set when the password is right but the stored
+    hash is outdated (old Argon2 parameters, bcrypt or plain text) — store it.
+    """
+    try:
+        return pwd_context.verify_and_update(plain_password, hashed_password)
+    except Exception:
+        ok = verify_password(plain_password, hashed_password)  # legacy bcrypt / plain-text fallback
+        return ok, (hash_password(plain_password) if ok else None)
@@ -1,5 +1,9 @@
+from typing import Literal
+
 from pydantic import BaseModel
 
+FEEDBACK_RATINGS = ("good", "bad")
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -18,3 +22,9 @@ class RAGQuery(BaseModel):
 class RAGResponse(BaseModel):
     answer: str
     chunks: list
+
+class FeedbackIn(BaseModel):
+    # Each rating becomes an aggregate row (feedback:<rating>) → only the two the UI sends
+    rating: Literal[FEEDBACK_RATINGS]
+    query: str = ""
+    answer: str = ""
@@ -0,0 +1,164 @@
+# app/utils/sse.py
+# Server-sent-event writer for /rag/query. Two frame formats:
+#   legacy     one `data: {"token": ...}` frame per token, then answer / chunks frames
+#              (twice: as the pipeline yields them and again as the final state), then [DONE]
+#   coalesced  tokens batched into one frame per SSE_COALESCE_MS window (or
+#              SSE_COALESCE_MAX_CHARS) — the first token is sent right away — and a single
+#              final {"answer", "chunks"} frame, then [DONE]
+# Either way the answer is collected in a list buffer and the chunks payload is
+# serialized exactly once.
+#
+# The pipeline runs in its own task (PipelineStream) feeding a queue: the writer can
+# flush on a timer between tokens, and cancel_on_disconnect can stop the pipeline —
+# and the LLM generation under it — as soon as the client goes away, even while
+# nothing is being written.
+import asyncio
+import json
+
+from app.core.log import get_logger
+
+log = get_logger("sse")
+
+DONE_FRAME = "data: [DONE]\n\n"
+
+
+def frame(payload_json: str) -> str:
+    return f"data: {payload_json}\n\n"
+
+
+class AnswerStream:
+    """Accumulates one pipeline run: token parts (joined once), the final answer, chunks JSON."""
+
+    def __init__(self):
+        self.parts = []
+        self.chunks = []
+        self.chunks_json = "[]"
+
+    def add_token(self, token):
+        self.parts.append(token)
+
+    def set_answer(self, answer):
+        # The pipeline's answer replaces whatever was streamed (same as the old `answer_so_far = ...`)
+        self.parts = [answer]
+
+    def set_chunks(self, chunks):
+        self.chunks = chunks
+        self.chunks_json = json.dumps(chunks)
+
+    def text(self):
+        return "".join(self.parts).strip()
+
+    def answer_json(self, fallback):
+        return json.dumps(self.text() or fallback)
+
+
+class PipelineStream:
+    def __init__(self, events):
+        self.queue = asyncio.Queue()
+        self.cancelled = False
+        self.task = asyncio.create_task(self._pump(events))
+
+    async def _pump(self, events):
+        try:
+            async for data in events:
+                await self.queue.put(data)
+        except Exception as e:
+            await self.queue.put(e)
+        await self.queue.put(None)
+
+    def ready(self):
+        return not self.queue.empty()
+
+    def get_nowait(self):
+        return self.queue.get_nowait()
+
+    async def get(self):
+        return await self.queue.get()
+
+    def cancel(self):
+        """Stop the pipeline; the writer sees the end of the stream and sends nothing more."""
+        self.cancelled = True
+        self.task.cancel()
+        self.queue.put_nowait(None)
+
+
+async def cancel_on_disconnect(request, stream, interval=0.5):
+    while not stream.task.done():
+        await asyncio.sleep(interval)
+        if await request.is_disconnected():
+            log.info("[DISCONNECT] Client went away → cancelling the pipeline")
+            stream.cancel()
+            return
+
+
+async def legacy_frames(stream, state, fallback):
+    while (data := await stream.get()) is not None:
+        if isinstance(data, Exception):
+            raise data
+        if "token" in data:
+            state.add_token(data["token"])
+            yield frame(json.dumps({"token": data["token"]}))
+        if "answer" in data:
+            state.set_answer(data["answer"])
+            yield frame('{"answer": ' + json.dumps(data["answer"]) + "}")
+        if "chunks" in data:
+            state.set_chunks(data["chunks"])
+            yield frame('{"chunks": ' + state.chunks_json + "}")
+    if stream.cancelled:
+        return
+    yield frame('{"answer": ' + state.answer_json(fallback) + "}")
+    yield frame('{"chunks": ' + state.chunks_json + "}")
+    yield DONE_FRAME
+
+
+async def coalesced_frames(stream, state, fallback, window_ms=25.0, max_chars=512):
+    loop = asyncio.get_running_loop()
+    buffer, size, deadline, sent_first = [], 0, None, False
+
+    def flush():
+        nonlocal buffer, size, deadline
+        out = frame('{"token": ' + json.dumps("".join(buffer)) + "}")
+        buffer, size, deadline = [], 0, None
+        return out
+
+    while True:
+        # Checked first: under a steady token stream the queue is never empty
+        if buffer and loop.time() >= deadline:
+            yield flush()
+            continue
+        if stream.ready():
+            data = stream.get_nowait()
+        elif buffer:
+            try:
+                data = await asyncio.wait_for(stream.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                yield flush()
+                continue
+        else:
+            data = await stream.get()
+
+        if data is None:
+            break
+        if isinstance(data, Exception):
+            raise data
+        if "token" in data:
+            token = data["token"]
+            state.add_token(token)
+            buffer.append(token)
+            size += len(token)
+            if deadline is None:
+                deadline = loop.time() + window_ms / 1000
+            if not sent_first or size >= max_chars:
+                sent_first = True
+                yield flush()
+        if "answer" in data:
+            state.set_answer(data["answer"])
+        if "chunks" in data:
+            state.set_chunks(data["chunks"])
+
+    if stream.cancelled:
+        return
+    if buffer:
+        yield flush()
+    yield frame('{"answer": ' + state.answer_json(fallback) + ', "chunks": ' + state.chunks_json + "}")
+    yield DONE_FRAME
@@ -0,0 +1,2 @@
+# backend/benchmarks — retrieval microbenchmarks over synthetic corpora.
+# Run from backend/: python -m benchmarks.retrieval --help
@@ -0,0 +1,338 @@
+# backend/benchmarks/retrieval.py
+# Retrieval microbenchmarks over synthetic corpora (see benchmarks/synthetic.py).
+#
+#   cd backend
+#   python -m benchmarks.retrieval --sizes 1000,10000,100000 --index-types flat,hnsw,ivf_flat --k 1,5,10
+#   python -m benchmarks.retrieval --sizes 1000000 --index-types hnsw,ivf_pq --baseline benchmarks/results/<old>.json
+#
+# Every (corpus size, index type) case runs in its own process, so its memory
+# numbers are its own. It builds the corpus with build_index.py's build_indexes,
+# writes a generation under benchmarks/work/ (never app/data: a running server is
+# untouched), loads it like the server does and measures:
+#   build     seconds per phase (embed, faiss, bm25, write) + peak RSS
+#   size      bytes on disk per component (FAISS, BM25, corpus, vectors)
+#   memory    RSS / PSS / private MB once the generation is loaded and searched
+#   latency   hybrid_search p50 / p99 / mean per k (query embeddings precomputed)
+#   qps       sequential, and with --threads concurrent searches
+#   recall@k  vs the exact Flat baseline over the same vectors: FAISS alone
+#             ("dense") and the fused hybrid result ("hybrid")
+# Query embedding latency is reported once per case, separately.
+#
+# build_index.py keeps the whole corpus in memory: 1M FAQs need ~8 GB of RAM
+# (corpus, vectors, the FAISS copy, BM25 tokens). A case the OOM killer takes
+# is listed under "failed" in the report and the run carries on.
+#
+# The report is JSON (benchmarks/results/retrieval-<timestamp>.json by default);
+# --baseline prints the deltas against an earlier report.
+import argparse
+import copy
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+WORK_DIR = os.path.join(BENCH_DIR, "work")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+sys.path.insert(0, BACKEND_DIR)
+
+
+def _pct(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if len(values) else None  # ms
+
+
+def _dir_bytes(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def _peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)  # kB on Linux
+
+
+def _load_embedder(name):
+    if name == "hashing":
+        from benchmarks.synthetic import HashingEmbedder
+        return HashingEmbedder()
+    from app.rag.embedding_backends import load_backend
+    return load_backend(name)
+
+
+def _recall(found, expected):
+    """Mean |found ∩ expected| / |expected| over queries (rows with no expected ids are skipped)."""
+    scores = [len(set(f) & set(e)) / len(e) for f, e in zip(found, expected) if len(e)]
+    return round(float(np.mean(scores)), 4) if scores else None
+
+
+def _exact_generation(gen):
+    """Same generation with an exact IndexFlatL2 over its stored vectors — the recall reference."""
+    import faiss
+    vectors = np.ascontiguousarray(gen.vectors, dtype=np.float32)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)  # row position == FAQ id, as in every generation build_index.py writes
+    baseline = copy.copy(gen)
+    baseline.faiss_index = exact
+    baseline.faiss_meta = {"index_type": "flat", "factory": "Flat", "metric": "L2"}
+    return baseline
+
+
+def run_case(case):
+    """One (size, index_type) case, in a fresh process. Returns its result dict."""
+    from app.core.config import settings
+    settings.EMBED_CACHE_DIR = os.path.join(case["work_dir"], "embed_cache")  # model runs: shared across index types
+    settings.INDEX_RELOAD_CHECK_SECONDS = float("inf")  # serve the benchmark generation, never follow CURRENT
+    from app.core.procmem import memory_info
+    from app.rag import hybrid_retriever, index_store
+    from app.rag.build_index import build_indexes
+    from benchmarks.synthetic import generate_corpus, generate_queries
+
+    size, index_type = case["size"], case["index_type"]
+    result = {"size": size, "index_type": index_type, "embedding": case["embedding"]}
+
+    # ───── Build ─────
+    faqs = generate_corpus(size, seed=case["seed"])
+    questions = [f["question"] for f in faqs]
+    answers = [f["answer"] for f in faqs]
+    embedder = _load_embedder(case["embedding"])
+    timings = {}
+    started = time.perf_counter()
+    index, params, bm25, embeddings = build_indexes(
+        questions, embedder, index_type,
+        use_cache=case["embedding"] != "hashing",  # hashing is cheaper than the cache lookups
+        parity=size <= case["parity_max"], timings=timings,
+        **case["faiss_params"],
+    )
+    write_started = time.perf_counter()
+    gen_path = index_store.write_generation(
+        index, params, bm25, questions, answers, faqs, embeddings,
+        generations_dir=os.path.join(case["work_dir"], "generations", f"{size}-{index_type}"),
+    )
+    timings["write"] = time.perf_counter() - write_started
+    result["build"] = {
+        "seconds": round(time.perf_counter() - started, 3),
+        "phases": {k: round(v, 3) for k, v in timings.items()},
+        "factory": params["factory"],
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    result["index_bytes"] = {
+        "faiss": _dir_bytes(os.path.join(gen_path, index_store.INDEX_FILE)),
+        "bm25": _dir_bytes(os.path.join(gen_path, index_store.BM25_DIR)),
+        "corpus": _dir_bytes(os.path.join(gen_path, index_store.CORPUS_DIR)),
+        "vectors": _dir_bytes(os.path.join(gen_path, index_store.VECTORS_FILE)),
+        "total": _dir_bytes(gen_path),
+    }
+    del index, bm25, embeddings, faqs, answers
+    gc.collect()
+
+    # ───── Load + serve it like the server does ─────
+    before = memory_info() or {}
+    gen = index_store.load_generation(gen_path)
+    hybrid_retriever.swap_generation(gen)
+    hybrid_retriever.embedder = embedder
+
+    queries = generate_queries(questions, case["queries"], seed=case["seed"] + 1)
+    texts = [q for q, _ in queries]
+    encode_times = []
+    for text in texts[:min(len(texts), 200)]:
+        t = time.perf_counter()
+        embedder.encode([text])
+        encode_times.append(time.perf_counter() - t)
+    query_embs = np.ascontiguousarray(embedder.encode(texts), dtype=np.float32)
+    result["embed_ms"] = {"p50": _pct(encode_times, 50), "p99": _pct(encode_times, 99)}
+
+    baseline = _exact_generation(gen) if index_type != "flat" else None
+    result["search"] = {}
+    for k in case["k"]:
+        for i in range(min(20, len(texts))):  # warm-up: page faults, FAISS scratch buffers
+            hybrid_retriever.hybrid_search(texts[i], k=k, query_emb=query_embs[i:i + 1])
+        latencies = []
+        started = time.perf_counter()
+        for i, text in enumerate(texts):
+            t = time.perf_counter()
+            hybrid_retriever.hybrid_search(text, k=k, query_emb=query_embs[i:i + 1])
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - started
+        stats = {
+            "p50_ms": _pct(latencies, 50),
+            "p99_ms": _pct(latencies, 99),
+            "mean_ms": round(float(np.mean(latencies)) * 1000, 3),
+            "qps": round(len(texts) / elapsed, 1),
+        }
+        if case["threads"] > 1:
+            with ThreadPoolExecutor(case["threads"]) as pool:
+                started = time.perf_counter()
+                list(pool.map(
+                    lambda i: hybrid_retriever.hybrid_search(texts[i], k=k, query_emb=query_embs[i:i + 1]),
+                    range(len(texts)),
+                ))
+                stats[f"qps_{case['threads']}_threads"] = round(len(texts) / (time.perf_counter() - started), 1)
+
+        # Recall vs exact search over the same vectors (batch_search == hybrid_search, just faster at scale)
+        if baseline is None:
+            stats["dense_recall"] = stats["hybrid_recall"] = 1.0
+        else:
+            dense = gen.faiss_index.search(query_embs, k)[1]
+            exact = baseline.faiss_index.search(query_embs, k)[1]
+            stats["dense_recall"] = _recall([[i for i in row if i >= 0] for row in dense], exact)
+            hybrid = [[r["id"] for r in rs] for rs in hybrid_retriever.batch_search(texts, k=k, query_embs=query_embs)]
+            hybrid_retriever.swap_generation(baseline)
+            reference = [[r["id"] for r in rs] for rs in hybrid_retriever.batch_search(texts, k=k, query_embs=query_embs)]
+            hybrid_retriever.swap_generation(gen)
+            stats["hybrid_recall"] = _recall(hybrid, reference)
+        result["search"][str(k)] = stats
+
+    after = memory_info() or {}
+    result["memory_mb"] = {
+        key: after.get(key) for key in ("rss_mb", "pss_mb", "private_mb")
+    }
+    result["memory_mb"]["loaded_delta_rss_mb"] = (
+        round(after["rss_mb"] - before["rss_mb"], 1) if "rss_mb" in after and "rss_mb" in before else None
+    )
+    result["memory_mb"]["peak_rss_mb"] = _peak_rss_mb()
+
+    if not case["keep"]:
+        shutil.rmtree(os.path.dirname(gen_path), ignore_errors=True)
+    return result
+
+
+# ───── Report ─────
+def environment():
+    import faiss
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+        "git_commit": commit,
+    }
+
+
+def summary_rows(report):
+    for r in report["results"]:
+        for k, s in r["search"].items():
+            yield (r["size"], r["index_type"], int(k)), s, r
+
+
+def print_summary(report, baseline=None):
+    before = {key: s for key, s, _ in summary_rows(baseline)} if baseline else {}
+
+    def delta(value, old, lower_is_better):
+        if old is None or value is None or not old:
+            return ""
+        change = (value - old) / old * 100
+        better = change < 0 if lower_is_better else change > 0
+        return f" ({change:+.0f}%{'' if abs(change) < 5 else ' ✓' if better else ' ✗'})"
+
+    print(f"\n{'size':>9} {'index':>9} {'k':>3} {'p50 ms':>14} {'p99 ms':>14} {'qps':>16} {'recall':>8} "
+          f"{'build s':>8} {'MB disk':>8}")
+    for key, s, r in summary_rows(report):
+        old = before.get(key, {})
+        print(
+            f"{key[0]:>9} {key[1]:>9} {key[2]:>3} "
+            f"{str(s['p50_ms']) + delta(s['p50_ms'], old.get('p50_ms'), True):>14} "
+            f"{str(s['p99_ms']) + delta(s['p99_ms'], old.get('p99_ms'), True):>14} "
+            f"{str(s['qps']) + delta(s['qps'], old.get('qps'), False):>16} "
+            f"{s['hybrid_recall']:>8} {r['build']['seconds']:>8} {r['index_bytes']['total'] / 1e6:>8.1f}"
+        )
+
+
+def parse_args(argv=None):
+    from app.core.config import settings
+    from app.rag.faiss_factory import INDEX_TYPES
+    ints = lambda s: [int(float(x)) for x in s.split(",") if x.strip()]  # noqa: E731 — accepts 1e6
+    parser = argparse.ArgumentParser(description="Retrieval microbenchmarks over synthetic FAQ corpora")
+    parser.add_argument("--sizes", type=ints, default=[1000, 10000, 100000],
+                        help="corpus sizes, comma-separated (up to 1e6)")
+    parser.add_argument("--index-types", default="flat,hnsw,ivf_flat",
+                        help=f"comma-separated, any of {','.join(INDEX_TYPES)}")
+    parser.add_argument("--k", type=ints, default=[1, 5, 10], help="k values for hybrid_search")
+    parser.add_argument("--queries", type=int, default=1000, help="queries per case")
+    parser.add_argument("--threads", type=int, default=4, help="concurrent searches for the threaded QPS (1 = skip)")
+    parser.add_argument("--embedding", default="hashing",
+                        help="hashing (synthetic, model-free) or an EMBEDDING_BACKEND (torch, onnx, onnx_int8)")
+    parser.add_argument("--nlist", type=int, default=settings.FAISS_NLIST)
+    parser.add_argument("--pq-m", type=int, default=settings.FAISS_PQ_M)
+    parser.add_argument("--pq-nbits", type=int, default=settings.FAISS_PQ_NBITS)
+    parser.add_argument("--hnsw-m", type=int, default=settings.FAISS_HNSW_M)
+    parser.add_argument("--hnsw-ef-construction", type=int, default=settings.FAISS_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--parity-max", type=int, default=100000,
+                        help="run build_index.py's BM25Okapi parity check up to this corpus size (it's slow)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="report path (default: benchmarks/results/retrieval-<timestamp>.json)")
+    parser.add_argument("--baseline", help="earlier report to print deltas against")
+    parser.add_argument("--keep", action="store_true", help="keep the generations under benchmarks/work/")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    index_types = [t.strip() for t in args.index_types.split(",") if t.strip()]
+    cases = [
+        {
+            "size": size, "index_type": index_type, "k": args.k, "queries": args.queries,
+            "threads": args.threads, "embedding": args.embedding, "seed": args.seed,
+            "parity_max": args.parity_max, "keep": args.keep, "work_dir": WORK_DIR,
+            "faiss_params": {
+                "nlist": args.nlist, "pq_m": args.pq_m, "pq_nbits": args.pq_nbits,
+                "hnsw_m": args.hnsw_m, "hnsw_ef_construction": args.hnsw_ef_construction,
+            },
+        }
+        for size in args.sizes for index_type in index_types
+    ]
+
+    report = {
+        "benchmark": "retrieval",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": environment(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "results": [],
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"retrieval-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+
+    # Fresh (spawned, not forked) process per case → its memory numbers are its own
+    ctx = multiprocessing.get_context("spawn")
+    for case in cases:
+        print(f"\n───── {case['size']} FAQs, {case['index_type']} ─────")
+        with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            try:
+                report["results"].append(pool.submit(run_case, case).result())
+            except BrokenProcessPool:
+                # Usually the OOM killer: record it and carry on with the smaller cases
+                print(f"Case {case['size']}/{case['index_type']} died (out of memory?) — skipped")
+                report["failed"] = report.get("failed", []) + [
+                    {"size": case["size"], "index_type": case["index_type"], "error": "worker process died"}
+                ]
+        with open(out, "w", encoding="utf-8") as f:  # rewritten after every case: partial runs still count
+            json.dump(report, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_summary(report, baseline)
+    print(f"\nReport → {out}")
+
+
+if __name__ == "__main__":
+    main()
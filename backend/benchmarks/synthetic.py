@@ -0,0 +1,141 @@
+# backend/benchmarks/synthetic.py
+# Deterministic synthetic FAQ corpora + query sets for the retrieval benchmarks.
+#
+# Questions are templated IT-support questions over a vocabulary that grows with
+# the corpus (product / team / error-code names), so BM25 term counts and posting
+# lengths scale roughly like a real knowledge base. Queries are perturbed copies
+# of sampled questions: words dropped, synonyms swapped, casing changed.
+import hashlib
+
+import numpy as np
+
+ACTIONS = [
+    "reset", "configure", "install", "update", "remove", "enable", "disable", "sync",
+    "connect", "migrate", "back up", "restore", "troubleshoot", "share", "export", "renew",
+]
+OBJECTS = [
+    "password", "vpn profile", "email signature", "printer driver", "ssh key", "mfa token",
+    "shared drive", "calendar", "laptop", "docker image", "api key", "wifi certificate",
+    "slack workspace", "jira board", "git repository", "database replica", "license",
+]
+PLATFORMS = ["windows", "macos", "linux", "ios", "android", "the web portal", "the office network"]
+CONTEXTS = [
+    "after a reboot", "when working remotely", "for a new hire", "behind the proxy",
+    "without admin rights", "during an outage", "on a shared account", "after it expired",
+]
+TEMPLATES = [
+    "How do I {action} the {obj} for {name} on {platform}?",
+    "Why can't I {action} my {obj} {context}?",
+    "What is the process to {action} {name} {obj} on {platform} {context}?",
+    "{name}: how to {action} the {obj} {context}",
+    "Error {code} when I {action} the {obj} on {platform}",
+]
+SYNONYMS = {
+    "reset": "change", "configure": "set up", "install": "deploy", "remove": "delete",
+    "laptop": "notebook", "password": "passcode", "troubleshoot": "fix", "connect": "join",
+}
+NAME_PREFIXES = ["acme", "orion", "atlas", "nimbus", "vega", "helix", "quartz", "zephyr"]
+
+
+def _names(n, rng):
+    """n distinct product / team names — the part of the vocabulary that grows with the corpus."""
+    return [f"{NAME_PREFIXES[i % len(NAME_PREFIXES)]}{i}" for i in rng.permutation(n)]
+
+
+def generate_corpus(size, seed=0):
+    """`size` FAQ dicts ({"question", "answer", "category"}), the same for the same (size, seed)."""
+    rng = np.random.default_rng(seed)
+    names = _names(max(16, size // 20), rng)
+    # Zipf-ish: a few names show up everywhere, most only a handful of times
+    name_idx = np.minimum(rng.zipf(1.3, size) - 1, len(names) - 1)
+    picks = {
+        "action": rng.integers(len(ACTIONS), size=size),
+        "obj": rng.integers(len(OBJECTS), size=size),
+        "platform": rng.integers(len(PLATFORMS), size=size),
+        "context": rng.integers(len(CONTEXTS), size=size),
+        "template": rng.integers(len(TEMPLATES), size=size),
+        "code": rng.integers(1000, 99999, size=size),
+    }
+    faqs = []
+    for i in range(size):
+        fields = {
+            "action": ACTIONS[picks["action"][i]],
+            "obj": OBJECTS[picks["obj"][i]],
+            "platform": PLATFORMS[picks["platform"][i]],
+            "context": CONTEXTS[picks["context"][i]],
+            "name": names[name_idx[i]],
+            "code": f"E{picks['code'][i]}",
+        }
+        question = TEMPLATES[picks["template"][i]].format(**fields)
+        answer = (
+            f"To {fields['action']} the {fields['obj']} for {fields['name']} on {fields['platform']}, "
+            f"open the IT portal, pick '{fields['obj']}', and follow the {fields['action']} steps. "
+            f"If you see error {fields['code']} {fields['context']}, file a ticket with the service desk (ref #{i})."
+        )
+        faqs.append({"question": question, "answer": answer, "category": fields["obj"].split()[-1]})
+    return faqs
+
+
+def generate_queries(questions, n, seed=1):
+    """n (query, source row) pairs: perturbed copies of randomly sampled questions."""
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(len(questions), size=n)
+    queries = []
+    for row in rows:
+        words = questions[row].rstrip("?").split()
+        if len(words) > 4:
+            del words[rng.integers(len(words))]  # drop one word
+        words = [SYNONYMS.get(w.lower(), w) if rng.random() < 0.5 else w for w in words]
+        query = " ".join(words)
+        queries.append((query.lower() if rng.random() < 0.5 else query, int(row)))
+    return queries
+
+
+class HashingEmbedder:
+    """
+    Model-free stand-in for the embedding backends (same encode / describe interface):
+    the normalized sum of fixed random vectors, one per token. Similar texts get
+    similar vectors, so FAISS recall numbers are meaningful, and 1M questions
+    embed in seconds instead of hours.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim=384):
+        self.dim = dim
+        self.model_name = f"synthetic-hashing-{dim}"
+        self._vocab = {}
+        self._table = np.zeros((0, dim), dtype=np.float32)
+
+    def _token_vector(self, token):
+        seed = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+        return np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32)
+
+    def _ids(self, tokens):
+        new = [t for t in dict.fromkeys(tokens) if t not in self._vocab]
+        if new:
+            needed = len(self._vocab) + len(new)
+            if needed > len(self._table):  # grow geometrically — the vocabulary grows with the corpus
+                table = np.empty((max(needed, 2 * len(self._table), 1024), self.dim), dtype=np.float32)
+                table[:len(self._vocab)] = self._table[:len(self._vocab)]
+                self._table = table
+            for t in new:
+                self._table[len(self._vocab)] = self._token_vector(t)
+                self._vocab[t] = len(self._vocab)
+        return [self._vocab[t] for t in tokens]
+
+    def encode(self, texts, batch_size=2048):
+        texts = list(texts)
+        batch_size = max(batch_size, 2048)  # no model to feed — bigger batches only cut Python overhead
+        out = np.empty((len(texts), self.dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            batch = [t.lower().split() or [""] for t in texts[start:start + batch_size]]
+            lengths = np.array([len(tokens) for tokens in batch])
+            ids = self._ids([t for tokens in batch for t in tokens])
+            offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+            out[start:start + len(batch)] = np.add.reduceat(self._table[ids], offsets, axis=0)
+        out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
+
+    def describe(self):
+        return {"backend": self.name, "model": self.model_name, "dim": self.dim}
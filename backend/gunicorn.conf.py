@@ -0,0 +1,42 @@
+# backend/gunicorn.conf.py
+# Multi-worker mode (startup.sh uses it when WEB_CONCURRENCY > 1):
+#   gunicorn -c backend/gunicorn.conf.py backend.app.main:app
+#
+# The master imports the app and loads FAISS / BM25 / the embedding model ONCE,
+# then forks the workers, which share those pages copy-on-write (BM25 and the
+# corpus are mmapped, so they're shared through the page cache anyway).
+# Mutable state (feedback, counters, chat history) lives in SQLite, not in-process.
+import gc
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '7860')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+graceful_timeout = 30
+loglevel = "info"
+
+# Lets workers find their master (→ per-worker memory report at /admin/workers)
+os.environ["NEUROSTACK_MASTER_PID"] = str(os.getpid())
+
+
+def when_ready(server):
+    # Runs in the master after the app is imported, before any worker is forked
+    from app.core import metrics
+    from app.rag.lifecycle import lifecycle
+    metrics.clear_snapshots()  # /metrics totals start over with this master
+    preloaded = lifecycle.preload()
+    # Move everything loaded so far out of the GC's reach, so collections in the
+    # workers don't touch (and un-share) the master's objects
+    gc.freeze()
+    if preloaded:
+        server.log.info("Indexes + embedder preloaded, forking %s workers", workers)
+    else:
+        server.log.warning("Preload incomplete — each worker loads what's missing itself")
+
+
+def post_fork(server, worker):
+    # Never reuse SQLite connections opened by the master
+    from app.core.auth import engine
+    engine.dispose(close=False)
@@ -0,0 +1,10 @@
+# backend/tests — run from backend/: python -m pytest -q tests
+import os
+import sys
+import tempfile
+
+# Same trick as build_index.py: make the `app` package importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing the auth modules creates tables — keep the checked-in neurostack.db untouched
+os.environ.setdefault("DB_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='neurostack-tests-'), 'test.db')}")
@@ -0,0 +1,23 @@
+# backend/tests/test_admin_routes.py
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.rag.lifecycle import lifecycle
+from app.routes import admin_routes
+
+
+def test_only_index_and_faq_endpoints_wait_for_warmup():
+    assert not lifecycle.ready
+    app = FastAPI()
+    app.include_router(admin_routes.router)
+    app.dependency_overrides[admin_routes.get_admin_user] = lambda: "admin"
+    client = TestClient(app)
+
+    assert client.get("/admin/auth/cache").status_code == 200
+    assert client.get("/admin/auth/hashing").status_code == 200
+    assert client.get("/admin/llm").status_code == 200
+
+    response = client.get("/admin/index")
+    assert response.status_code == 503 and "Retry-After" in response.headers
+    assert client.post("/admin/faqs", json={"question": "q", "answer": "a"}).status_code == 503
+    assert client.delete("/admin/faqs/1").status_code == 503
@@ -0,0 +1,26 @@
+# backend/tests/test_auth_cache.py
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import auth_cache
+from app.core.auth import SessionLocal
+from app.core.security import create_access_token
+from app.models.user import User
+
+
+def test_login_right_after_a_revoke_is_accepted():
+    with SessionLocal() as db:
+        db.add(User(username="bob", password_hash="x"))
+        db.commit()
+    old = create_access_token({"sub": "bob"})
+
+    time.sleep(1.05 - time.time() % 1)  # mid-second, so the revoke and the new login share it
+    auth_cache.revoke_user("bob")
+    new = create_access_token({"sub": "bob"})  # e.g. signing in again after a password change
+
+    assert auth_cache.get_current_user(f"Bearer {new}") == "bob"
+    with pytest.raises(HTTPException) as revoked:
+        auth_cache.get_current_user(f"Bearer {old}")
+    assert revoked.value.status_code == 401
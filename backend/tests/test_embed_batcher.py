@@ -0,0 +1,65 @@
+# backend/tests/test_embed_batcher.py
+import asyncio
+import threading
+
+import numpy as np
+
+from app.rag.embed_batcher import EmbeddingBatcher
+
+
+def _encode(texts):
+    return np.ones((len(texts), 4), dtype=np.float32)
+
+
+def test_cancelled_waiter_does_not_kill_the_batcher():
+    # Long batching window: the first query is still queued when its caller gives up
+    batcher = EmbeddingBatcher(_encode, max_batch_size=8, max_wait_ms=200)
+    cancelled = batcher.submit("client went away")
+    kept = batcher.submit("still here")
+    assert cancelled.cancel()
+
+    assert kept.result(timeout=5).shape == (4,)
+    assert batcher._thread.is_alive()
+    assert batcher.submit("next request").result(timeout=5).shape == (4,)
+    assert batcher.stats()["queries"] == 2
+
+
+def test_cancelled_async_waiter_mid_encode():
+    # The batch is already being encoded when the awaiting task is cancelled (client disconnect)
+    started, release = threading.Event(), threading.Event()
+
+    def slow_encode(texts):
+        started.set()
+        release.wait(5)
+        return _encode(texts)
+
+    batcher = EmbeddingBatcher(slow_encode, max_batch_size=8, max_wait_ms=1)
+
+    async def scenario():
+        task = asyncio.ensure_future(asyncio.wrap_future(batcher.submit("disconnecting")))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        release.set()
+        return await asyncio.wait_for(asyncio.wrap_future(batcher.submit("next request")), 5)
+
+    assert asyncio.run(scenario()).shape == (4,)
+    assert batcher._thread.is_alive()
+
+
+def test_encode_errors_reach_every_waiter_and_the_thread_survives():
+    calls = []
+
+    def flaky(texts):
+        calls.append(texts)
+        if len(calls) == 1:
+            raise RuntimeError("model crashed")
+        return _encode(texts)
+
+    batcher = EmbeddingBatcher(flaky, max_batch_size=8, max_wait_ms=1)
+    failed = batcher.submit("boom")
+    try:
+        failed.result(timeout=5)
+        raise AssertionError("expected the encode error")
+    except RuntimeError:
+        pass
+    assert batcher.submit("fine").result(timeout=5).shape == (4,)
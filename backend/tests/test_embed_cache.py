@@ -0,0 +1,31 @@
+# backend/tests/test_embed_cache.py
+import numpy as np
+
+from app.rag.embed_cache import EmbeddingCache
+
+
+def test_appends_merge_into_the_sorted_index(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "m", 4)
+    for start in range(0, 640, 64):
+        keys = cache.keys_for([f"text {i}" for i in range(start, start + 64)])
+        cache.add(keys, np.full((64, 4), start, dtype=np.float32))
+
+    reopened = EmbeddingCache(str(tmp_path), "m", 4)
+    keys = reopened.keys_for(["text 0", "text 300", "text 639", "never added"])
+    rows = reopened.lookup(keys)
+    assert rows[-1] == -1
+    assert reopened.vectors(rows[:3])[:, 0].tolist() == [0, 256, 576]
+    assert (cache.lookup(keys) == rows).all()
+
+
+def test_staged_rows_and_a_concurrent_writer(tmp_path):
+    ours, theirs = EmbeddingCache(str(tmp_path), "m", 4), EmbeddingCache(str(tmp_path), "m", 4)
+    ours.add(ours.keys_for(["x", "y"]), np.array([[1] * 4, [2] * 4], dtype=np.float32), commit=False)
+    assert ours.vectors(ours.lookup(ours.keys_for(["y"])))[0, 0] == 2  # visible before the flush
+    assert ours.rows == 0
+
+    theirs.add(theirs.keys_for(["z", "x"]), np.full((2, 4), 9, dtype=np.float32))
+    assert ours.flush() == 1  # "x" was committed by the other writer meanwhile
+    rows = ours.lookup(ours.keys_for(["x", "y", "z"]))
+    assert ours.rows == 3
+    assert ours.vectors(rows)[:, 0].tolist() == [9, 2, 9]
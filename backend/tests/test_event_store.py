@@ -0,0 +1,20 @@
+# backend/tests/test_event_store.py
+import pytest
+from pydantic import ValidationError
+
+from app.core.event_store import EventStore
+from app.utils.schema import FeedbackIn
+
+
+def test_feedback_rating_is_validated_before_it_becomes_an_aggregate(tmp_path):
+    assert FeedbackIn(rating="good").rating == "good"
+    for rating in ("excellent", "x" * 1000, None, 5):
+        with pytest.raises(ValidationError):
+            FeedbackIn(rating=rating)
+
+    # Legacy feedback.json entries bypass the schema: unknown ratings add no aggregate row
+    store = EventStore(str(tmp_path / "events.db"))
+    store.append("feedback", "alice", wait=True, rating="good")
+    store.append("feedback", "alice", wait=True, rating="free-form")
+    rows = store._reader().execute("SELECT name, value FROM aggregates WHERE name LIKE 'feedback:%'").fetchall()
+    assert rows == [("feedback:good", 1)]
@@ -0,0 +1,34 @@
+# backend/tests/test_hash_pool.py
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils.hash_pool import HashPool
+
+
+def test_timed_out_hash_keeps_its_slot_until_the_worker_is_done():
+    pool = HashPool(workers=1, queue_max=0, timeout=30.0)
+
+    async def main():
+        await pool._run("hash", time.sleep, 0)  # pool started, worker idle
+        pool.timeout = 0.2
+        with pytest.raises(HTTPException) as timed_out:
+            await pool._run("hash", time.sleep, 1.0)
+        assert timed_out.value.status_code == 503
+        # The worker is still busy with that hash → no room for another one yet
+        assert pool.stats()["in_flight"] == 1
+        with pytest.raises(HTTPException) as rejected:
+            await pool._run("hash", time.sleep, 0)
+        assert rejected.value.status_code == 429
+
+        await asyncio.sleep(1.5)
+        assert pool.stats()["in_flight"] == 0
+        pool.timeout = 30.0
+        await pool._run("hash", time.sleep, 0)
+
+    try:
+        asyncio.run(main())
+    finally:
+        pool._reset()
@@ -0,0 +1,48 @@
+# backend/tests/test_ingest.py
+import json
+
+import numpy as np
+
+from app.core.config import settings
+from app.rag import ingest
+from app.rag.embed_cache import EmbeddingCache
+from benchmarks.synthetic import HashingEmbedder, generate_corpus
+
+
+def _run(monkeypatch, tmp_path, faqs, shard_size):
+    monkeypatch.setattr(settings, "EMBED_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(ingest, "load_backend", lambda name, threads=None: HashingEmbedder(dim=32))
+    source = tmp_path / "faqs.jsonl"
+    source.write_text("".join(json.dumps(f) + "\n" for f in faqs), encoding="utf-8")
+    run_dir = str(tmp_path / "run")
+    manifest = ingest.load_manifest(run_dir, str(source), {}, restart=True)
+    ingest.ingest(str(source), run_dir, manifest, workers=0, batch_size=64, shard_size=shard_size,
+                  splitter=None, chunk_size=0, backend_name="hashing", use_cache=True)
+    return run_dir, manifest
+
+
+def test_cache_is_committed_once_per_shard(monkeypatch, tmp_path):
+    faqs = generate_corpus(1000)
+    faqs += faqs[:200]  # repeats: served from the cache, not re-encoded
+    flushes = []
+    flush = EmbeddingCache.flush
+    monkeypatch.setattr(EmbeddingCache, "flush", lambda self: flushes.append(flush(self)) or flushes[-1])
+
+    run_dir, manifest = _run(monkeypatch, tmp_path, faqs, shard_size=400)
+    assert len(manifest["shards"]) == len(flushes) == 3
+    cache = EmbeddingCache(str(tmp_path / "cache"), "hashing:synthetic-hashing-32", 32)
+    assert cache.rows == sum(flushes) == len({f["question"] for f in faqs})
+
+    vectors = np.concatenate([np.load(f"{run_dir}/{s['name']}/vectors.npy") for s in manifest["shards"]])
+    expected = HashingEmbedder(dim=32).encode([f["question"] for f in faqs])
+    np.testing.assert_allclose(vectors, expected, atol=1e-5)
+
+
+def test_time_per_shard_stays_flat_on_a_large_corpus(monkeypatch, tmp_path):
+    # 100k rows / 40 shards: every shard adds 2.5k rows to the cache, so per-append
+    # costs that grow with the cache show up as later shards taking longer
+    _, manifest = _run(monkeypatch, tmp_path, generate_corpus(100_000), shard_size=2500)
+    seconds = [s["seconds"] for s in manifest["shards"]]
+    assert len(seconds) == 40
+    early, late = np.median(seconds[1:11]), np.median(seconds[-10:])
+    assert late < 2 * early, f"shards slow down as the cache grows: {early:.3f}s → {late:.3f}s"
@@ -0,0 +1,108 @@
+# backend/tests/test_llm_router.py
+import asyncio
+
+from app.core.config import settings
+from app.rag.llm_providers import LLM_ERROR_MESSAGE, LLMOverloaded, LLMRouter, Provider
+
+
+class FakeProvider(Provider):
+    def __init__(self, name, max_concurrency=1):
+        self.name = name
+        super().__init__(ttft_seconds=5.0, max_concurrency=max_concurrency)
+        self.prompts = []
+
+    async def stream(self, prompt):
+        self.prompts.append(prompt)
+        yield f"{self.name}:{prompt}"
+
+
+class StalledProvider(FakeProvider):
+    async def stream(self, prompt):
+        self.prompts.append(prompt)
+        await asyncio.Event().wait()  # connected, never sends a token
+        yield
+
+
+def _router(*providers):
+    router = LLMRouter(order="ollama")
+    router.providers = list(providers)
+    return router
+
+
+async def _collect(router, prompt, user):
+    return [token async for token in router.stream(prompt, user=user)]
+
+
+def _trip_while_queued(provider, then=None):
+    """Holds the only slot, lets a request queue, opens the breaker, then hands the slot over."""
+    assert provider.limiter.try_acquire()
+
+    async def trip():
+        while not provider.limiter.queued:
+            await asyncio.sleep(0)
+        for _ in range(provider.breaker.failures):
+            provider.breaker.failure()
+        if then:
+            then()
+        provider.limiter.release()
+
+    return trip()
+
+
+def test_breaker_opened_while_queued_raises_overloaded():
+    primary = FakeProvider("primary")
+
+    async def main():
+        results = await asyncio.gather(_collect(_router(primary), "q", "alice"), _trip_while_queued(primary),
+                                       return_exceptions=True)
+        return results[0]
+
+    error = asyncio.run(main())
+    assert isinstance(error, LLMOverloaded) and error.status_code == 503
+    assert primary.prompts == []
+    assert primary.limiter.active == 0 and primary.limiter.queued == 0
+
+
+def test_breaker_opened_while_queued_fails_over():
+    primary, backup = FakeProvider("primary"), FakeProvider("backup")
+    assert backup.limiter.try_acquire()  # busy at admission, so the request queues for the primary
+
+    async def main():
+        tokens, _ = await asyncio.gather(_collect(_router(primary, backup), "q", "alice"),
+                                         _trip_while_queued(primary, then=backup.limiter.release))
+        return tokens
+
+    assert asyncio.run(main()) == ["backup:q"]
+    assert primary.prompts == [] and primary.limiter.active == 0
+
+
+def test_check_admission_rejects_only_what_stream_would_turn_away_now():
+    primary, backup = FakeProvider("primary"), FakeProvider("backup")
+    router = _router(primary, backup)
+    router.check_admission("alice")  # free slots
+
+    assert primary.limiter.try_acquire() and backup.limiter.try_acquire()
+    router.check_admission("alice")  # would queue for the primary — not a rejection
+
+    primary.limiter.queued = primary.limiter.queue_max
+    try:
+        router.check_admission("alice")
+    except LLMOverloaded as e:
+        assert e.status_code == 429
+    else:
+        raise AssertionError("full queue admitted")
+
+
+def test_provider_that_never_sends_a_token_opens_its_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_FIRST_TOKEN_TIMEOUT_SECONDS", 0.05)
+    stalled = StalledProvider("stalled")
+    router = _router(stalled)
+
+    async def main():
+        for _ in range(stalled.breaker.failures):
+            assert await _collect(router, "q", "alice") == [LLM_ERROR_MESSAGE]
+        await asyncio.sleep(0)  # let the cancelled attempt tasks finish
+
+    asyncio.run(main())
+    assert stalled.breaker.state == "open" and stalled.failures == stalled.breaker.failures
+    assert stalled.cancelled == 0 and stalled.limiter.active == 0
@@ -0,0 +1,53 @@
+# backend/tests/test_rag_routes.py
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.core.auth_cache import get_current_user
+from app.rag.lifecycle import require_rag_ready
+from app.rag.llm_providers import LLMOverloaded
+from app.routes import rag_routes
+
+
+def _client(monkeypatch, pipeline):
+    monkeypatch.setattr(rag_routes, "stream_rag_pipeline", pipeline)
+    app = FastAPI()
+    app.include_router(rag_routes.router)
+    app.dependency_overrides[get_current_user] = lambda: "alice"
+    app.dependency_overrides[require_rag_ready] = lambda: None
+    return TestClient(app)
+
+
+def _frames(body):
+    return [line[len("data: "):] for line in body.splitlines() if line.startswith("data: ")]
+
+
+def test_overload_after_admission_is_reported_in_the_stream(monkeypatch):
+    async def pipeline(query, filters=None, user=None):
+        raise LLMOverloaded(503, "ollama: no model slot within 10s", retry_after=5)
+        yield
+
+    response = _client(monkeypatch, pipeline).post("/rag/query", json={"query": "vpn?"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = _frames(response.text)
+    assert json.loads(frames[0]) == {"answer": "ollama: no model slot within 10s",
+                                     "error": {"status": 503, "retry_after": 5}}
+    assert frames[-1] == "[DONE]"
+
+
+def test_full_queue_is_rejected_before_streaming(monkeypatch):
+    started = []
+
+    async def pipeline(query, filters=None, user=None):
+        started.append(query)
+        yield {"answer": "never sent"}
+
+    def full(user=None):
+        raise LLMOverloaded(429, "too many requests waiting")
+
+    monkeypatch.setattr(rag_routes.llm_router, "check_admission", full)
+    response = _client(monkeypatch, pipeline).post("/rag/query", json={"query": "vpn?"})
+    assert response.status_code == 429 and response.headers["retry-after"] == "1"
+    assert started == []
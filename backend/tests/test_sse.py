@@ -0,0 +1,39 @@
+# backend/tests/test_sse.py
+import asyncio
+import json
+import time
+
+from app.utils.sse import AnswerStream, coalesced_frames
+
+
+class BusyStream:
+    """Tokens arrive faster than the writer drains them: the queue never looks empty."""
+
+    cancelled = False
+
+    def __init__(self, n, seconds_per_token):
+        self.items = [{"token": "x"} for _ in range(n)] + [None]
+        self.seconds_per_token = seconds_per_token
+
+    def ready(self):
+        return True
+
+    def get_nowait(self):
+        time.sleep(self.seconds_per_token)
+        return self.items.pop(0)
+
+    async def get(self):
+        return self.get_nowait()
+
+
+def test_coalesced_frames_flush_on_the_time_window_under_a_steady_stream():
+    async def main():
+        stream = BusyStream(200, 0.001)  # one token per ms, ~200 ms in total
+        return [chunk async for chunk in coalesced_frames(stream, AnswerStream(), "none", window_ms=20, max_chars=10_000)]
+
+    frames = asyncio.run(main())
+    tokens = [json.loads(f[len("data: "):])["token"] for f in frames if f.startswith('data: {"token"')]
+    assert "".join(tokens) == "x" * 200
+    # first token alone, then about one frame per 20 ms window — not everything at the end
+    assert 5 <= len(tokens) <= 30
+    assert max(len(t) for t in tokens) < 60
@@ -33,7 +33,8 @@ export default function ChatBox({ onSend }) {
     
       try {
         const token = localStorage.getItem("token");
-        const response = await fetch(`${import.meta.env.VITE_API_BASE}/rag/query`, {
+        // Coalesced frames: several tokens per frame + one final {answer, chunks} frame
+        const response = await fetch(`${import.meta.env.VITE_API_BASE}/rag/query?stream_format=coalesced`, {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
@@ -46,13 +47,15 @@ export default function ChatBox({ onSend }) {
     
         const reader = response.body.getReader();
         const decoder = new TextDecoder();
+        let pending = "";  // a frame can span two reads — keep the unfinished line
     
         while (true) {
           const { done, value } = await reader.read();
           if (done) break;
     
-          const text = decoder.decode(value);
-          const lines = text.split("\n");
+          pending += decoder.decode(value, { stream: true });
+          const lines = pending.split("\n");
+          pending = lines.pop();
     
           for (const line of lines) {
             if (line.startsWith("data: ")) {
@@ -23,7 +23,11 @@ export PYTHONPATH="/app/backend:$PYTHONPATH"
 
 # Indexes (persistent)
 mkdir -p backend/app/data
-if [ ! -f backend/app/data/index.faiss ] || [ ! -f backend/app/data/bm25_index.pkl ]; then
+# Embedding cache lives outside backend/ (re-cloned on every boot) → rebuilds only
+# encode new/changed FAQs. Point it at persistent storage (e.g. /data) if you have it.
+export EMBED_CACHE_DIR="${EMBED_CACHE_DIR:-/app/embed_cache}"
+# Server only loads published generations (no pickles) → build one if missing
+if [ ! -f backend/app/data/CURRENT ]; then
     echo "Building FAISS + BM25 indexes..."
     python backend/app/rag/build_index.py
     echo "Indexes ready!"
@@ -38,6 +42,13 @@ echo "Port  → ${PORT:-7860}"
 echo "=================================="
 
 cd /app
+WORKERS=${WEB_CONCURRENCY:-1}
+if [ "$WORKERS" -gt 1 ]; then
+    # Preloaded master loads indexes + model once, forked workers share them
+    echo "Workers → $WORKERS (gunicorn, preloaded)"
+    exec gunicorn -c backend/gunicorn.conf.py backend.app.main:app
+fi
+
 exec uvicorn backend.app.main:app \
   --host 0.0.0.0 \
   --port ${PORT:-7860} \